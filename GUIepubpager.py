@@ -24,7 +24,7 @@ from PIL import Image
 
 # these are my modules
 # from packages.pst import PrettySimpleTable
-from epubpager import epub_paginator
+from epubpager import epub_paginator, epub_package
 
 Version = "0.3"
 
@@ -163,6 +163,20 @@ config = {
     "epubcheck": "/Users/tbrown/bin/epubcheck.sh",
     "chk_orig": True,
     "chk_paged": True,
+    "workers": 0,
+    "shard_size": 1000000,
+    "engine": "text",
+    "chunk_size": 65536,
+    "in_memory": False,
+    "compress_level": "default",
+    "workdir": "",
+    "queue_depth": 2,
+    "cache_dir": "",
+    "cache_size": 1000,
+    "cache_age": 30,
+    "chk_service": "",
+    "chk_cache": False,
+    "chk_native": False,
     "quiet": True,
     "DEBUG": False,
 }
@@ -651,54 +665,12 @@ def show_dict(idict):# {{{
 def read_opf(epub_file):# {{{
     "Read the opf file data from the epub zipfile and return the opf_path and opf_data."
 
-    opf_data = "No opf data"
-    opf_path = "No opf path"
-    # find the opf file
-
-    with zipfile.ZipFile(epub_file) as zfile:
-        with zfile.open(f"META-INF/container.xml") as c:
-            c_data = c.read()
-
-            cs = str(c_data)
-            rloc = cs.find("<rootfiles>")
-            if rloc == -1:
-                print("Error: did not find <rootfiles> in container")
-                return (opf_path, opf_data)
-            cs = cs[rloc + 3 :]
-            rloc = cs.find("<rootfile")
-            if rloc == -1:
-                print("Error: did not find <rootfile in container")
-                return (opf_path, opf_data)
-            cs = cs[rloc + 3 :]
-            rloc = cs.find("full-path=")
-            if rloc == -1:
-                print("Error: did not find full-path in container")
-                return (opf_path, opf_data)
-            cs = cs[rloc + 3 :]
-            opflist = cs.split('"')
-            opf_path = f"{opflist[1]}"  # d/d/d/fname
-            # print(f"opf_path: {opf_path}")
-            if opf_path == "":
-                print(
-                    "Error: apparently opf file was not found. Return value was blank."
-                )
-                return (opf_path, opf_data)
-            # print(opf_path)
-            opf = opf_path.split("/")
-            # print(f"opf.split: {opf}; opf len: {len(opf)}")
-            opf_file = opf[len(opf) - 1]
-            opf = opf[: len(opf) - 1]
-            opf_path = ""
-            for d in opf:
-                opf_path += f"{d}/"
-            # print(f"{opf_path} - {opf_file}; cat: {opf_path}/{opf_file}")
-            # with zfile.open(f"{opf_path}{opf_file}") as o:
-            with io.TextIOWrapper(
-                zfile.open(f"{opf_path}{opf_file}"), encoding="utf-8"
-            ) as o:
-                opf_data = o.read()
-                # opf_data = str(opf_b)
-            return (opf_path, opf_data)# }}}
+    package = epub_package.from_zip(epub_file)
+    if package.error:
+        print(f"Error: {package.error}")
+    if not package.opf_data:
+        return ("No opf path", "No opf data")
+    return (package.opf_dir, package.opf_data)# }}}
 
 
 def get_cover(epubfile, coverpath, bname, opf_path, opf_data):# {{{
@@ -1107,6 +1079,20 @@ def paginate_book(book_location): # {{{
         paginator.epubcheck = config["epubcheck"]
         paginator.chk_orig = config["chk_orig"]
         paginator.chk_paged = config["chk_paged"]
+        paginator.workers = config.get("workers", 0)
+        paginator.shard_size = config.get("shard_size", 1000000)
+        paginator.engine = config.get("engine", "text")
+        paginator.chunk_size = config.get("chunk_size", 65536)
+        paginator.in_memory = config.get("in_memory", False)
+        paginator.compress_level = config.get("compress_level", "default")
+        paginator.workdir = config.get("workdir", "")
+        paginator.queue_depth = config.get("queue_depth", 2)
+        paginator.cache_dir = config.get("cache_dir", "")
+        paginator.cache_size = config.get("cache_size", 1000)
+        paginator.cache_age = config.get("cache_age", 30)
+        paginator.chk_service = config.get("chk_service", "")
+        paginator.chk_cache = config.get("chk_cache", False)
+        paginator.chk_native = config.get("chk_native", False)
         paginator.quiet = config["quiet"]
         paginator.DEBUG = config["DEBUG"]
         return_dict = paginator.paginate_epub(book_location)
@@ -1423,939 +1409,940 @@ def toggle_configure(window):# {{{
 # ---------Layout-------------------------
 # Build the PySimpleGui window with buttons and multiline output
 
-sg.theme("Dark Blue 3")
-config = read_config()
-
-# Tuesday, August 3, 2021 9:25:56 AM try a new layout:
-# +======================================================+
-# | Cover Image | Current List | Book Data               |
-# |------------------------------------------------------|
-# | Command Bar of Buttons                              |
-# |------------------------------------------------------|
-# | Output      | Debug/Help                             |  /swaps with configuration row
-# |------------------------------------------------------|
-# | Configuration                                        | /configuration replaces previous row
-# +======================================================+
-ColCurrentList = sg.Column( # {{{
-    [
+if __name__ == "__main__":
+    sg.theme("Dark Blue 3")
+    config = read_config()
+
+    # Tuesday, August 3, 2021 9:25:56 AM try a new layout:
+    # +======================================================+
+    # | Cover Image | Current List | Book Data               |
+    # |------------------------------------------------------|
+    # | Command Bar of Buttons                              |
+    # |------------------------------------------------------|
+    # | Output      | Debug/Help                             |  /swaps with configuration row
+    # |------------------------------------------------------|
+    # | Configuration                                        | /configuration replaces previous row
+    # +======================================================+
+    ColCurrentList = sg.Column( # {{{
         [
-            sg.Frame(
-                "Book List",
-                [
+            [
+                sg.Frame(
+                    "Book List",
                     [
-                        sg.Listbox(
-                            booklist,
-                            key="-BookList-",
-                            # select_mode=sg.LISTBOX_SELECT_MODE_MULTIPLE,
-                            select_mode=sg.LISTBOX_SELECT_MODE_SINGLE,
-                            enable_events=True,
-                            size=(booklist_width, termrows),
-                            font="Menlo 12",
-                        )
-                    ]
-                ],
-            ),
-        ]
-    ],
-    pad=(0, 0),
-) # }}}
+                        [
+                            sg.Listbox(
+                                booklist,
+                                key="-BookList-",
+                                # select_mode=sg.LISTBOX_SELECT_MODE_MULTIPLE,
+                                select_mode=sg.LISTBOX_SELECT_MODE_SINGLE,
+                                enable_events=True,
+                                size=(booklist_width, termrows),
+                                font="Menlo 12",
+                            )
+                        ]
+                    ],
+                ),
+            ]
+        ],
+        pad=(0, 0),
+    ) # }}}
 
-ColBookData = sg.Column(# {{{
-    [
+    ColBookData = sg.Column(# {{{
         [
-            sg.Frame(
-                "Book Data:",
-                [
+            [
+                sg.Frame(
+                    "Book Data:",
                     [
-                        sg.Text(
-                            "title",
-                            key="-BookDataTitle-",
-                            size=(60, 1),
-                            font="Menlo 14 bold italic",
-                        )
-                    ],
-                    [
-                        sg.Text(
-                            "author",
-                            key="-BookDataAuthor-",
-                            size=(60, 1),
-                            font="Menlo 14 bold",
-                        )
-                    ],
-                    [
-                        sg.Text("Epub Version".rjust(13), font="Menlo 12"),
-                        sg.Input(
-                            default_text="", key="-epub_version-", font="Menlo 12", size=(7, 1)
-                        ),
-                    ],
-                    [
-                        sg.Text("pubdate".rjust(13), font="Menlo 12"),
-                        sg.Input(
-                            default_text="",
-                            key="-pubdate-",
-                            size=(bookdata_textwidth, 1),
-                        ),
-                    ],
-                    [
-                        sg.Text("Identifiers".rjust(13), font="Menlo 12"),
-                        sg.LBox(
-                            [], key="-identifiers-", size=(bookdata_textwidth, 1)
-                        ),
-                    ],
-                    [sg.HorizontalSeparator()],
-                    [
-                        sg.Text(
-                            "epubpager Metadata",
-                            size=(60, 1),
-                            font="Menlo 14 bold",
-                            key = "-epMetaData-",
-                        )
-                    ],
-                    [
-                        sg.Text("Pages".rjust(13), font="Menlo 12", key = "-epPages-",),
-                        sg.Input(
-                            default_text="", key="-Pages-", font="Menlo 12", size=(7, 1)
-                        ),
+                        [
+                            sg.Text(
+                                "title",
+                                key="-BookDataTitle-",
+                                size=(60, 1),
+                                font="Menlo 14 bold italic",
+                            )
+                        ],
+                        [
+                            sg.Text(
+                                "author",
+                                key="-BookDataAuthor-",
+                                size=(60, 1),
+                                font="Menlo 14 bold",
+                            )
+                        ],
+                        [
+                            sg.Text("Epub Version".rjust(13), font="Menlo 12"),
+                            sg.Input(
+                                default_text="", key="-epub_version-", font="Menlo 12", size=(7, 1)
+                            ),
+                        ],
+                        [
+                            sg.Text("pubdate".rjust(13), font="Menlo 12"),
+                            sg.Input(
+                                default_text="",
+                                key="-pubdate-",
+                                size=(bookdata_textwidth, 1),
+                            ),
+                        ],
+                        [
+                            sg.Text("Identifiers".rjust(13), font="Menlo 12"),
+                            sg.LBox(
+                                [], key="-identifiers-", size=(bookdata_textwidth, 1)
+                            ),
+                        ],
+                        [sg.HorizontalSeparator()],
+                        [
+                            sg.Text(
+                                "epubpager Metadata",
+                                size=(60, 1),
+                                font="Menlo 14 bold",
+                                key = "-epMetaData-",
+                            )
+                        ],
+                        [
+                            sg.Text("Pages".rjust(13), font="Menlo 12", key = "-epPages-",),
+                            sg.Input(
+                                default_text="", key="-Pages-", font="Menlo 12", size=(7, 1)
+                            ),
+                        ],
+                        [
+                            sg.Text("Words".rjust(13), font="Menlo 12", key = "-epWords-"),
+                            sg.Input(
+                                default_text="", key="-Words-", font="Menlo 12", size=(7, 1)
+                            ),
+                        ],
                     ],
+                )
+            ]
+        ],
+        pad=(0, 0),
+        key="-col_bookdata-",
+        visible=True,
+    ) # }}}
+
+    ColImage = sg.Column(# {{{
+        [  
+            [
+                sg.Frame(
+                    "Cover",
                     [
-                        sg.Text("Words".rjust(13), font="Menlo 12", key = "-epWords-"),
-                        sg.Input(
-                            default_text="", key="-Words-", font="Menlo 12", size=(7, 1)
-                        ),
+                        [sg.Image(filename=cb_cover, key="-Cover-")],
                     ],
-                ],
-            )
-        ]
-    ],
-    pad=(0, 0),
-    key="-col_bookdata-",
-    visible=True,
-) # }}}
-
-ColImage = sg.Column(# {{{
-    [  
-        [
-            sg.Frame(
-                "Cover",
-                [
-                    [sg.Image(filename=cb_cover, key="-Cover-")],
-                ],
-            ),
-        ]
-    ],
-    pad=(0, 0),
-)  # }}}
-
-ColFolder = sg.Column(# {{{
-    [
-        [
-            # sg.Text(config['srcdir'].rjust(60), enable_events = True, font='Menlo 12', size=(60,1), key='-srcdir-'),
-            # sg.FolderBrowse(button_text='Open Folder',  font='Menlo 12 bold', enable_events = True, initial_folder = "./", target = '-srcdir-',),
-            sg.Input(
-                default_text=config["srcdir"],
-                enable_events=True,
-                visible = False, 
-                font="Menlo 12",
-                size=(10, 1),
-                key="-srcdir-",
-            ),
-            sg.FolderBrowse(
-                button_text="Open Folder",
-                font="Menlo 12 bold",
-                enable_events=True,
-                initial_folder=config["srcdir"],
-                key="-fbsrcdir-",
-                target="-srcdir-",
-            ),
-            sg.Input(
-                default_text=config["srcdir"],
-                enable_events=True,
-                visible = False, 
-                font="Menlo 12",
-                size=(10, 1),
-                key="-files-",
-            ),
-            sg.FilesBrowse(
-                button_text="Open Files",
-                font="Menlo 12 bold",
-                enable_events=True,
-                initial_folder="./",
-                key="-fbfiles-",
-                target="-files-",
-            ),
+                ),
+            ]
         ],
-    ]
-)# }}}
+        pad=(0, 0),
+    )  # }}}
 
-ColButtons = sg.Column(# {{{
-    [
+    ColFolder = sg.Column(# {{{
         [
-            sg.Frame(
-                "Commands",
-                [
-                    [
-                        sg.Button(
-                            key="-Find-",
-                            button_text="Find",
-                        ),
-                        sg.Button(
-                            key="-Paginate-",
-                            button_text="Paginate",
-                        ),
-                        sg.Button(
-                            key="-PaginateAll-",
-                            button_text="Paginate All",
-                        ),
-                        sg.Button(
-                            key="-Configure-",
-                            button_text="Configure",
-                        ),
-                        sg.Button(
-                            key="-About-",
-                            button_text="About",
-                        ),
-                        sg.Button(
-                            key="-Help-",
-                            button_text="Help",
-                        ),
-                        sg.Button(
-                            key="-Exit-",
-                            button_text="Exit",
-                        ),
-                        # the configuration buttons
-                        sg.Input(
-                            visible=False, enable_events=True, key="-config_file-"
-                        ),
-                        sg.FileBrowse(
-                            button_text="Load Config File",
-                            visible=False,
-                            k="-LoadConfig-",
-                        ),
-                        sg.Input(
-                            visible=False, enable_events=True, key="-save_config-"
-                        ),
-                        sg.FileSaveAs(
-                            button_text="Save Config File",
-                            visible=False,
-                            k="-SaveConfig-",
-                        ),
-                        sg.Button(
-                            key="-UpdateConfig-",
-                            button_text="Update Config",
-                            visible=False,
-                        ),
-                        sg.Button(
-                            key="-CancelConfig-",
-                            button_text="Cancel",
-                            visible=False,
-                        ),
-                    ]
-                ],
-            )
+            [
+                # sg.Text(config['srcdir'].rjust(60), enable_events = True, font='Menlo 12', size=(60,1), key='-srcdir-'),
+                # sg.FolderBrowse(button_text='Open Folder',  font='Menlo 12 bold', enable_events = True, initial_folder = "./", target = '-srcdir-',),
+                sg.Input(
+                    default_text=config["srcdir"],
+                    enable_events=True,
+                    visible = False, 
+                    font="Menlo 12",
+                    size=(10, 1),
+                    key="-srcdir-",
+                ),
+                sg.FolderBrowse(
+                    button_text="Open Folder",
+                    font="Menlo 12 bold",
+                    enable_events=True,
+                    initial_folder=config["srcdir"],
+                    key="-fbsrcdir-",
+                    target="-srcdir-",
+                ),
+                sg.Input(
+                    default_text=config["srcdir"],
+                    enable_events=True,
+                    visible = False, 
+                    font="Menlo 12",
+                    size=(10, 1),
+                    key="-files-",
+                ),
+                sg.FilesBrowse(
+                    button_text="Open Files",
+                    font="Menlo 12 bold",
+                    enable_events=True,
+                    initial_folder="./",
+                    key="-fbfiles-",
+                    target="-files-",
+                ),
+            ],
         ]
-    ],
-    pad=(0, 0),
-)# }}}
+    )# }}}
 
-ColOutput = sg.Column(# {{{
-    [
+    ColButtons = sg.Column(# {{{
         [
-            sg.Frame(
-                "Output",
-                [
+            [
+                sg.Frame(
+                    "Commands",
                     [
-                        sg.Multiline(
-                            key="-MLINE-" + sg.WRITE_ONLY_KEY,
-                            enable_events=True,
-                            autoscroll=True,
-                            size=(output_width, output_height),
-                            font="Menlo 12",
-                        ),
-                        sg.Multiline(
-                            key="-DEBUG-" + sg.WRITE_ONLY_KEY,
-                            autoscroll=True,
-                            size=(debug_width, output_height),
-                            font="Menlo 12",
-                            visible=True,
-                        ),
-                    ]
-                ],
-            ),
-        ]
-    ],
-    key="-col_output-",
-    pad=(0, 0),
-)# }}}
+                        [
+                            sg.Button(
+                                key="-Find-",
+                                button_text="Find",
+                            ),
+                            sg.Button(
+                                key="-Paginate-",
+                                button_text="Paginate",
+                            ),
+                            sg.Button(
+                                key="-PaginateAll-",
+                                button_text="Paginate All",
+                            ),
+                            sg.Button(
+                                key="-Configure-",
+                                button_text="Configure",
+                            ),
+                            sg.Button(
+                                key="-About-",
+                                button_text="About",
+                            ),
+                            sg.Button(
+                                key="-Help-",
+                                button_text="Help",
+                            ),
+                            sg.Button(
+                                key="-Exit-",
+                                button_text="Exit",
+                            ),
+                            # the configuration buttons
+                            sg.Input(
+                                visible=False, enable_events=True, key="-config_file-"
+                            ),
+                            sg.FileBrowse(
+                                button_text="Load Config File",
+                                visible=False,
+                                k="-LoadConfig-",
+                            ),
+                            sg.Input(
+                                visible=False, enable_events=True, key="-save_config-"
+                            ),
+                            sg.FileSaveAs(
+                                button_text="Save Config File",
+                                visible=False,
+                                k="-SaveConfig-",
+                            ),
+                            sg.Button(
+                                key="-UpdateConfig-",
+                                button_text="Update Config",
+                                visible=False,
+                            ),
+                            sg.Button(
+                                key="-CancelConfig-",
+                                button_text="Cancel",
+                                visible=False,
+                            ),
+                        ]
+                    ],
+                )
+            ]
+        ],
+        pad=(0, 0),
+    )# }}}
 
-ColConfig = sg.Column(# {{{
-    [
+    ColOutput = sg.Column(# {{{
         [
-            sg.Frame(
-                "Configuration",
-                [
-                    [
-                        sg.FolderBrowse(
-                            button_text="Source Folder",
-                            font="Menlo 12 bold",
-                            initial_folder="./",
-                            target="-cfgsrcdir-",
-                        ),
-                        sg.Text(
-                            config["srcdir"],
-                            font="Menlo 12",
-                            size=(60, 1),
-                            enable_events=True,
-                            key="-cfgsrcdir-",
-                        ),
-                    ],
-                    [
-                        sg.FolderBrowse(
-                            button_text="Output Folder",
-                            font="Menlo 12 bold",
-                            initial_folder="./",
-                            target="-outdir-",
-                        ),
-                        sg.Input(
-                            default_text=config["outdir"],
-                            font="Menlo 12",
-                            size=(60, 1),
-                            key="-outdir-",
-                        ),
-                    ],
-                    [
-                        sg.Checkbox(
-                            "Generate Pagelist",
-                            font="Menlo 12 bold",
-                            default=config["genplist"],
-                            key="-genplist-",
-                        ),
-                        sg.Checkbox(
-                            "Match Existing Pagination",
-                            font="Menlo 12 bold",
-                            default=config["match"],
-                            key="-match-",
-                        ),
-                    ],
-                    [
-                        sg.Text("Words per Page", font="Menlo 12 bold"),
-                        sg.Input(
-                            default_text=config["pgwords"], key="-pgwords-", size=(5, 1)
-                        ),
-                        sg.Text("Total Pages", font="Menlo 12 bold"),
-                        sg.Input(
-                            default_text=config["pages"], key="-pages-", size=(5, 1)
-                        ),
-                    ],
-                    [
-                        sg.Checkbox(
-                            "Generate Pagelines",
-                            font="Menlo 12 bold",
-                            default=config["pageline"],
-                            key="-pageline-",
-                        ),
-                        sg.Text("Pageline Font Size", font="Menlo 12 bold"),
-                        sg.Input(
-                            default_text=config["pl_fntsz"],
-                            key="-pl_fntsz-",
-                            size=(5, 1),
-                        ),
-                    ],
-                    [
-                        sg.Text("Pageline Alignment:", font="Menlo 12 bold"),
-                        sg.Radio(
-                            "Left",
-                            group_id="pl_align",
-                            default=config["pl_align"] == "left",
-                            key="-align_left-",
-                            font="Menlo 12",
-                        ),
-                        sg.Radio(
-                            "Center",
-                            group_id="pl_align",
-                            default=config["pl_align"] == "center",
-                            key="-align_center-",
-                            font="Menlo 12",
-                        ),
-                        sg.Radio(
-                            "Right",
-                            group_id="pl_align",
-                            default=config["pl_align"] == "right",
-                            key="-align_right-",
-                            font="Menlo 12",
-                        ),
-                    ],
-                    [
-                        sg.Text("Pageline Color:", font="Menlo 12 bold"),
-                        sg.Radio(
-                            "Red",
-                            group_id="pl_color",
-                            default=config["pl_color"] == "red",
-                            key="-pl_color_red-",
-                            font="Menlo 12",
-                        ),
-                        sg.Radio(
-                            "Green",
-                            group_id="pl_color",
-                            default=config["pl_color"] == "green",
-                            key="-pl_color_green-",
-                            font="Menlo 12",
-                        ),
-                        sg.Radio(
-                            "None",
-                            group_id="pl_color",
-                            default=config["pl_color"] == "none",
-                            key="-pl_color_none-",
-                            font="Menlo 12",
-                        ),
-                    ],
-                    [
-                        sg.Checkbox(
-                            "Include Pageline Page Total",
-                            font="Menlo 12 bold",
-                            default=config["pl_pgtot"],
-                            key="-pl_pgtot-",
-                        ),
-                    ],
+            [
+                sg.Frame(
+                    "Output",
                     [
-                        sg.Text("Pageline Bracket", font="Menlo 12 bold"),
-                        sg.Radio(
-                            "Angle - <>",
-                            group_id="pl_bkt",
-                            default=config["pl_bkt"] == "<",
-                            key="-pl_bkt_angle-",
-                            font="Menlo 12",
-                        ),
-                        sg.Radio(
-                            "Parenthesis - ()",
-                            group_id="pl_bkt",
-                            default=config["pl_bkt"] == "(",
-                            key="-pl_bkt_paren-",
-                            font="Menlo 12",
-                        ),
-                        sg.Radio(
-                            "None",
-                            group_id="pl_bkt",
-                            default=config["pl_bkt"] == "",
-                            key="-pl_bkt_none-",
-                            font="Menlo 12",
-                        ),
-                    ],
-                    [
-                        sg.Checkbox(
-                            "Generate Superscripts",
-                            font="Menlo 12 bold",
-                            default=config["superscript"],
-                            key="-superscript-",
-                        ),
-                        sg.Text("Superscript Font Size", font="Menlo 12 bold"),
-                        sg.Input(
-                            default_text=config["super_fntsz"],
-                            key="-super_fntsz-",
-                            size=(5, 1),
-                        ),
-                    ],
-                    [
-                        sg.Text("Superscript Color", font="Menlo 12 bold"),
-                        sg.Radio(
-                            "Red",
-                            group_id="super_color",
-                            default=config["pl_color"] == "red",
-                            key="-super_color_red-",
-                            font="Menlo 12",
-                        ),
-                        sg.Radio(
-                            "Green",
-                            group_id="super_color",
-                            default=config["pl_color"] == "green",
-                            key="-super_color_green-",
-                            font="Menlo 12",
-                        ),
-                        sg.Radio(
-                            "None",
-                            group_id="super_color",
-                            default=config["pl_color"] == "none",
-                            key="-super_color_none-",
-                            font="Menlo 12",
-                        ),
-                    ],
-                    [
-                        sg.Checkbox(
-                            "Include Superscript Page Total",
-                            font="Menlo 12 bold",
-                            default=config["super_total"],
-                            key="-super_total-",
-                        ),
-                        sg.Checkbox(
-                            "Include Chapter Page Total",
-                            font="Menlo 12 bold",
-                            default=config["chap_pgtot"],
-                            key="-chap_pgtot-",
-                        ),
-                    ],
-                    [
-                        sg.Text("Chapter Bracket", font="Menlo 12 bold"),
-                        sg.Radio(
-                            "Angle - <>",
-                            group_id="chap_bkt",
-                            default=config["chap_bkt"] == "<",
-                            key="-chap_bkt_angle-",
-                            font="Menlo 12",
-                        ),
-                        sg.Radio(
-                            "Parenthesis - ()",
-                            group_id="chap_bkt",
-                            default=config["chap_bkt"] == "(",
-                            key="-chap_bkt_paren-",
-                            font="Menlo 12",
-                        ),
-                        sg.Radio(
-                            "None",
-                            group_id="chap_bkt",
-                            default=config["chap_bkt"] == "",
-                            key="-chap_bkt_none-",
-                            font="Menlo 12",
-                        ),
-                    ],
-                    [
-                        sg.FileBrowse(
-                            button_text="Ebook Conversion",
-                            font="Menlo 12 bold",
-                            initial_folder="./",
-                            target="-ebookconvert-",
-                        ),
-                        sg.Input(
-                            default_text=config["ebookconvert"],
-                            font="Menlo 12",
-                            size=(60, 1),
-                            key="-ebookconvert-",
-                        ),
-                    ],
-                    [
-                        sg.FileBrowse(
-                            button_text="Epubcheck",
-                            font="Menlo 12 bold",
-                            initial_folder="./",
-                            target="-epubcheck-",
-                        ),
-                        sg.Input(
-                            default_text=config["epubcheck"],
-                            font="Menlo 12",
-                            size=(60, 1),
-                            key="-epubcheck-",
-                        ),
+                        [
+                            sg.Multiline(
+                                key="-MLINE-" + sg.WRITE_ONLY_KEY,
+                                enable_events=True,
+                                autoscroll=True,
+                                size=(output_width, output_height),
+                                font="Menlo 12",
+                            ),
+                            sg.Multiline(
+                                key="-DEBUG-" + sg.WRITE_ONLY_KEY,
+                                autoscroll=True,
+                                size=(debug_width, output_height),
+                                font="Menlo 12",
+                                visible=True,
+                            ),
+                        ]
                     ],
+                ),
+            ]
+        ],
+        key="-col_output-",
+        pad=(0, 0),
+    )# }}}
+
+    ColConfig = sg.Column(# {{{
+        [
+            [
+                sg.Frame(
+                    "Configuration",
                     [
-                        sg.Checkbox(
-                            "Epubcheck Original",
-                            font="Menlo 12 bold",
-                            default=config["chk_orig"],
-                            key="-chk_orig-",
-                        ),
-                        sg.Checkbox(
-                            "Epubcheck Paged",
-                            font="Menlo 12 bold",
-                            default=config["chk_paged"],
-                            key="-chk_paged-",
-                        ),
-                        sg.Checkbox(
-                            "Quiet",
-                            font="Menlo 12 bold",
-                            default=config["quiet"],
-                            key="-quiet-",
-                        ),
-                        sg.Checkbox(
-                            "DEBUG",
-                            font="Menlo 12 bold",
-                            default=config["DEBUG"],
-                            key="-DEBUG-",
-                        ),
+                        [
+                            sg.FolderBrowse(
+                                button_text="Source Folder",
+                                font="Menlo 12 bold",
+                                initial_folder="./",
+                                target="-cfgsrcdir-",
+                            ),
+                            sg.Text(
+                                config["srcdir"],
+                                font="Menlo 12",
+                                size=(60, 1),
+                                enable_events=True,
+                                key="-cfgsrcdir-",
+                            ),
+                        ],
+                        [
+                            sg.FolderBrowse(
+                                button_text="Output Folder",
+                                font="Menlo 12 bold",
+                                initial_folder="./",
+                                target="-outdir-",
+                            ),
+                            sg.Input(
+                                default_text=config["outdir"],
+                                font="Menlo 12",
+                                size=(60, 1),
+                                key="-outdir-",
+                            ),
+                        ],
+                        [
+                            sg.Checkbox(
+                                "Generate Pagelist",
+                                font="Menlo 12 bold",
+                                default=config["genplist"],
+                                key="-genplist-",
+                            ),
+                            sg.Checkbox(
+                                "Match Existing Pagination",
+                                font="Menlo 12 bold",
+                                default=config["match"],
+                                key="-match-",
+                            ),
+                        ],
+                        [
+                            sg.Text("Words per Page", font="Menlo 12 bold"),
+                            sg.Input(
+                                default_text=config["pgwords"], key="-pgwords-", size=(5, 1)
+                            ),
+                            sg.Text("Total Pages", font="Menlo 12 bold"),
+                            sg.Input(
+                                default_text=config["pages"], key="-pages-", size=(5, 1)
+                            ),
+                        ],
+                        [
+                            sg.Checkbox(
+                                "Generate Pagelines",
+                                font="Menlo 12 bold",
+                                default=config["pageline"],
+                                key="-pageline-",
+                            ),
+                            sg.Text("Pageline Font Size", font="Menlo 12 bold"),
+                            sg.Input(
+                                default_text=config["pl_fntsz"],
+                                key="-pl_fntsz-",
+                                size=(5, 1),
+                            ),
+                        ],
+                        [
+                            sg.Text("Pageline Alignment:", font="Menlo 12 bold"),
+                            sg.Radio(
+                                "Left",
+                                group_id="pl_align",
+                                default=config["pl_align"] == "left",
+                                key="-align_left-",
+                                font="Menlo 12",
+                            ),
+                            sg.Radio(
+                                "Center",
+                                group_id="pl_align",
+                                default=config["pl_align"] == "center",
+                                key="-align_center-",
+                                font="Menlo 12",
+                            ),
+                            sg.Radio(
+                                "Right",
+                                group_id="pl_align",
+                                default=config["pl_align"] == "right",
+                                key="-align_right-",
+                                font="Menlo 12",
+                            ),
+                        ],
+                        [
+                            sg.Text("Pageline Color:", font="Menlo 12 bold"),
+                            sg.Radio(
+                                "Red",
+                                group_id="pl_color",
+                                default=config["pl_color"] == "red",
+                                key="-pl_color_red-",
+                                font="Menlo 12",
+                            ),
+                            sg.Radio(
+                                "Green",
+                                group_id="pl_color",
+                                default=config["pl_color"] == "green",
+                                key="-pl_color_green-",
+                                font="Menlo 12",
+                            ),
+                            sg.Radio(
+                                "None",
+                                group_id="pl_color",
+                                default=config["pl_color"] == "none",
+                                key="-pl_color_none-",
+                                font="Menlo 12",
+                            ),
+                        ],
+                        [
+                            sg.Checkbox(
+                                "Include Pageline Page Total",
+                                font="Menlo 12 bold",
+                                default=config["pl_pgtot"],
+                                key="-pl_pgtot-",
+                            ),
+                        ],
+                        [
+                            sg.Text("Pageline Bracket", font="Menlo 12 bold"),
+                            sg.Radio(
+                                "Angle - <>",
+                                group_id="pl_bkt",
+                                default=config["pl_bkt"] == "<",
+                                key="-pl_bkt_angle-",
+                                font="Menlo 12",
+                            ),
+                            sg.Radio(
+                                "Parenthesis - ()",
+                                group_id="pl_bkt",
+                                default=config["pl_bkt"] == "(",
+                                key="-pl_bkt_paren-",
+                                font="Menlo 12",
+                            ),
+                            sg.Radio(
+                                "None",
+                                group_id="pl_bkt",
+                                default=config["pl_bkt"] == "",
+                                key="-pl_bkt_none-",
+                                font="Menlo 12",
+                            ),
+                        ],
+                        [
+                            sg.Checkbox(
+                                "Generate Superscripts",
+                                font="Menlo 12 bold",
+                                default=config["superscript"],
+                                key="-superscript-",
+                            ),
+                            sg.Text("Superscript Font Size", font="Menlo 12 bold"),
+                            sg.Input(
+                                default_text=config["super_fntsz"],
+                                key="-super_fntsz-",
+                                size=(5, 1),
+                            ),
+                        ],
+                        [
+                            sg.Text("Superscript Color", font="Menlo 12 bold"),
+                            sg.Radio(
+                                "Red",
+                                group_id="super_color",
+                                default=config["pl_color"] == "red",
+                                key="-super_color_red-",
+                                font="Menlo 12",
+                            ),
+                            sg.Radio(
+                                "Green",
+                                group_id="super_color",
+                                default=config["pl_color"] == "green",
+                                key="-super_color_green-",
+                                font="Menlo 12",
+                            ),
+                            sg.Radio(
+                                "None",
+                                group_id="super_color",
+                                default=config["pl_color"] == "none",
+                                key="-super_color_none-",
+                                font="Menlo 12",
+                            ),
+                        ],
+                        [
+                            sg.Checkbox(
+                                "Include Superscript Page Total",
+                                font="Menlo 12 bold",
+                                default=config["super_total"],
+                                key="-super_total-",
+                            ),
+                            sg.Checkbox(
+                                "Include Chapter Page Total",
+                                font="Menlo 12 bold",
+                                default=config["chap_pgtot"],
+                                key="-chap_pgtot-",
+                            ),
+                        ],
+                        [
+                            sg.Text("Chapter Bracket", font="Menlo 12 bold"),
+                            sg.Radio(
+                                "Angle - <>",
+                                group_id="chap_bkt",
+                                default=config["chap_bkt"] == "<",
+                                key="-chap_bkt_angle-",
+                                font="Menlo 12",
+                            ),
+                            sg.Radio(
+                                "Parenthesis - ()",
+                                group_id="chap_bkt",
+                                default=config["chap_bkt"] == "(",
+                                key="-chap_bkt_paren-",
+                                font="Menlo 12",
+                            ),
+                            sg.Radio(
+                                "None",
+                                group_id="chap_bkt",
+                                default=config["chap_bkt"] == "",
+                                key="-chap_bkt_none-",
+                                font="Menlo 12",
+                            ),
+                        ],
+                        [
+                            sg.FileBrowse(
+                                button_text="Ebook Conversion",
+                                font="Menlo 12 bold",
+                                initial_folder="./",
+                                target="-ebookconvert-",
+                            ),
+                            sg.Input(
+                                default_text=config["ebookconvert"],
+                                font="Menlo 12",
+                                size=(60, 1),
+                                key="-ebookconvert-",
+                            ),
+                        ],
+                        [
+                            sg.FileBrowse(
+                                button_text="Epubcheck",
+                                font="Menlo 12 bold",
+                                initial_folder="./",
+                                target="-epubcheck-",
+                            ),
+                            sg.Input(
+                                default_text=config["epubcheck"],
+                                font="Menlo 12",
+                                size=(60, 1),
+                                key="-epubcheck-",
+                            ),
+                        ],
+                        [
+                            sg.Checkbox(
+                                "Epubcheck Original",
+                                font="Menlo 12 bold",
+                                default=config["chk_orig"],
+                                key="-chk_orig-",
+                            ),
+                            sg.Checkbox(
+                                "Epubcheck Paged",
+                                font="Menlo 12 bold",
+                                default=config["chk_paged"],
+                                key="-chk_paged-",
+                            ),
+                            sg.Checkbox(
+                                "Quiet",
+                                font="Menlo 12 bold",
+                                default=config["quiet"],
+                                key="-quiet-",
+                            ),
+                            sg.Checkbox(
+                                "DEBUG",
+                                font="Menlo 12 bold",
+                                default=config["DEBUG"],
+                                key="-DEBUG-",
+                            ),
+                        ],
                     ],
-                ],
-            ),
-        ]
-    ],
-    key="-col_config-",
-    pad=(0, 0),
-)# }}}
+                ),
+            ]
+        ],
+        key="-col_config-",
+        pad=(0, 0),
+    )# }}}
 
-ColConfigHelp = sg.Column(# {{{
-    [
+    ColConfigHelp = sg.Column(# {{{
         [
-            sg.Frame(
-                "Help",
-                [
+            [
+                sg.Frame(
+                    "Help",
                     [
-                        sg.Multiline(
-                            key="-config_help-" + sg.WRITE_ONLY_KEY,
-                            enable_events=True,
-                            autoscroll=True,
-                            size=(debug_width, output_height),
-                            font="Menlo 12",
-                        ),
-                    ]
-                ],
-            ),
-        ]
-    ],
-    key="-col_confighelp-",
-    pad=(0, 0),
-)# }}}
-
-# Tuesday, August 3, 2021 9:25:56 AM try a new layout:
-# +=============================+
-# | Cover Image | Current List  |
-# |-----------------------------|
-# | Command Bar of Buttons      |
-# |-----------------------------|
-# | Output      | Debug         |
-# |-----------------------------|
-# | Configuration               |
-# +=============================+
-layout = [
-    [ColImage, ColCurrentList, ColBookData],
-    [ColFolder],
-    [ColButtons],
-    # [ ColOutput(visible=True), ColConfig(visible=False)],
-    [ColOutput, ColConfig, ColConfigHelp],
-]
-# layout = [
-#             [ ColImage, ColCurrentList,ColBookData],
-#             [ ColButtons],
-#             [ ColOutput],
-#             [ ColConfig],
-#          ]
-
-# sg.set_options(tooltip_offset=(0,-20))
-# sg.PySimpleGUI.DEFAULT_TOOLTIP_OFFSET = (0, -20)
-sg.set_options(
-    icon=base64.b64encode(
-        open(
-            r"/Users/tbrown/Documents/projects/CalibrePaginator/icon_CalibrePaginator.png",
-            "rb",
-        ).read()
+                        [
+                            sg.Multiline(
+                                key="-config_help-" + sg.WRITE_ONLY_KEY,
+                                enable_events=True,
+                                autoscroll=True,
+                                size=(debug_width, output_height),
+                                font="Menlo 12",
+                            ),
+                        ]
+                    ],
+                ),
+            ]
+        ],
+        key="-col_confighelp-",
+        pad=(0, 0),
+    )# }}}
+
+    # Tuesday, August 3, 2021 9:25:56 AM try a new layout:
+    # +=============================+
+    # | Cover Image | Current List  |
+    # |-----------------------------|
+    # | Command Bar of Buttons      |
+    # |-----------------------------|
+    # | Output      | Debug         |
+    # |-----------------------------|
+    # | Configuration               |
+    # +=============================+
+    layout = [
+        [ColImage, ColCurrentList, ColBookData],
+        [ColFolder],
+        [ColButtons],
+        # [ ColOutput(visible=True), ColConfig(visible=False)],
+        [ColOutput, ColConfig, ColConfigHelp],
+    ]
+    # layout = [
+    #             [ ColImage, ColCurrentList,ColBookData],
+    #             [ ColButtons],
+    #             [ ColOutput],
+    #             [ ColConfig],
+    #          ]
+
+    # sg.set_options(tooltip_offset=(0,-20))
+    # sg.PySimpleGUI.DEFAULT_TOOLTIP_OFFSET = (0, -20)
+    sg.set_options(
+        icon=base64.b64encode(
+            open(
+                r"/Users/tbrown/Documents/projects/CalibrePaginator/icon_CalibrePaginator.png",
+                "rb",
+            ).read()
+        )
+    )
+    window = sg.Window(
+        "Epub Paginator", layout, finalize=True, font="Menlo 12", size=(MainWindowSize)
+    )
+
+    # ------------------ initialize and build window--------------------
+    window["-srcdir-"].update(value=config["srcdir"])
+    # LogEvent(f"Config file is: {config_file}")
+    show_configure = False
+    show_help = True
+    debug_str = ""
+    toggle_configure(window)
+
+    # signon message
+    LogEvent('')
+    LogEvent(f"Epub Paginator Version {Version}")
+    LogEvent('')
+
+
+    # show_dict(config)
+    # window initialization code
+
+    # update the booklist, by default the current list
+    # GetCurrentList returns an array of books
+    # create a booklist for intial viewing
+    epub_database = []
+    save_database = []
+    bnamelist = []
+    flist = [f for f in os.listdir(config['srcdir']) if f.endswith(".epub")]
+    load_files(config['srcdir'], flist)
+    window["-BookList-"].update(values=bnamelist)
+    window["-BookList-"].SetValue(bnamelist[0])  # }}}
+    current_book = epub_database[0]
+    update_view(current_book)
+
+    # update the main display text field
+    window["-MLINE-" + sg.WRITE_ONLY_KEY].expand(
+        expand_row=True, expand_x=True, expand_y=True
     )
-)
-window = sg.Window(
-    "Epub Paginator", layout, finalize=True, font="Menlo 12", size=(MainWindowSize)
-)
-
-# ------------------ initialize and build window--------------------
-window["-srcdir-"].update(value=config["srcdir"])
-# LogEvent(f"Config file is: {config_file}")
-show_configure = False
-show_help = True
-debug_str = ""
-toggle_configure(window)
-
-# signon message
-LogEvent('')
-LogEvent(f"Epub Paginator Version {Version}")
-LogEvent('')
-
-
-# show_dict(config)
-# window initialization code
-
-# update the booklist, by default the current list
-# GetCurrentList returns an array of books
-# create a booklist for intial viewing
-epub_database = []
-save_database = []
-bnamelist = []
-flist = [f for f in os.listdir(config['srcdir']) if f.endswith(".epub")]
-load_files(config['srcdir'], flist)
-window["-BookList-"].update(values=bnamelist)
-window["-BookList-"].SetValue(bnamelist[0])  # }}}
-current_book = epub_database[0]
-update_view(current_book)
-
-# update the main display text field
-window["-MLINE-" + sg.WRITE_ONLY_KEY].expand(
-    expand_row=True, expand_x=True, expand_y=True
-)
-# update_view(current_book)
-
-# and drop into the event loop
-while True:
-    event, values = window.read(timeout=100)
-    # print(f"event: {event}")
-    if event == "sg.TIMEOUT_KEY":
-        continue
-    if event in (None, "Quit", "-Exit-"):
-        break
+    # update_view(current_book)
+
+    # and drop into the event loop
+    while True:
+        event, values = window.read(timeout=100)
+        # print(f"event: {event}")
+        if event == "sg.TIMEOUT_KEY":
+            continue
+        if event in (None, "Quit", "-Exit-"):
+            break
+        # }}}
+        # --About-------------------------------{{{
+        elif event == "-About-":
+            sg.main_get_debug_data()
+            # sg.tclversion_detailed
+        # }}}
+        # --Help-------------------------------{{{
+        elif event == "-Help-":
+            if show_help:
+                debug_str = window["-DEBUG-" + sg.WRITE_ONLY_KEY].get()
+                window["-DEBUG-" + sg.WRITE_ONLY_KEY].update("")
+                render_markdown(hprint, gui_help)
+                window['-Help-'].update("Log")
+                window['-DEBUG-' + sg.WRITE_ONLY_KEY].set_vscroll_position(0)
+                show_help = False
+            else:
+                window["-DEBUG-" + sg.WRITE_ONLY_KEY].update("")
+                window["-DEBUG-" + sg.WRITE_ONLY_KEY].update(debug_str)
+                window['-Help-'].update("Help")
+                show_help = True
+        # }}}
+        elif event == "-MLINE-":
+            print("MLINE event: ")
+            print(str(values["-MLINE-"]))
+
+        # ---files-------------------------------------{{{
+        elif event == "-files-":
+            LogEvent("Event -files-")
+            LogEvent(f'''Files selected: {values["-fbfiles-"]}''')
+            flist = values['-fbfiles-'].split(';')
+            load_files('', flist)
+            if len(bnamelist):
+                window["-BookList-"].update(values=bnamelist)
+                window["-BookList-"].SetValue(bnamelist[0])  
+                current_book = epub_database[0]
+                update_view(current_book)
+            else:
+                LogWarning("No epubs selected.")
+        # }}}
+
+        # ---srcdir-------------------------------------{{{
+        elif event == "-srcdir-":
+            LogEvent("Event -srcdir-")
+            directory = values["-srcdir-"]
+            LogEvent(f"directory: {directory}")
+            flist = [f for f in os.listdir(directory) if f.endswith(".epub")]
+            load_files(directory, flist)
+            if len(bnamelist):
+                window["-BookList-"].update(values=bnamelist)
+                window["-BookList-"].SetValue(bnamelist[0])  
+                current_book = epub_database[0]
+                update_view(current_book)
+                # change the folder browser to start at this directory next time
+                window["-fbsrcdir-"].InitialFolder = directory
+                window["-fbsrcdir-"].update()
+            else:
+                LogWarning("No epubs found in {directory}")
+
+        # }}}
+        # --BookList-------------------------------------{{{
+        elif event == "-BookList-":
+            # the booklist of the form: "1. book by author"
+            selection = values["-BookList-"][0]
+            listentry = int(selection.split(".")[0])
+            current_book = epub_database[listentry - 1]
+
+            # if we split with no parameters, we get split on whitespace! this eats all leading spaces
+            LogEvent("BookList: " + current_book["title"])
+            update_view(current_book)
     # }}}
-    # --About-------------------------------{{{
-    elif event == "-About-":
-        sg.main_get_debug_data()
-        # sg.tclversion_detailed
+        # --Find-----------------------------------------{{{
+        elif event == "-Find-":
+            if paginate_count:
+                paginate_count = 0
+                LogWarning("Pagination canceled.")
+                LogWarning("Wait for completion message of in progress book.")
+            else:
+                if findlist_active:
+                    epub_database = copy.deepcopy(save_database)
+                    window['-Find-'].update("Find")
+                    findlist_active = False
+                    #update the booklist view.
+                    bnamelist = []
+                    idx = 1
+                    for book in epub_database:
+                        bname = create_bookname(book["title"], book["author"])
+                        if idx < 10:
+                            bnamelist.append(f" {idx}. {book['title']} by {book['author']}")
+                        else:
+                            bnamelist.append(f"{idx}. {book['title']} by {book['author']}")
+                        idx += 1
+                    window['-BookList-'].update(values=bnamelist)
+                    current_book = epub_database[0]
+                    update_view(current_book)
+                else:
+                    searchstr = sg.popup_get_text(
+                        "Search String:",
+                        title="Find Book or Author",
+                        font="Menlo 12",
+                        location=window.mouse_location(),
+                    )
+                    if searchstr is not None:
+                        findlist_active = True
+                        window['-Find-'].update("ShowAll")
+                        findlist = FindTitleAuthor(searchstr)
+                        if len(findlist) == 0:
+                            LogWarning("Nothing found")
+                        else:
+                            save_database = copy.deepcopy(epub_database)
+                            epub_database = copy.deepcopy(findlist)
+                            #update the booklist view.
+                            bnamelist = []
+                            idx = 1
+                            for book in epub_database:
+                                bname = create_bookname(book["title"], book["author"])
+                                if idx < 10:
+                                    bnamelist.append(f" {idx}. {book['title']} by {book['author']}")
+                                else:
+                                    bnamelist.append(f"{idx}. {book['title']} by {book['author']}")
+                                idx += 1
+                            window['-BookList-'].update(values=bnamelist)
+                            current_book = epub_database[0]
+                            update_view(current_book)
     # }}}
-    # --Help-------------------------------{{{
-    elif event == "-Help-":
-        if show_help:
-            debug_str = window["-DEBUG-" + sg.WRITE_ONLY_KEY].get()
-            window["-DEBUG-" + sg.WRITE_ONLY_KEY].update("")
-            render_markdown(hprint, gui_help)
-            window['-Help-'].update("Log")
-            window['-DEBUG-' + sg.WRITE_ONLY_KEY].set_vscroll_position(0)
-            show_help = False
-        else:
-            window["-DEBUG-" + sg.WRITE_ONLY_KEY].update("")
-            window["-DEBUG-" + sg.WRITE_ONLY_KEY].update(debug_str)
-            window['-Help-'].update("Help")
-            show_help = True
+        # --Configure -----------------------------------{{{
+        elif event == "-Configure-":
+            # LogEvent("Open Configure Page")
+            toggle_configure(window)
+            render_markdown(cprint, configuration_help)
+            window['-config_help-' + sg.WRITE_ONLY_KEY].set_vscroll_position(0)
     # }}}
-    elif event == "-MLINE-":
-        print("MLINE event: ")
-        print(str(values["-MLINE-"]))
-
-    # ---files-------------------------------------{{{
-    elif event == "-files-":
-        LogEvent("Event -files-")
-        LogEvent(f'''Files selected: {values["-fbfiles-"]}''')
-        flist = values['-fbfiles-'].split(';')
-        load_files('', flist)
-        if len(bnamelist):
-            window["-BookList-"].update(values=bnamelist)
-            window["-BookList-"].SetValue(bnamelist[0])  
-            current_book = epub_database[0]
-            update_view(current_book)
-        else:
-            LogWarning("No epubs selected.")
+        # --Cancel-----------------------------------{{{
+        elif event == "-CancelConfig-":
+            # LogEvent("Close config page without saving.")
+            toggle_configure(window)
     # }}}
-
-    # ---srcdir-------------------------------------{{{
-    elif event == "-srcdir-":
-        LogEvent("Event -srcdir-")
-        directory = values["-srcdir-"]
-        LogEvent(f"directory: {directory}")
-        flist = [f for f in os.listdir(directory) if f.endswith(".epub")]
-        load_files(directory, flist)
-        if len(bnamelist):
+        # --UpdateConfig-----------------------------------{{{
+        elif event == "-UpdateConfig-":
+            # LogEvent("Update config dictionary and close config page.")
+            # LogEvent(f"cfgsrcdir: {window['-cfgsrcdir-'].get()}")
+            update_config(values)
+            window["-srcdir-"].update(value=config["srcdir"])
+            window["-outdir-"].update(value=config["outdir"])
+            toggle_configure(window)
+            flist = [f for f in os.listdir(config['srcdir']) if f.endswith(".epub")]
+            load_files(config['srcdir'], flist)
             window["-BookList-"].update(values=bnamelist)
             window["-BookList-"].SetValue(bnamelist[0])  
             current_book = epub_database[0]
             update_view(current_book)
-            # change the folder browser to start at this directory next time
-            window["-fbsrcdir-"].InitialFolder = directory
+            # change the folder browser to start at the directory next time
+            window["-fbsrcdir-"].InitialFolder = config["srcdir"]
             window["-fbsrcdir-"].update()
-        else:
-            LogWarning("No epubs found in {directory}")
-
-    # }}}
-    # --BookList-------------------------------------{{{
-    elif event == "-BookList-":
-        # the booklist of the form: "1. book by author"
-        selection = values["-BookList-"][0]
-        listentry = int(selection.split(".")[0])
-        current_book = epub_database[listentry - 1]
-
-        # if we split with no parameters, we get split on whitespace! this eats all leading spaces
-        LogEvent("BookList: " + current_book["title"])
-        update_view(current_book)
-# }}}
-    # --Find-----------------------------------------{{{
-    elif event == "-Find-":
-        if paginate_count:
+        # }}}
+        # --config_file-----------------------------------{{{
+        elif event == "-config_file-":
+            config_file = values["-config_file-"]
+            if Path(config_file).is_file():
+                # window["-config_label-"].update(f"Config File: {config_file}")
+                LogEvent(f"-config_file- event; config_file input element: {config_file}")
+                with open(config_file, "r") as cfg_file:
+                    config = json.loads(cfg_file.read())
+                    # now update the displayed window
+                    window["-outdir-"].update(config["outdir"])
+                    window["-genplist-"].update(config["genplist"])
+                    window["-match-"].update(config["match"])
+                    window["-pgwords-"].update(config["pgwords"])
+                    window["-pages-"].update(config["pages"])
+                    window["-pageline-"].update(config["pageline"])
+                    window["-pl_fntsz-"].update(config["pl_fntsz"])
+                    window["-align_left-"].update(config["pl_align"] == "left")
+                    window["-align_center-"].update(config["pl_align"] == "center")
+                    window["-align_right-"].update(config["pl_align"] == "right")
+                    window["-pl_color_red-"].update(config["pl_color"] == "red")
+                    window["-pl_color_green-"].update(config["pl_color"] == "green")
+                    window["-pl_color_none-"].update(config["pl_color"] == "none")
+                    window["-pl_pgtot-"].update(config["pl_pgtot"])
+                    window["-pl_bkt_angle-"].update(config["pl_bkt"])
+                    window["-pl_bkt_paren-"].update(config["pl_bkt"])
+                    window["-pl_bkt_none-"].update(config["pl_bkt"])
+                    window["-superscript-"].update(config["superscript"])
+                    window["-super_fntsz-"].update(config["super_fntsz"])
+                    window["-super_color_red-"].update(config["pl_color"])
+                    window["-super_color_green-"].update(config["pl_color"])
+                    window["-super_color_none-"].update(config["pl_color"])
+                    window["-ebookconvert-"].update(config["ebookconvert"])
+                    window["-epubcheck-"].update(config["epubcheck"])
+                    window["-chk_orig-"].update(config["chk_orig"])
+                    window["-chk_paged-"].update(config["chk_paged"])
+                    window["-quiet-"].update(config["quiet"])
+                    window["-DEBUG-"].update(config["DEBUG"])
+        # }}}
+        # --save_config-----------------------------------{{{
+        elif event == "-save_config-":
+            LogEvent(f"--> Save configuration file: {values['-save_config-']}.")
+            # update the config dictionary first
+            update_config(values)
+            window["-srcdir-"].update(value=config["srcdir"])
+            window["-outdir-"].update(value=config["outdir"])
+            # then save the file
+            with open(values["-save_config-"], "w") as cfg_file:
+                cfg_file.write(json.dumps(config, indent=4))
+        # }}}
+        # --Paginate-----------------------------------{{{
+        elif event == "-Paginate-":
+            if current_book['modified']:
+                LogWarning(f"{current_book['title']} has already been paginated by epubpager.")
+                continue
+            book_location = current_book['formats'][0]
+            LogEvent("")
+            LogEvent(f"Paginating {current_book['title']}")
+            # set this globals so that -threadupdate- event stops properly.
             paginate_count = 0
-            LogWarning("Pagination canceled.")
-            LogWarning("Wait for completion message of in progress book.")
-        else:
-            if findlist_active:
-                epub_database = copy.deepcopy(save_database)
-                window['-Find-'].update("Find")
-                findlist_active = False
-                #update the booklist view.
-                bnamelist = []
-                idx = 1
-                for book in epub_database:
-                    bname = create_bookname(book["title"], book["author"])
-                    if idx < 10:
-                        bnamelist.append(f" {idx}. {book['title']} by {book['author']}")
-                    else:
-                        bnamelist.append(f"{idx}. {book['title']} by {book['author']}")
-                    idx += 1
-                window['-BookList-'].update(values=bnamelist)
-                current_book = epub_database[0]
-                update_view(current_book)
-            else:
-                searchstr = sg.popup_get_text(
-                    "Search String:",
-                    title="Find Book or Author",
-                    font="Menlo 12",
-                    location=window.mouse_location(),
-                )
-                if searchstr is not None:
-                    findlist_active = True
-                    window['-Find-'].update("ShowAll")
-                    findlist = FindTitleAuthor(searchstr)
-                    if len(findlist) == 0:
-                        LogWarning("Nothing found")
-                    else:
-                        save_database = copy.deepcopy(epub_database)
-                        epub_database = copy.deepcopy(findlist)
-                        #update the booklist view.
-                        bnamelist = []
-                        idx = 1
-                        for book in epub_database:
-                            bname = create_bookname(book["title"], book["author"])
-                            if idx < 10:
-                                bnamelist.append(f" {idx}. {book['title']} by {book['author']}")
-                            else:
-                                bnamelist.append(f"{idx}. {book['title']} by {book['author']}")
-                            idx += 1
-                        window['-BookList-'].update(values=bnamelist)
-                        current_book = epub_database[0]
-                        update_view(current_book)
-# }}}
-    # --Configure -----------------------------------{{{
-    elif event == "-Configure-":
-        # LogEvent("Open Configure Page")
-        toggle_configure(window)
-        render_markdown(cprint, configuration_help)
-        window['-config_help-' + sg.WRITE_ONLY_KEY].set_vscroll_position(0)
-# }}}
-    # --Cancel-----------------------------------{{{
-    elif event == "-CancelConfig-":
-        # LogEvent("Close config page without saving.")
-        toggle_configure(window)
-# }}}
-    # --UpdateConfig-----------------------------------{{{
-    elif event == "-UpdateConfig-":
-        # LogEvent("Update config dictionary and close config page.")
-        # LogEvent(f"cfgsrcdir: {window['-cfgsrcdir-'].get()}")
-        update_config(values)
-        window["-srcdir-"].update(value=config["srcdir"])
-        window["-outdir-"].update(value=config["outdir"])
-        toggle_configure(window)
-        flist = [f for f in os.listdir(config['srcdir']) if f.endswith(".epub")]
-        load_files(config['srcdir'], flist)
-        window["-BookList-"].update(values=bnamelist)
-        window["-BookList-"].SetValue(bnamelist[0])  
-        current_book = epub_database[0]
-        update_view(current_book)
-        # change the folder browser to start at the directory next time
-        window["-fbsrcdir-"].InitialFolder = config["srcdir"]
-        window["-fbsrcdir-"].update()
-    # }}}
-    # --config_file-----------------------------------{{{
-    elif event == "-config_file-":
-        config_file = values["-config_file-"]
-        if Path(config_file).is_file():
-            # window["-config_label-"].update(f"Config File: {config_file}")
-            LogEvent(f"-config_file- event; config_file input element: {config_file}")
-            with open(config_file, "r") as cfg_file:
-                config = json.loads(cfg_file.read())
-                # now update the displayed window
-                window["-outdir-"].update(config["outdir"])
-                window["-genplist-"].update(config["genplist"])
-                window["-match-"].update(config["match"])
-                window["-pgwords-"].update(config["pgwords"])
-                window["-pages-"].update(config["pages"])
-                window["-pageline-"].update(config["pageline"])
-                window["-pl_fntsz-"].update(config["pl_fntsz"])
-                window["-align_left-"].update(config["pl_align"] == "left")
-                window["-align_center-"].update(config["pl_align"] == "center")
-                window["-align_right-"].update(config["pl_align"] == "right")
-                window["-pl_color_red-"].update(config["pl_color"] == "red")
-                window["-pl_color_green-"].update(config["pl_color"] == "green")
-                window["-pl_color_none-"].update(config["pl_color"] == "none")
-                window["-pl_pgtot-"].update(config["pl_pgtot"])
-                window["-pl_bkt_angle-"].update(config["pl_bkt"])
-                window["-pl_bkt_paren-"].update(config["pl_bkt"])
-                window["-pl_bkt_none-"].update(config["pl_bkt"])
-                window["-superscript-"].update(config["superscript"])
-                window["-super_fntsz-"].update(config["super_fntsz"])
-                window["-super_color_red-"].update(config["pl_color"])
-                window["-super_color_green-"].update(config["pl_color"])
-                window["-super_color_none-"].update(config["pl_color"])
-                window["-ebookconvert-"].update(config["ebookconvert"])
-                window["-epubcheck-"].update(config["epubcheck"])
-                window["-chk_orig-"].update(config["chk_orig"])
-                window["-chk_paged-"].update(config["chk_paged"])
-                window["-quiet-"].update(config["quiet"])
-                window["-DEBUG-"].update(config["DEBUG"])
-    # }}}
-    # --save_config-----------------------------------{{{
-    elif event == "-save_config-":
-        LogEvent(f"--> Save configuration file: {values['-save_config-']}.")
-        # update the config dictionary first
-        update_config(values)
-        window["-srcdir-"].update(value=config["srcdir"])
-        window["-outdir-"].update(value=config["outdir"])
-        # then save the file
-        with open(values["-save_config-"], "w") as cfg_file:
-            cfg_file.write(json.dumps(config, indent=4))
-    # }}}
-    # --Paginate-----------------------------------{{{
-    elif event == "-Paginate-":
-        if current_book['modified']:
-            LogWarning(f"{current_book['title']} has already been paginated by epubpager.")
-            continue
-        book_location = current_book['formats'][0]
-        LogEvent("")
-        LogEvent(f"Paginating {current_book['title']}")
-        # set this globals so that -threadupdate- event stops properly.
-        paginate_count = 0
-        window.perform_long_operation(lambda : paginate_book(book_location), "-threadupdate-")
-    # }}}
-    # --Paginate All-----------------------------------{{{
-    elif event == "-PaginateAll-":
-        """
-        Possibility:
-        A. Must modify paginate_book to not call LogEvent, but rather store the output in a string.
-        1. PaginateAll set up:
-            1. Generate a list of books to paginate as paginate_list
-            2. Toggle visibility of buttons to avoid interruption that is inconsistent.
-               Set up Find button to enable stopping.
-            3. pbook is set to 0, the first book in the list
-            4. ptot is set to len(paginate_list)
-            5. Generate an event called -NextBook-.
-        2. Next Book event tasks:
-            1. If stop_pagination is True, we have been terminated. 
-               1. Reverse toggle of button visibility.
-               2. exit the NextBook event without launching another pagination.
-            2. if stop_pagination is False, paginate the next book using perform_long_operation which will generate another Next_Book event.
-               1. When pagination is done, 
-        """
-        LogEvent("--> Paginate books in list.")
-        window['-fbsrcdir-'].update(visible=False)
-        window['-fbfiles-'].update(visible=False)
-        window['-Paginate-'].update(visible=False)
-        window['-PaginateAll-'].update(visible=False)
-        window['-Configure-'].update(visible=False)
-        window['-About-'].update(visible=False)
-        window['-Help-'].update(visible=False)
-        window['-Exit-'].update(visible=False)
-        window['-Find-'].update("Cancel Paginate All")
-        # build the paginate_list from the epub_database
-        # paginating = True
-        # cancel_pagination = False
-        paginate_list = []
-        for book in epub_database:
-            if book['modified']:
-                LogWarning(f"{book['title']} has already been paginated by epubpager.")
-            else:
-                paginate_list.append(book['formats'][0])
-        paginate_count = len(paginate_list)
-        book_location = paginate_list[paginate_count - 1]
-        window.perform_long_operation(lambda : paginate_book(book_location), "-threadupdate-")
-
-    # }}}
-    elif event == "-threadupdate-":# {{{
-        # update the text field with the return data from paginate_book
-        LogEvent(values[event])
-        paginate_count -= 1
-        if paginate_count >= 0:
+            window.perform_long_operation(lambda : paginate_book(book_location), "-threadupdate-")
+        # }}}
+        # --Paginate All-----------------------------------{{{
+        elif event == "-PaginateAll-":
+            """
+            Possibility:
+            A. Must modify paginate_book to not call LogEvent, but rather store the output in a string.
+            1. PaginateAll set up:
+                1. Generate a list of books to paginate as paginate_list
+                2. Toggle visibility of buttons to avoid interruption that is inconsistent.
+                   Set up Find button to enable stopping.
+                3. pbook is set to 0, the first book in the list
+                4. ptot is set to len(paginate_list)
+                5. Generate an event called -NextBook-.
+            2. Next Book event tasks:
+                1. If stop_pagination is True, we have been terminated. 
+                   1. Reverse toggle of button visibility.
+                   2. exit the NextBook event without launching another pagination.
+                2. if stop_pagination is False, paginate the next book using perform_long_operation which will generate another Next_Book event.
+                   1. When pagination is done, 
+            """
+            LogEvent("--> Paginate books in list.")
+            window['-fbsrcdir-'].update(visible=False)
+            window['-fbfiles-'].update(visible=False)
+            window['-Paginate-'].update(visible=False)
+            window['-PaginateAll-'].update(visible=False)
+            window['-Configure-'].update(visible=False)
+            window['-About-'].update(visible=False)
+            window['-Help-'].update(visible=False)
+            window['-Exit-'].update(visible=False)
+            window['-Find-'].update("Cancel Paginate All")
+            # build the paginate_list from the epub_database
+            # paginating = True
+            # cancel_pagination = False
+            paginate_list = []
+            for book in epub_database:
+                if book['modified']:
+                    LogWarning(f"{book['title']} has already been paginated by epubpager.")
+                else:
+                    paginate_list.append(book['formats'][0])
+            paginate_count = len(paginate_list)
             book_location = paginate_list[paginate_count - 1]
             window.perform_long_operation(lambda : paginate_book(book_location), "-threadupdate-")
-        else:
-            LogWarning("All books paginated.")
-            window['-fbsrcdir-'].update(visible=True)
-            window['-fbfiles-'].update(visible=True)
-            window['-Paginate-'].update(visible=True)
-            window['-PaginateAll-'].update(visible=True)
-            window['-Configure-'].update(visible=True)
-            window['-About-'].update(visible=True)
-            window['-Exit-'].update(visible=True)
-            window['-Find-'].update("Find")# }}}
+
+        # }}}
+        elif event == "-threadupdate-":# {{{
+            # update the text field with the return data from paginate_book
+            LogEvent(values[event])
+            paginate_count -= 1
+            if paginate_count >= 0:
+                book_location = paginate_list[paginate_count - 1]
+                window.perform_long_operation(lambda : paginate_book(book_location), "-threadupdate-")
+            else:
+                LogWarning("All books paginated.")
+                window['-fbsrcdir-'].update(visible=True)
+                window['-fbfiles-'].update(visible=True)
+                window['-Paginate-'].update(visible=True)
+                window['-PaginateAll-'].update(visible=True)
+                window['-Configure-'].update(visible=True)
+                window['-About-'].update(visible=True)
+                window['-Exit-'].update(visible=True)
+                window['-Find-'].update("Find")# }}}
 
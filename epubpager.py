@@ -1,13 +1,32 @@
 import sys
+import os
+import atexit
+import copy
+import json
+import hashlib
+import mmap
 import shutil
-from subprocess import PIPE, run
+from subprocess import PIPE, Popen, run
+import tempfile
 import time
 from pathlib import Path
 import typing
 import urllib.parse
+import html
 import io
+import re
+import struct
+import itertools
+import bisect
+import zlib
+import queue
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 import zipfile
+import xml.parsers.expat
 
 CR = "\n"
 opf_dictkey = "package"
@@ -15,6 +34,115 @@ pglnk = "pagetb"
 epubns = 'xmlns:epub="http://www.idpf.org/2007/ops"'
 pg_xmlns = f'<nav {epubns} epub:type="page-list" id="page-list" hidden="hidden"><ol> \n'
 comment_epubpager ="This epub was modified by epubpager https://github.com/tthkbw/epub_pager "
+el_type = re.compile(r"[^ >]*")  # element name following '<'
+ws_skip = re.compile(r"[\n \t]*")  # whitespace skipped between elements
+word_re = re.compile(r"\S+")  # a word, as counted by str.split()
+shard_re = re.compile(r"</(?:p|div)>")  # block ends where a section may be sharded
+copy_chunk = 65536  # bytes read at a time by zip_copy_raw
+# an existing pagebreak element, its closing tag is matched by pb_close_re
+pagebreak_re = re.compile(
+    r'<([^\s/>]+)\s[^>]*?(?:epub:type="pagebreak"|role="doc-pagebreak")[^>]*>'
+)
+pb_close_re = re.compile(r"[^<]*</([^\s>]+)\s*>")
+pb_attr_re = re.compile(r'\s(title|aria-label|id)="([^"]*)"')
+# a page-list entry in the nav file
+plist_a_re = re.compile(r'<a\s[^>]*?href="([^"]*)"[^>]*>(.*?)</a>', re.S)
+# zlib level of each compress_level setting
+zip_levels = {"fast": 1, "default": zlib.Z_DEFAULT_COMPRESSION, "max": 9}
+
+
+def markup(conv):
+    """
+    Return the markup literals and patterns used to scan section data,
+    converted by conv to str or bytes.
+    """
+
+    return {
+        "lt": conv("<"),
+        "gt": conv(">"),
+        "body": conv("<body"),
+        "body_end": conv("/body"),
+        "comment": conv("!--"),
+        "comment_start": conv("<!--"),
+        "comment_end": conv("-->"),
+        "nav": conv("nav"),
+        "nav_start": conv("<nav"),
+        "nav_end": conv("/nav"),
+        "p_end": conv("</p>"),
+        "div_end": conv("</div>"),
+        "el_type": re.compile(conv(el_type.pattern)),
+        "word": re.compile(conv(word_re.pattern)),
+        "shard": re.compile(conv(shard_re.pattern)),
+    }
+
+
+# str sections, and bytes or mmap sections for engine "bytes"
+str_markup = markup(str)
+bytes_markup = markup(str.encode)
+# token kinds produced by epub_paginator.tokenize()
+tk_tag = 0  # (tk_tag, start, end, el or None if el is ebook_data[start:end])
+tk_text = 1  # (tk_text, start, end, word count)
+tk_end = 2  # (tk_end, start, len(ebook_data), None) -- </body> and the rest
+# epub_paginator.stream_tokens() yields (kind, data, word count or None) and
+# begins with (tk_head, text before <body or None if there is none, None)
+tk_head = 3
+# settings that do not change the paged epub, left out of cache_key
+cache_neutral = (
+    "outdir",
+    "workdir",
+    "workers",
+    "shard_size",
+    "chunk_size",
+    "in_memory",
+    "queue_depth",
+    "cache_dir",
+    "cache_size",
+    "cache_age",
+    "chk_service",
+    "chk_cache",
+    "quiet",
+    "DEBUG",
+)
+# configuration attributes of epub_paginator, see epub_paginator.settings()
+cfg_keys = (
+    "outdir",
+    "workdir",
+    "match",
+    "genplist",
+    "pgwords",
+    "pages",
+    "pageline",
+    "pl_align",
+    "pl_color",
+    "pl_bkt",
+    "pl_fntsz",
+    "pl_pgtot",
+    "superscript",
+    "super_color",
+    "super_fntsz",
+    "super_total",
+    "chap_pgtot",
+    "chap_bkt",
+    "ebookconvert",
+    "chk_orig",
+    "chk_paged",
+    "epubcheck",
+    "workers",
+    "shard_size",
+    "engine",
+    "chunk_size",
+    "in_memory",
+    "compress_level",
+    "queue_depth",
+    "cache_dir",
+    "cache_size",
+    "cache_age",
+    "chk_service",
+    "chk_cache",
+    "chk_native",
+    "quiet",
+    "DEBUG",
+)
 
 has_echk = True
 try:
@@ -25,6 +153,1179 @@ except ModuleNotFoundError:
     echk_message = "epubcheck module was not found."
     has_echk = False
 
+has_numpy = True
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    has_numpy = False
+
+# configuration attributes a render_plan is compiled from
+render_keys = (
+    "genplist",
+    "superscript",
+    "pl_align",
+    "pl_color",
+    "pl_bkt",
+    "pl_fntsz",
+    "pl_pgtot",
+    "super_color",
+    "super_fntsz",
+    "super_total",
+    "chap_pgtot",
+    "chap_bkt",
+)
+
+
+def brackets(bkt):
+    """
+    Return the left and right bracket strings for a pl_bkt or chap_bkt
+    setting.
+    """
+
+    if bkt == "<":
+        return ("&lt;", "&gt;")
+    elif bkt == "-":
+        return ("-", "-")
+    return ("", "")
+
+
+# the ZipFile internals zip_write_raw and zip_copy_raw use to add a member
+# that is already compressed, which zipfile has no public way to do
+zip_internals = (
+    "fp",
+    "_lock",
+    "_writing",
+    "_writecheck",
+    "start_dir",
+    "_didModify",
+    "filelist",
+    "NameToInfo",
+)
+# and those of the zipfile module, to find the data of a source member
+zip_module_internals = ("structFileHeader", "sizeFileHeader")
+
+
+def zip_raw_missing():
+    """
+    Return the names of the zipfile internals needed by zip_write_raw and
+    zip_copy_raw that this python's zipfile does not have.
+    """
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zfile:
+        missing = [name for name in zip_internals if not hasattr(zfile, name)]
+    # zip_copy_raw reads the source member with fp and _lock
+    with zipfile.ZipFile(buf) as zfile:
+        for name in ("fp", "_lock"):
+            if not hasattr(zfile, name) and name not in missing:
+                missing.append(name)
+    if not hasattr(zipfile.ZipInfo, "FileHeader"):
+        missing.append("ZipInfo.FileHeader")
+    for name in zip_module_internals:
+        if not hasattr(zipfile, name):
+            missing.append(f"zipfile.{name}")
+    return missing
+
+
+zip_raw_missing_lst = zip_raw_missing()
+# ZipFile.open(mode="w") deflates a ZipInfo at its compress_level, public
+# since python 3.13
+has_compress_level = hasattr(zipfile.ZipInfo, "compress_level")
+has_zip_raw = not zip_raw_missing_lst
+if has_zip_raw:
+    zip_raw_message = "Compressed zip members are copied without recompressing."
+else:
+    zip_raw_message = (
+        "zipfile lacks " + ", ".join(zip_raw_missing_lst) + "; zip members "
+        "are decompressed and compressed again when copied."
+    )
+
+
+def deflate(data, level):
+    """
+    Return data compressed as a zip member's deflate stream at zlib level,
+    and its CRC. zlib releases the GIL, so members can be deflated by a
+    ThreadPoolExecutor.
+    """
+
+    cobj = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return cobj.compress(data) + cobj.flush(), zlib.crc32(data)
+
+
+def zip_write_raw(zdst, info, chunks):
+    """
+    Add a member to the ZipFile zdst from data that is already compressed.
+    info has the compression method, CRC and sizes of the member, chunks
+    is an iterable of the compressed bytes.
+
+    zipfile has no public way to do this, so the local header is written
+    here and the member is added to zdst the way ZipFile.open(mode="w")
+    does. It raises RuntimeError if the zipfile internals it uses are
+    missing (see has_zip_raw); its callers fall back to writestr then.
+    """
+
+    if not has_zip_raw:
+        raise RuntimeError(
+            f"zip_write_raw: zipfile lacks {', '.join(zip_raw_missing_lst)}"
+        )
+    zip64 = max(info.file_size, info.compress_size) > zipfile.ZIP64_LIMIT
+    with zdst._lock:
+        if zdst._writing:
+            raise ValueError("zip_write_raw: a write handle is open on zdst")
+        zdst._writecheck(info)
+        zdst.fp.seek(zdst.start_dir)
+        info.header_offset = zdst.fp.tell()
+        zdst.fp.write(info.FileHeader(zip64))
+        for data in chunks:
+            zdst.fp.write(data)
+        if info.flag_bits & 0x08:
+            # the local header has no CRC and sizes, a data descriptor
+            # follows the data
+            fmt = "<LLQQ" if zip64 else "<LLLL"
+            zdst.fp.write(
+                struct.pack(
+                    fmt, 0x08074B50, info.CRC, info.compress_size, info.file_size
+                )
+            )
+        zdst.start_dir = zdst.fp.tell()
+        zdst._didModify = True
+        zdst.filelist.append(info)
+        zdst.NameToInfo[info.filename] = info
+
+
+def zip_copy_raw(zsrc, orig, zdst, chunk=copy_chunk):
+    """
+    Copy the member orig of the ZipFile zsrc to the ZipFile zdst without
+    decompressing it. The compressed bytes, CRC, compression method, date
+    and attributes are kept. Without has_zip_raw, or if the zipfile
+    internals fail in a way zip_raw_missing does not see, the member is
+    decompressed and compressed again.
+    """
+
+    info = zipfile.ZipInfo(orig.filename, date_time=orig.date_time)
+    info.compress_type = orig.compress_type
+    info.flag_bits = orig.flag_bits
+    info.create_system = orig.create_system
+    info.external_attr = orig.external_attr
+    info.CRC = orig.CRC
+    info.compress_size = orig.compress_size
+    info.file_size = orig.file_size
+
+    def read_data():
+        # the data follows the local header and its name and extra field
+        zsrc.fp.seek(orig.header_offset)
+        fheader = struct.unpack(
+            zipfile.structFileHeader, zsrc.fp.read(zipfile.sizeFileHeader)
+        )
+        zsrc.fp.seek(fheader[10] + fheader[11], os.SEEK_CUR)
+        left = orig.compress_size
+        while left:
+            data = zsrc.fp.read(min(chunk, left))
+            if not data:
+                raise zipfile.BadZipFile(f"Truncated member {orig.filename}")
+            yield data
+            left -= len(data)
+
+    if has_zip_raw:
+        try:
+            with zsrc._lock:
+                zip_write_raw(zdst, info, read_data())
+            return
+        except Exception:
+            # zdst.start_dir only moves once the member is complete, so
+            # writestr writes over a partly written one. A real problem
+            # with the member is raised again by zsrc.read.
+            pass
+    zdst.writestr(info, zsrc.read(orig), orig.compress_type)
+
+
+def zip_write_deflated(zdst, info, deflated, level):
+    """
+    Add a member to the ZipFile zdst from a deflate() result at zlib
+    level. info gives the name, date and attributes of the member and
+    file_size its size before compression.
+    """
+
+    data, crc = deflated
+    if not has_zip_raw:
+        data = zlib.decompress(data, -zlib.MAX_WBITS)
+        zdst.writestr(info, data, zipfile.ZIP_DEFLATED, level)
+        return
+    info.compress_type = zipfile.ZIP_DEFLATED
+    info.CRC = crc
+    info.compress_size = len(data)
+    zip_write_raw(zdst, info, (data,))
+
+
+class render_plan:
+    """
+    The pagelines, superscripts, page links and page-list entries of a
+    configuration, compiled once into bound str.format templates.
+
+    pageline, superscript and link take the keyword arguments curpg,
+    pages (pages in the book), sct_pg and sct_pgcnt; page_entry takes
+    curpg and href. A plan depends only on the configuration, so it can be
+    kept for every book of a batch and sent to worker processes.
+
+    **Keyword arguments:**
+
+    **_settings_**
+
+    Dictionary of the configuration, at least the keys in render_keys.
+
+    """
+
+    def __init__(self, settings):
+        self.settings = {key: settings[key] for key in render_keys}
+        # configuration strings are literal text in the templates
+        cfg = {
+            key: str(val).replace("{", "{{").replace("}", "}}")
+            for key, val in self.settings.items()
+        }
+        flb, frb = brackets(self.settings["pl_bkt"])
+        clb, crb = brackets(self.settings["chap_bkt"])
+        if self.settings["chap_pgtot"]:
+            pagestr_chapterpages = f" {clb}{{sct_pg}}/{{sct_pgcnt}}{crb}"
+        else:
+            pagestr_chapterpages = ""
+        # pageline
+        if self.settings["pl_pgtot"]:
+            pagestr = f"{flb}{{curpg}}/{{pages}}{frb}{pagestr_chapterpages}"
+        else:
+            pagestr = f"{flb}{{curpg}}{frb}{pagestr_chapterpages}"
+        if self.settings["pl_color"] == "none":
+            color = ""
+        else:
+            color = f"color: {cfg['pl_color']}; "
+        if self.settings["pl_align"] == "endp":
+            pageline = (
+                f'<span style="font-size:{cfg["pl_fntsz"]}; '
+                f'{color}margin: 0 0 0 0">'
+                f" {pagestr}</span>"
+            )
+        else:
+            pageline = (
+                f'<p style="font-size:{cfg["pl_fntsz"]}; '
+                f"text-align:{cfg['pl_align']}; "
+                f'{color}margin: 0 0 0 0">'
+                f"{pagestr}</p>"
+            )
+        # superscript
+        if self.settings["super_total"]:
+            pagestr = f"{flb}{{curpg}}/{{pages}}{frb}{pagestr_chapterpages}"
+        else:
+            pagestr = f"{flb}{{curpg}}{frb}{pagestr_chapterpages}"
+        if self.settings["super_color"] == "none":
+            superscript = (
+                f'<span style="font-size:{cfg["super_fntsz"]};'
+                f'vertical-align:super">{pagestr}</span>'
+            )
+        else:
+            superscript = (
+                f'<span style="font-size:{cfg["super_fntsz"]};'
+                f"vertical-align:super; "
+                f'color:{cfg["super_color"]}">{pagestr}</span>'
+            )
+        # page link placed at a page break
+        link = ""
+        if self.settings["genplist"]:
+            link += (
+                f'<span epub:type="pagebreak" '
+                f'id="{pglnk}{{curpg}}" '
+                f' role="doc-pagebreak" '
+                f'title="{{curpg}}"/>'
+            )
+        if self.settings["superscript"]:
+            link += superscript
+        page_entry = f'  <li><a href="{{href}}#{pglnk}{{curpg}}">{{curpg}}</a></li>{CR}'
+        self.pageline = pageline.format
+        self.superscript = superscript.format
+        self.link = link.format
+        self.page_entry = page_entry.format
+
+    def __reduce__(self):
+        # bound templates are rebuilt from the settings when unpickled
+        return (render_plan, (self.settings,))
+
+
+class page_targets:
+    """
+    The entries of a generated page-list: a compact array of (page, href
+    index) pairs and the table of the hrefs they index, rendered into the
+    page-list nav element once, by render().
+    """
+
+    __slots__ = ("pairs", "hrefs", "index")
+
+    def __init__(self):
+        self.pairs = array("q")
+        self.hrefs = []
+        self.index = {}  # href: its index in hrefs
+
+    def __len__(self):
+        return len(self.pairs) // 2
+
+    def add(self, curpg, href):
+        idx = self.index.get(href)
+        if idx is None:
+            idx = self.index[href] = len(self.hrefs)
+            self.hrefs.append(href)
+        self.pairs.append(curpg)
+        self.pairs.append(idx)
+
+    def extend(self, other):
+        """
+        Append the entries of the page_targets other.
+        """
+
+        remap = array("q", (self.index.get(href, -1) for href in other.hrefs))
+        for idx, href in enumerate(other.hrefs):
+            if remap[idx] == -1:
+                remap[idx] = self.index[href] = len(self.hrefs)
+                self.hrefs.append(href)
+        pairs = other.pairs
+        for pos in range(0, len(pairs), 2):
+            self.pairs.append(pairs[pos])
+            self.pairs.append(remap[pairs[pos + 1]])
+
+    def render(self, page_entry):
+        """
+        Return the page-list nav element, with one page_entry (see
+        render_plan) per entry.
+        """
+
+        hrefs = self.hrefs
+        pairs = self.pairs
+        entries = [
+            page_entry(curpg=curpg, href=hrefs[idx])
+            for curpg, idx in zip(pairs[::2], pairs[1::2])
+        ]
+        return "".join((pg_xmlns, *entries, "  </ol></nav>" + CR))
+
+
+class nav_page_index:
+    """
+    Index of the page-list in a navigation file: the target (file,
+    fragment) of each page label, the highest numbered page, and the
+    number of page targets in each file.
+
+    Files are keyed by their normalized path on disk, see count().
+
+    **Keyword arguments:**
+
+    **_nav_data_**
+
+    The data read from the navigation file.
+
+    **_nav_dir_**
+
+    The directory of the navigation file, hrefs are relative to it.
+
+    """
+
+    def __init__(self, nav_data, nav_dir):
+        self.targets = {}  # label -> (file, fragment)
+        self.max_page = 0
+        self.counts = {}  # file -> number of page targets
+        self.unclosed = False  # an <a> without href or </a> was found
+        loc = nav_data.find('epub:type="page-list"')
+        if loc == -1:
+            return
+        end = nav_data.find("</nav>", loc)
+        if end == -1:
+            end = len(nav_data)
+        nav_data = nav_data[loc:end]
+        entries = 0
+        for entry in plist_a_re.finditer(nav_data):
+            entries += 1
+            href = urllib.parse.unquote(html.unescape(entry.group(1)))
+            pfile, _, fragment = href.partition("#")
+            pfile = os.path.normpath(os.path.join(nav_dir, pfile))
+            label = re.sub(r"<[^>]*>", "", entry.group(2)).strip()
+            self.targets[label] = (pfile, fragment)
+            self.counts[pfile] = self.counts.get(pfile, 0) + 1
+            if label.isdigit() and int(label) > self.max_page:
+                self.max_page = int(label)
+        if entries != len(re.findall(r"<a\s", nav_data)):
+            self.unclosed = True
+
+    def count(self, path):
+        """
+        Return the number of page targets in the file at path, or None if
+        the page-list has none.
+        """
+
+        return self.counts.get(os.path.normpath(str(path)))
+
+
+class pipe_stage:
+    """
+    One stage of a pipeline of threads joined by bounded queues. The stage
+    thread calls func on each item, taken from the iterable items or, if
+    items is None, from put(). Unless sink is True the results are queued
+    for the next stage, which iterates over the stage to get them in order.
+
+    stats holds the number of items, the time the stage thread spent in
+    func ("busy"), waiting for an item ("wait_in") and waiting for room in
+    its queue of results ("wait_out"), the largest number of items waiting
+    in its queue ("max_depth"), and the time the stages on either side
+    waited for this one: to get a result ("wait_get") or to put an item
+    ("wait_put").
+    """
+
+    done = object()  # ends the items and the results
+
+    def __init__(self, name, func, depth, items=None, sink=False):
+        self.name = name
+        self.func = func
+        self.items = items
+        self.inq = queue.Queue(depth) if items is None else None
+        self.outq = None if sink else queue.Queue(depth)
+        self.stop = threading.Event()
+        self.error = None
+        self.stats = {
+            "items": 0,
+            "busy": 0.0,
+            "wait_in": 0.0,
+            "wait_out": 0.0,
+            "max_depth": 0,
+            "wait_get": 0.0,
+            "wait_put": 0.0,
+        }
+        self.thread = threading.Thread(
+            target=self.run, name=f"pipe {name}", daemon=True
+        )
+        self.thread.start()
+
+    def run(self):
+        stats = self.stats
+        if self.items is None:
+            items = iter(self.inq.get, pipe_stage.done)
+        else:
+            items = iter(self.items)
+        try:
+            while not self.stop.is_set():
+                t0 = time.perf_counter()
+                item = next(items, pipe_stage.done)
+                t1 = time.perf_counter()
+                stats["wait_in"] += t1 - t0
+                if item is pipe_stage.done:
+                    break
+                result = self.func(item)
+                t2 = time.perf_counter()
+                stats["busy"] += t2 - t1
+                stats["items"] += 1
+                if self.outq is not None:
+                    self.outq.put(result)
+                    stats["wait_out"] += time.perf_counter() - t2
+                    stats["max_depth"] = max(stats["max_depth"], self.outq.qsize())
+        except BaseException as err:
+            self.error = err
+        finally:
+            if self.outq is not None:
+                self.outq.put(pipe_stage.done)
+
+    def __iter__(self):
+        while True:
+            t0 = time.perf_counter()
+            result = self.outq.get()
+            self.stats["wait_get"] += time.perf_counter() - t0
+            if result is pipe_stage.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            yield result
+
+    def put(self, item):
+        """
+        Queue an item for the stage, waiting for room in its queue.
+        """
+
+        t0 = time.perf_counter()
+        while True:
+            if self.error is not None:
+                raise self.error
+            if not self.thread.is_alive():
+                return
+            try:
+                self.inq.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self.stats["wait_put"] += time.perf_counter() - t0
+        self.stats["max_depth"] = max(self.stats["max_depth"], self.inq.qsize())
+
+    def close(self):
+        """
+        Wait for the items put() to be done, or stop taking items from
+        items, and end the stage thread. An exception raised by func is
+        raised again here.
+        """
+
+        if self.inq is not None:
+            self.put(pipe_stage.done)
+        else:
+            self.stop.set()
+        while self.thread.is_alive():
+            if self.outq is not None:
+                # unblock the stage thread if the results are not used
+                try:
+                    self.outq.get_nowait()
+                except queue.Empty:
+                    pass
+            self.thread.join(0.05)
+        if self.error is not None:
+            raise self.error
+
+
+def copy_digest(src, dst, chunk=1 << 20):
+    """
+    Copy the file src to dst and return the sha256 hex digest of its
+    data, computed while it is copied.
+    """
+
+    digest = hashlib.sha256()
+    with open(src, "rb") as rfile, open(dst, "wb") as wfile:
+        for data in iter(lambda: rfile.read(chunk), b""):
+            digest.update(data)
+            wfile.write(data)
+    shutil.copystat(src, dst)
+    return digest.hexdigest()
+
+
+def stream_digest(fobj, chunk=1 << 20):
+    """
+    Return the sha256 hex digest of the binary file object fobj, which is
+    left at its start.
+    """
+
+    digest = hashlib.sha256()
+    fobj.seek(0)
+    for data in iter(lambda: fobj.read(chunk), b""):
+        digest.update(data)
+    fobj.seek(0)
+    return digest.hexdigest()
+
+
+class disk_cache:
+    """
+    A directory of cache entries. Each entry is a directory of files
+    named by its key, a hex digest, under a directory named by the first
+    two characters of the key. Entries are added whole (see put), so a
+    reader never sees a partly written entry.
+
+    Entries not used (see get) for max_age days are evicted, then the
+    least recently used ones until the total size is at most max_size
+    bytes. The entries of the caches in the directories shared count
+    toward max_size too and are evicted with these, so the caches share
+    one budget. stats.json counts the hits, misses, stores and evictions.
+    """
+
+    def __init__(self, path, max_size, max_age, shared=()):
+        self.path = Path(path)
+        self.max_size = max_size
+        self.max_age = max_age
+        self.shared = [Path(share) for share in shared]
+
+    def entry(self, key):
+        return self.path / key[:2] / key
+
+    def get(self, key):
+        """
+        Return the Path of the entry key, or None if it is not cached.
+        """
+
+        entry = self.entry(key)
+        if not entry.is_dir():
+            self.count("misses")
+            return None
+        # the modification time of the entry is its last use
+        os.utime(entry)
+        self.count("hits")
+        return entry
+
+    def put(self, key, files):
+        """
+        Add the entry key. files is a dictionary of file name and data:
+        bytes, or the Path of a file, which is hard linked if possible.
+        Returns the Path of the entry.
+        """
+
+        entry = self.entry(key)
+        tmp = self.path / f"tmp-{key}-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        for name, data in files.items():
+            if isinstance(data, (bytes, bytearray)):
+                (tmp / name).write_bytes(data)
+            else:
+                link_or_copy(data, tmp / name)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # added by another process meanwhile
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.count("stores")
+        self.evict()
+        return entry
+
+    def entries(self, path=None):
+        """
+        Return a list of (last use, size, Path) of the cache entries, or of
+        the entries of the cache in the directory path.
+        """
+
+        found = []
+        for entry in Path(path or self.path).glob("??/*"):
+            if not entry.is_dir():
+                continue
+            size = sum(f.stat().st_size for f in entry.iterdir() if f.is_file())
+            found.append((entry.stat().st_mtime, size, entry))
+        return found
+
+    def evict(self):
+        """
+        Remove the entries older than max_age days, then the least recently
+        used entries until the cache and the shared caches together are no
+        larger than max_size bytes.
+        """
+
+        found = self.entries()
+        for share in self.shared:
+            found += self.entries(share)
+        found.sort()
+        oldest = time.time() - self.max_age * 86400
+        total = sum(size for _, size, _ in found)
+        evicted = 0
+        for used, size, entry in found:
+            if used >= oldest and total <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            evicted += 1
+        if evicted:
+            self.count("evictions", evicted)
+
+    def count(self, name, incr=1):
+        """
+        Add incr to the counter name in stats.json.
+        """
+
+        counts = self.counts()
+        counts[name] = counts.get(name, 0) + incr
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp = self.path / f"stats.json.{os.getpid()}"
+        tmp.write_text(json.dumps(counts))
+        os.replace(tmp, self.path / "stats.json")
+
+    def counts(self):
+        try:
+            return json.loads((self.path / "stats.json").read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def stats(self):
+        """
+        Return a dictionary of cache statistics: the counters of
+        stats.json, the number of entries, their total size and the age in
+        days of the oldest and newest use.
+        """
+
+        found = self.entries()
+        now = time.time()
+        result = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        result.update(self.counts())
+        result["entries"] = len(found)
+        result["size"] = sum(size for _, size, _ in found)
+        result["max_size"] = self.max_size
+        result["max_age"] = self.max_age
+        if found:
+            result["oldest_days"] = (now - min(found)[0]) / 86400
+            result["newest_days"] = (now - max(found)[0]) / 86400
+        return result
+
+
+# the caches in cache_dir: the paged epubs and, in epubcheck, the results
+# of run_chk
+cache_subdirs = ("", "epubcheck")
+
+
+def xml_check(epub, names):
+    """
+    Parse the members names of the epub file epub (a file name or binary
+    file object) as XML. Returns a list of (name, error, ids): the parse
+    error, "" if the member is well-formed, and the set of its ids that
+    begin with pglnk.
+    """
+
+    results = []
+    with zipfile.ZipFile(epub) as zfile:
+        for name in names:
+            ids = set()
+
+            def start(tag, attrs, ids=ids):
+                ident = attrs.get("id")
+                if ident and ident.startswith(pglnk):
+                    ids.add(ident)
+
+            parser = xml.parsers.expat.ParserCreate()
+            parser.StartElementHandler = start
+            try:
+                parser.Parse(zfile.read(name), True)
+                error = ""
+            except xml.parsers.expat.ExpatError as exc:
+                error = str(exc)
+            results.append((name, error, ids))
+    return results
+
+
+# run by chk_service with the epubcheck jar on the class path (java 11 runs
+# a single source file without compiling it first)
+chk_service_java = """\
+import com.adobe.epubcheck.tool.EpubChecker;
+import java.io.BufferedReader;
+import java.io.ByteArrayOutputStream;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.nio.charset.StandardCharsets;
+
+public class EpubcheckService {
+    public static void main(String[] args) throws Exception {
+        PrintStream out = System.out;
+        PrintStream err = System.err;
+        BufferedReader in = new BufferedReader(
+            new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        String path;
+        while ((path = in.readLine()) != null) {
+            ByteArrayOutputStream buf = new ByteArrayOutputStream();
+            PrintStream capture = new PrintStream(buf, true, "UTF-8");
+            System.setOut(capture);
+            System.setErr(capture);
+            int status;
+            try {
+                status = new EpubChecker().run(new String[] {path});
+            } catch (Throwable e) {
+                e.printStackTrace(capture);
+                status = -1;
+            } finally {
+                System.setOut(out);
+                System.setErr(err);
+            }
+            capture.flush();
+            byte[] report = buf.toByteArray();
+            out.print(status + " " + report.length + "\n");
+            out.write(report);
+            out.flush();
+        }
+    }
+}
+"""
+
+
+class chk_service:
+    """
+    A java process that runs epubcheck on each epub path written to its
+    stdin, so that the JVM starts once for a batch of books instead of once
+    per check. It answers each path with a line of the epubcheck exit
+    status and the length of its report, followed by the report.
+
+    Idle services are kept by epubcheck jar in chk_service.idle and reused
+    (see acquire and release); checks made at the same time each get their
+    own service.
+    """
+
+    idle = {}  # epubcheck jar: list of idle chk_service
+    lock = threading.Lock()
+    source = None  # the java source, in a private directory of this process
+
+    def __init__(self, jar):
+        self.jar = jar
+        # the JVM writes to stderr only when it cannot run the service, so
+        # a file keeps it without a reader thread
+        self.errors = tempfile.TemporaryFile()
+        self.proc = Popen(
+            ["java", "-cp", jar, str(self.write_source())],
+            stdin=PIPE,
+            stdout=PIPE,
+            stderr=self.errors,
+        )
+
+    @classmethod
+    def write_source(cls):
+        """
+        Return the path of the java source of the service, written once per
+        process to a directory only this user can change.
+        """
+
+        with cls.lock:
+            if cls.source is None:
+                tmpdir = tempfile.mkdtemp(prefix="epubpager_")
+                atexit.register(shutil.rmtree, tmpdir, True)
+                source = Path(tmpdir) / "EpubcheckService.java"
+                source.write_text(chk_service_java)
+                cls.source = source
+            return cls.source
+
+    @classmethod
+    def acquire(cls, jar):
+        """
+        Return an idle chk_service of the epubcheck jar, started if there is
+        none. Pass it to release when done.
+        """
+
+        with cls.lock:
+            idle = cls.idle.get(jar)
+            if idle:
+                return idle.pop()
+        return cls(jar)
+
+    def release(self):
+        with chk_service.lock:
+            chk_service.idle.setdefault(self.jar, []).append(self)
+
+    def check(self, epub):
+        """
+        Return the exit status and the report of epubcheck for the file
+        epub. If the service fails it is closed and OSError is raised.
+        """
+
+        try:
+            self.proc.stdin.write(os.path.abspath(epub).encode("utf-8") + b"\n")
+            self.proc.stdin.flush()
+            header = self.proc.stdout.readline().split()
+            if len(header) != 2:
+                raise OSError("the epubcheck service stopped")
+            status, size = int(header[0]), int(header[1])
+            report = self.proc.stdout.read(size)
+        except (OSError, ValueError) as exc:
+            self.close()
+            self.errors.seek(0)
+            errors = self.errors.read().decode("utf-8", "replace").strip()
+            self.errors.close()
+            msg = f"epubcheck service failed: {exc}"
+            if errors:
+                msg += f"{CR}{errors}"
+            raise OSError(msg) from exc
+        return status, report.decode("utf-8", "replace")
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=5)
+        except Exception:
+            self.proc.kill()
+            self.proc.wait()
+
+
+def link_or_copy(src, dst):
+    """
+    Hard link dst to the file src, or copy it if a link cannot be made,
+    replacing dst if it exists.
+    """
+
+    dst = Path(dst)
+    if dst.exists():
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+# attributes of an xml start tag: (name, quote, value)
+attr_re = re.compile(r"""([\w:.-]+)\s*=\s*(["'])(.*?)\2""", re.S)
+rootfile_re = re.compile(r"<rootfile\b([^>]*)>")
+package_re = re.compile(r"<(?:opf:)?package\b([^>]*)>")
+metadata_re = re.compile(r"<(?:opf:)?metadata\b.*?</(?:opf:)?metadata>", re.S)
+dc_re = re.compile(r"<(dc(?:terms)?:\w+)\b[^>]*>([^<]*)</\1>")
+meta_re = re.compile(r"<(?:opf:)?meta\b([^>]*?)(/?)>([^<]*)")
+# the manifest and spine elements and their items, with any namespace
+# prefix; comments are matched so that they are skipped
+opf_re = re.compile(
+    r"<!--.*?-->|<(/?)(?:\w+:)?(manifest|spine|itemref|item)\b([^>]*?)\s*>", re.S
+)
+
+
+def tag_attrs(text):
+    """
+    Return a dictionary of the attributes in text, the inside of a start
+    tag.
+    """
+
+    return {name: html.unescape(val) for name, _, val in attr_re.findall(text)}
+
+
+class manifest_item:
+    """
+    An item of the opf manifest.
+    """
+
+    __slots__ = ("id", "href", "media_type", "properties")
+
+    def __init__(self, id, href, media_type="", properties=""):
+        self.id = id
+        self.href = href
+        self.media_type = media_type
+        self.properties = properties
+
+    def __repr__(self):
+        return (
+            f"manifest_item({self.id!r}, {self.href!r}, "
+            f"{self.media_type!r}, {self.properties!r})"
+        )
+
+
+class epub_package:
+    """
+    The container and opf file of an epub, parsed once per archive.
+
+    opf_file is the path of the opf file in the epub and opf_dir its
+    directory, "" or ending in "/". metadata maps the dc: elements and
+    the name or property of each meta element to its text or content.
+    manifest maps each item id to a manifest_item, spine is the list of
+    itemref idrefs and nav_href the href of the nav item, "" if there is
+    none. error is "" or describes what could not be parsed.
+    """
+
+    __slots__ = (
+        "opf_file",
+        "opf_dir",
+        "opf_data",
+        "version",
+        "metadata",
+        "manifest",
+        "spine",
+        "nav_href",
+        "error",
+    )
+
+    def __init__(self):
+        self.opf_file = ""
+        self.opf_dir = ""
+        self.opf_data = ""
+        self.version = "no_version"
+        self.metadata = {}
+        self.manifest = {}
+        self.spine = []
+        self.nav_href = ""
+        self.error = ""
+
+    @classmethod
+    def from_zip(cls, epub):
+        """
+        Return the epub_package of epub, a file name or binary file object.
+        """
+
+        with zipfile.ZipFile(epub) as zfile:
+            return cls.read(lambda name: zfile.read(name).decode("utf-8"))
+
+    @classmethod
+    def read(cls, read_member):
+        """
+        Return the epub_package of an epub whose members are read as text
+        by read_member(name), which raises KeyError for a missing member.
+        """
+
+        package = cls()
+        try:
+            container = read_member("META-INF/container.xml")
+        except KeyError:
+            package.error = "did not find META-INF/container.xml"
+            return package
+        match = rootfile_re.search(container)
+        opf_file = tag_attrs(match[1]).get("full-path", "") if match else ""
+        if not opf_file:
+            package.error = "did not find the rootfile full-path in container"
+            return package
+        package.opf_file = opf_file
+        package.opf_dir = opf_file[: opf_file.rfind("/") + 1]
+        try:
+            package.opf_data = read_member(opf_file)
+        except KeyError:
+            package.error = f"did not find the opf file {opf_file}"
+            return package
+        package.parse_opf()
+        return package
+
+    def fail(self, error):
+        if not self.error:
+            self.error = error
+
+    def parse_opf(self):
+        opf_data = self.opf_data
+        match = package_re.search(opf_data)
+        if match is None:
+            self.fail("did not find package string in opf file")
+        else:
+            self.version = tag_attrs(match[1]).get("version", "no_version")
+            if self.version == "no_version":
+                self.fail("did not find version string in opf file")
+        match = metadata_re.search(opf_data)
+        mdata = match[0] if match else opf_data
+        for name, text in dc_re.findall(mdata):
+            self.metadata.setdefault(name, html.unescape(text.strip()))
+        for attrs, empty, text in meta_re.findall(mdata):
+            attrs = tag_attrs(attrs)
+            if "name" in attrs:
+                self.metadata[attrs["name"]] = attrs.get("content", "")
+            elif "property" in attrs and not empty:
+                self.metadata[attrs["property"]] = html.unescape(text.strip())
+        # one pass over the manifest and spine elements
+        in_manifest = in_spine = found = False
+        for match in opf_re.finditer(opf_data):
+            close, name, attrs = match.groups()
+            if name is None:
+                continue  # a comment
+            if name == "manifest":
+                in_manifest = not close and not attrs.endswith("/")
+                found = True
+            elif name == "spine":
+                in_spine = not close and not attrs.endswith("/")
+            elif close:
+                continue
+            elif name == "item" and in_manifest:
+                attrs = tag_attrs(attrs)
+                item = manifest_item(
+                    attrs.get("id", ""),
+                    attrs.get("href", ""),
+                    attrs.get("media-type", ""),
+                    attrs.get("properties", ""),
+                )
+                self.manifest[item.id] = item
+                if not self.nav_href and "nav" in item.properties.split():
+                    self.nav_href = item.href
+            elif name == "itemref" and in_spine:
+                idref = tag_attrs(attrs).get("idref")
+                if idref:
+                    self.spine.append(idref)
+        if not found:
+            self.fail("did not find manifest element in opf file")
+        if not self.spine:
+            self.fail("spine length is zero in opf file")
+
+
+# the navMap of an ncx: navPoint elements, their label text and content
+ncx_re = re.compile(
+    r"<!--.*?-->|<(/?)(?:\w+:)?(navMap|navPoint|text|content)\b([^>]*?)/?>([^<]*)",
+    re.S,
+)
+# the attributes of an epub2 opf that epub3 does not allow, in metadata
+opf_attr_re = re.compile(r"""\s+opf:[\w-]+\s*=\s*(["']).*?\1""", re.S)
+manifest_end_re = re.compile(r"</((?:\w+:)?)manifest\s*>")
+version_re = re.compile(r"""(\bversion\s*=\s*)(["']).*?\2""")
+
+epub3_nav_template = """\
+<?xml version="1.0" encoding="utf-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" {epubns}>
+<head>
+<title>{title}</title>
+</head>
+<body>
+<nav epub:type="toc" id="toc">
+<h1>{title}</h1>
+{toc}
+</nav>
+</body>
+</html>
+"""
+
+
+def ncx_nav_points(ncx_data):
+    """
+    Return the navPoints of the navMap in ncx_data as a list of (label,
+    src, children) tuples, children being a list of the same.
+    """
+
+    roots = []
+    stack = []  # the open navPoints: [label, src, children]
+    in_map = False
+    for match in ncx_re.finditer(ncx_data):
+        close, name, attrs, text = match.groups()
+        if name is None:
+            continue  # a comment
+        if name == "navMap":
+            in_map = not close
+        elif not in_map:
+            continue
+        elif name == "navPoint":
+            if not close:
+                stack.append(["", "", []])
+            elif stack:
+                label, src, children = stack.pop()
+                (stack[-1][2] if stack else roots).append((label, src, children))
+        elif name == "text":
+            # the first text of a navPoint is its label
+            if not close and stack and not stack[-1][0]:
+                stack[-1][0] = html.unescape(text).strip()
+        elif name == "content" and stack and not stack[-1][1]:
+            stack[-1][1] = tag_attrs(attrs).get("src", "")
+    return roots
+
+
+def ncx_nav_ol(points, ncx_dir, nav_dir, indent=""):
+    """
+    Return the nested <ol> of a nav toc for points (see ncx_nav_points).
+    The src of each point, relative to ncx_dir, is made relative to
+    nav_dir.
+    """
+
+    lines = [f"{indent}<ol>"]
+    for label, src, children in points:
+        path, _, fragment = src.partition("#")
+        href = os.path.normpath(os.path.join(ncx_dir, path))
+        href = Path(os.path.relpath(href, nav_dir or ".")).as_posix()
+        if fragment:
+            href += f"#{fragment}"
+        label = html.escape(label or href, quote=False)
+        lines.append(f'{indent}  <li><a href="{html.escape(href)}">{label}</a>')
+        if children:
+            lines.append(ncx_nav_ol(children, ncx_dir, nav_dir, indent + "    "))
+        lines.append(f"{indent}  </li>")
+    lines.append(f"{indent}</ol>")
+    return CR.join(lines)
+
+
+def epub3_opf(opf_data, nav_item, modified):
+    """
+    Return (opf, error) for the epub2 opf_data. opf is an epub3 package
+    document: version 3.0, without the opf: attributes in the metadata,
+    with a dcterms:modified meta of modified if there is none, and with the
+    manifest_item nav_item added to the manifest. error is "", or describes
+    what was not found and opf is None.
+    """
+
+    match = package_re.search(opf_data)
+    if match is None:
+        return None, "did not find package string in opf file"
+    start, end = match.span(1)
+    package, count = version_re.subn(r"\g<1>\g<2>3.0\g<2>", match[1], 1)
+    if not count:
+        return None, "did not find version string in opf file"
+    opf_data = opf_data[:start] + package + opf_data[end:]
+    match = metadata_re.search(opf_data)
+    if match:
+        mdata = opf_attr_re.sub("", match[0])
+        if "dcterms:modified" not in mdata:
+            # metadata_re ends with the </metadata> tag
+            close = mdata.rfind("</")
+            meta = f'<meta property="dcterms:modified">{modified}</meta>{CR}'
+            mdata = mdata[:close] + meta + mdata[close:]
+        opf_data = opf_data[: match.start()] + mdata + opf_data[match.end() :]
+    match = manifest_end_re.search(opf_data)
+    if match is None:
+        return None, "did not find the end of the manifest in opf file"
+    item = (
+        f'<{match[1]}item id="{html.escape(nav_item.id)}" '
+        f'href="{html.escape(nav_item.href)}" '
+        f'media-type="{nav_item.media_type}" properties="nav"/>{CR}'
+    )
+    return opf_data[: match.start()] + item + opf_data[match.start() :], ""
+
 
 class epub_paginator:
     """
@@ -42,6 +1343,132 @@ class epub_paginator:
 
     **Release Notes**
 
+    **Version 3.7**
+    1. scan_file, scan_match_file, scan_sections and count_words walk each
+    section with an index cursor instead of re-slicing the remaining text
+    after every element, and scan_file and scan_match_file collect their
+    output in a list that is joined once. Run time is now linear in the
+    section size; output is unchanged.
+    1. count_words and scan_sections are replaced by scan_book, which reads
+    and tokenizes each section once and gathers the word count, section
+    page counts and matched pagebreak counts together. The section data and
+    tokens are kept for scan_file, so each section is read from disk once.
+    1. When a page boundary falls inside a text string, scan_file finds the
+    word that ends the page with a precompiled word search and splits the
+    string once, rather than copying it a character at a time and counting
+    spaces. The page break now follows the last word of the page even when
+    words are separated by newlines or the string starts with a space, and
+    a string that spans several pages gets a break for each of them.
+    scan_book counts section and book pages with the same rule, so page
+    totals match the pages placed.
+    1. Page breaks are planned for the whole book at once. scan_book keeps
+    the word count of every text string, and plan_pages finds each break
+    with a cumulative sum and a binary search (numpy is used if it is
+    installed). scan_file places the breaks from the plan instead of
+    keeping curpg and pg_wcnt counters. When pages is used instead of
+    pgwords, the page totals and section page counts are now correct.
+    1. Added workers to the configuration. If greater than 1, the section
+    files are counted and then paginated by a pool of that many processes.
+    Each section's first page comes from the page plan, so sections are
+    independent; the page-list entries are merged in spine order.
+    1. Added shard_size to the configuration. With workers, section files
+    larger than shard_size bytes are split at </p> and </div> boundaries
+    and the shards are tokenized and counted in parallel.
+    1. Added engine to the configuration. "bytes" paginates memory-mapped
+    section files without decoding them and writes the pieces of the new
+    section straight to disk, saving the decode and encode of every section
+    and the joined copy of its text.
+    1. Added engine "stream" and chunk_size to the configuration. The
+    stream engine reads, paginates and writes each section file in pieces
+    of chunk_size characters, so memory use no longer grows with the size
+    of the largest section.
+    1. Pagelines, superscripts, page links and page-list entries are
+    formatted from a render_plan, compiled once from the configuration
+    into str.format templates and reused for every page, book and worker
+    process. Fixed the pageline style of pl_color "none", which had the
+    literal text "text-align: self.pl_align".
+    1. Match mode finds the existing pagebreak elements of a section with
+    one compiled pattern and reads their labels from the element itself.
+    get_nav_pagecount indexes the nav page-list once (nav_page_index):
+    the target of each page label, the highest page and the page targets
+    in each file, which give pages and the section page counts. Only
+    entries inside the page-list <nav> are read.
+    1. Added in_memory to the configuration. If True, the members of the
+    epub are read straight from the source zip file and the output epub is
+    written in one pass as the sections are paginated; the nav and opf
+    members are changed in memory. The source is no longer copied to
+    _orig.epub, extracted to a directory and zipped again.
+    1. Members of the epub that pagination does not change (images, fonts,
+    style sheets...) are copied to the paged epub still compressed, with
+    their CRC and compression method, instead of being deflated again.
+    Only the sections, nav and opf are compressed. mimetype is still first
+    and stored.
+    1. Added compress_level to the configuration: "fast", "default" or
+    "max". The changed members are deflated at that level by a pool of
+    threads and added to the paged epub in order.
+    1. Added workdir to the configuration, the directory for temporary
+    files, which may be on a tmpfs. Only the epub files that are read
+    (container, opf, nav and the spine sections) are extracted, when they
+    are first needed; the others go straight from the source to the paged
+    epub.
+    1. Added queue_depth to the configuration. Reading, paginating and
+    writing the sections overlap in a pipeline of threads with queues of
+    queue_depth sections (pipe_stage). The time each stage waited for
+    input and output is logged and kept in rdict["pipeline"].
+    1. Added paginate_bytes, which paginates an epub given as bytes or a
+    binary file object and returns the paged epub as bytes, with no files
+    written. epubpaginator.py paginates stdin to stdout when the ePub_file
+    is "-".
+    1. Added cache_dir, cache_size and cache_age to the configuration. With
+    cache_dir, paged epubs and their rdict are cached (disk_cache) under a
+    key made of the sha256 of the source, computed while it is copied, and
+    of the settings. A cache hit is hard linked into outdir. Entries are
+    evicted by age and size; epubpaginator.py --cache_stats prints the
+    cache statistics.
+    1. The container and opf file are parsed once per archive into an
+    epub_package: the opf path, version, metadata, the manifest as a
+    dictionary of manifest_item by id, the spine and the nav href. It
+    replaces read_opf, find_opf, simple_epub_version and the separate
+    parsing in get_epub_version and initialize; GUIepubpager's read_opf
+    uses it too. A spine idref is looked up in the manifest dictionary.
+    1. The manifest and spine are read in one pass of a compiled scanner
+    instead of repeatedly slicing the opf data. It accepts any namespace
+    prefix, single quoted attributes and item elements that are not
+    self-closing, and skips comments.
+    1. Page-list entries are kept as page_targets, an array of (page, href
+    index) pairs, and rendered once when the nav file is updated.
+    update_navfile copies the nav file in one streaming pass, inserting the
+    page-list before </body> and adding the xmlns:epub namespace if it is
+    missing.
+    1. With chk_orig, epubcheck of the original epub runs on a thread while
+    the book is paginated (start_chk_orig) and its log and results are
+    added when it is joined (join_chk_orig), before the paged epub is
+    checked. paginate_time no longer subtracts epubchkorig_time and the
+    total processing time is the elapsed time.
+    1. Added chk_service to the configuration, the path of epubcheck.jar.
+    With it, epubcheck runs in persistent java processes (chk_service)
+    that read epub paths from a pipe and return the status and report of
+    each check, so the JVM starts once per batch. The external epubcheck
+    or the python module is used if the service fails.
+    1. Added chk_cache to the configuration. With it and cache_dir, the
+    results and log messages of run_chk are cached in cache_dir/epubcheck,
+    keyed by the sha256 of the file checked and chk_version, and a file
+    checked before is not checked again. The paged epubs and the epubcheck
+    results share one cache_size budget; cache_age applies to both.
+    ePubZip dates the members it writes as in the source, as in_memory
+    does, so the same book and settings give the same paged epub.
+    1. Added chk_native to the configuration, a check of the paged epub
+    that does not need epubcheck (run_chk_native). The files rewritten by
+    pagination are parsed as XML, in worker processes with workers, and a
+    generated page-list is checked for missing pages and links that do not
+    resolve to an inserted pagelink id. The count is native_error in rdict.
+    1. ebookconvert may be "native": an epub2 is then upgraded to epub3
+    without ebook-convert (upgrade_epub). The opf file gets version 3.0, a
+    dcterms:modified meta and a nav manifest item without opf: attributes
+    in the metadata, and a nav file is made from the ncx toc, or from the
+    spine if there is no ncx. The other members are copied still
+    compressed.
+
     ** Version 3.6**
     1. Metadata added to opf file with words, pages, modified by epubpager notation.
     2. Fixed a bug in logic that caused no pagination under circumstances where
@@ -294,13 +1721,21 @@ class epub_paginator:
     1. Adds chapter page numbering.
     """
 
-    version = "3.6"
-    curpg = 1  # current page number
+    version = "3.7"
     tot_wcnt = 0  # count of total words in the book
-    pg_wcnt = 0  # word count per page
-    plist = ""  # the page-list element for the nav file
+    run_words = []  # word count of every text string in the book
+    first_runs = []  # index in run_words of each section's first text string
+    plist = None  # page_targets of the page-list for the nav file
+    plan = None  # render_plan of the configuration, see get_plan()
+    nav_index = None  # nav_page_index of the existing page-list when matching
     bk_flist = []  # list of all files in the epub
     logpath = Path()  # path for the logfile
+    log_lines = None  # if a list, wrlog collects (stdout, message) here
+    chk_orig_job = None  # (thread, epub_paginator) of start_chk_orig
+    log_stream = None  # if a text stream, wrlog writes the log there
+    zin = None  # with in_memory, the source epub ZipFile
+    package = None  # epub_package of the epub being paginated
+    zout = None  # with in_memory, the paged epub ZipFile being written
     epub_file = ""  # this will be the epub to paginate
 
     rdict = {}
@@ -332,6 +1767,8 @@ class epub_paginator:
         "convert_time": 0,  # time to convert from epub2 to epub3
         "paginate_time": 0,  # time to paginate the epub
         "epubchkpage_time": 0,  # time to run epubcheck on paged epub
+        "native_error": 0,  # problems found by run_chk_native
+        "chknative_time": 0,  # time to run run_chk_native
         "epubchkorig_time": 0,  # time to run epubcheck on original epub
         "messages": "",  # list of messages generated.
     }
@@ -346,6 +1783,12 @@ class epub_paginator:
 
         full os path for placement of the paginated ePub file.
 
+        **_workdir_**
+
+        Directory for the temporary files of a book: the unzipped epub,
+        the copy of the source and the converted epub. It can be on a
+        tmpfs. If empty, outdir is used.
+
         **_match_**
 
         Boolean, if book is paginated, match super and pageline insertion
@@ -424,7 +1867,9 @@ class epub_paginator:
         **_ebookconvert_**
 
         The OS path of the ebook conversion program. If present, epub2
-        books are converted to epub3 before pagination.
+        books are converted to epub3 before pagination. If "native", epub2
+        books are upgraded to epub3 by upgrade_epub, which adds a nav file
+        made from the ncx and does not change the content.
 
         **_chk_orig_**
 
@@ -434,6 +1879,89 @@ class epub_paginator:
 
         Run epubcheck on the paged epub after pagination
 
+        **_workers_**
+
+        Number of processes used to scan and paginate the section files in
+        parallel. 0 or 1 handles the sections one after another.
+
+        **_shard_size_**
+
+        When workers is greater than 1, a section file larger than
+        shard_size bytes is split at </p> and </div> boundaries into
+        shards of at least this size which are tokenized in parallel. 0
+        disables sharding.
+
+        **_engine_**
+
+        "text" decodes each section file and writes it back as text.
+        "bytes" memory-maps the section files and paginates the undecoded
+        bytes, only text strings holding non-ASCII characters are decoded
+        to count their words. Line endings are left as they are. "stream"
+        reads and writes each section file in pieces of chunk_size
+        characters so memory use does not grow with the size of the
+        section. Matching existing pagination always uses "text".
+
+        **_chunk_size_**
+
+        Size in characters of the pieces read by the "stream" engine.
+
+        **_in_memory_**
+
+        Boolean. If True, read the epub members directly from the source
+        file and write the paged epub in one pass instead of copying the
+        source, extracting it to a directory and zipping it again.
+
+        **_compress_level_**
+
+        "fast", "default" or "max": the zlib compression level of the
+        epub members changed by pagination. Members are deflated by a pool
+        of threads.
+
+        **_queue_depth_**
+
+        When the sections are not handled by worker processes or the
+        "stream" engine, a thread reads the next sections and another
+        writes the previous ones while one is paginated. queue_depth is
+        the number of sections each may hold. 0 reads, paginates and
+        writes each section in turn.
+
+        **_cache_dir_**
+
+        If set, directory of a cache of paged epubs. A book whose source
+        and settings match a cached one is not paginated again, the cached
+        paged epub is hard linked into outdir. Empty disables the cache.
+
+        **_cache_size_**
+
+        Size of the cache in megabytes, shared by the paged epubs and the
+        epubcheck results of chk_cache. The least recently used entries are
+        evicted beyond it.
+
+        **_cache_age_**
+
+        Books not used for cache_age days are evicted from the cache.
+
+        **_chk_service_**
+
+        The OS path of epubcheck.jar. If set, epubcheck runs in java
+        processes that are kept for the next check (see chk_service), so
+        the JVM is not started for every check. Empty starts epubcheck for
+        each check.
+
+        **_chk_cache_**
+
+        If True and cache_dir is set, the results of epubcheck are kept in
+        the cache, by the hash of the file checked and the epubcheck used,
+        and a file is not checked again. They count toward cache_size with
+        the paged epubs and are evicted after cache_age days unused.
+
+        **_chk_native_**
+
+        Check the paged epub without epubcheck (see run_chk_native): the
+        files changed by pagination must be well-formed XML and the
+        generated page-list complete, with every link resolving. Much
+        faster than chk_paged.
+
         **_quiet_**
 
         Do not print anything to stdout.
@@ -444,6 +1972,7 @@ class epub_paginator:
 
         """ 
         self.outdir = "/Users/tbrown/Documents/projects/" "BookTally/paged_epubs"
+        self.workdir = ""
         self.genplist = True
         self.match = True
         self.pgwords = 300
@@ -464,6 +1993,19 @@ class epub_paginator:
         self.chk_orig = False
         self.chk_paged = False
         self.epubcheck = "none"  # path to epubcheck executable
+        self.workers = 0
+        self.shard_size = 1000000
+        self.engine = "text"
+        self.chunk_size = 65536
+        self.in_memory = False
+        self.compress_level = "default"
+        self.queue_depth = 2
+        self.cache_dir = ""
+        self.cache_size = 1000
+        self.cache_age = 30
+        self.chk_service = ""
+        self.chk_cache = False
+        self.chk_native = False
         self.quiet = False
         self.DEBUG = False
 
@@ -483,11 +2025,22 @@ class epub_paginator:
 
         **_bk_flist_** -- the list of files to zip into the epub file
 
+        Files that pagination did not change (see paged_members) are copied
+        from epub_file still compressed, the others are deflated at
+        compress_level by a pool of threads and added in order.
+
         """
         with zipfile.ZipFile(epub_path, "w") as myzip:
             if "mimetype" in bk_flist:
                 mpath = srcfiles_path / "mimetype"
-                myzip.write(mpath, "mimetype")
+                self.extract_members([mpath])
+                # dated as in the source, as every member is, so the paged
+                # epub depends only on its content
+                with zipfile.ZipFile(self.epub_file) as srczip:
+                    orig = srczip.getinfo("mimetype")
+                info = zipfile.ZipInfo("mimetype", date_time=orig.date_time)
+                info.external_attr = orig.external_attr
+                myzip.writestr(info, mpath.read_bytes())
                 # myzip.write(srcfiles_path + "/" + "mimetype", "mimetype")
                 bk_flist.remove("mimetype")
             else:
@@ -496,13 +2049,154 @@ class epub_paginator:
                     self.wrlog(False, "bk_flist: ")
                     self.wrlog(False, bk_flist)
                 sys.exit("Fatal error, no mimetype file was found.")
-        with zipfile.ZipFile(epub_path, "a", zipfile.ZIP_DEFLATED) as myzip:
+        paged = self.paged_members()
+        level = self.zip_level()
+
+        def deflate_file(ifile):
+            return deflate(Path(f"{srcfiles_path}/{ifile}").read_bytes(), level)
+
+        with zipfile.ZipFile(
+            epub_path, "a", zipfile.ZIP_DEFLATED
+        ) as myzip, zipfile.ZipFile(
+            self.epub_file
+        ) as srczip, ThreadPoolExecutor() as pool:
+            # a file that was never extracted was not changed
+            jobs = {
+                ifile: pool.submit(deflate_file, ifile)
+                for ifile in bk_flist
+                if Path(os.path.normpath(ifile)).as_posix() in paged
+                and Path(f"{srcfiles_path}/{ifile}").is_file()
+            }
             for ifile in bk_flist:
-                myzip.write(f"{srcfiles_path}/{ifile}", ifile, zipfile.ZIP_DEFLATED)
+                if ifile not in jobs:
+                    zip_copy_raw(srczip, srczip.getinfo(ifile), myzip)
+                    continue
+                info = zipfile.ZipInfo.from_file(f"{srcfiles_path}/{ifile}", ifile)
+                orig = srczip.getinfo(ifile)
+                info.date_time = orig.date_time
+                info.external_attr = orig.external_attr
+                zip_write_deflated(myzip, info, jobs.pop(ifile).result(), level)
+
+    def work_dir(self):
+        """
+        Return the directory for the temporary files of a book: workdir, or
+        outdir if workdir is not set.
+        """
+
+        return self.workdir or self.outdir
+
+    def cache(self, subdir=""):
+        """
+        Return the disk_cache of cache_dir, or of its subdirectory subdir.
+        The caches in cache_dir (see cache_subdirs) share cache_size.
+        """
+
+        shared = [Path(self.cache_dir, other) for other in cache_subdirs]
+        shared.remove(Path(self.cache_dir, subdir))
+        return disk_cache(
+            Path(self.cache_dir, subdir),
+            self.cache_size * 1000000,
+            self.cache_age,
+            shared,
+        )
+
+    def cache_key(self, source_epub, digest=None, settings=None):
+        """
+        Return the cache key of a book: a hash of the sha256 digest of the
+        source epub, computed here if digest is None, and of every setting
+        that changes the paged epub or rdict. settings is the configuration
+        the book is paginated with, by default self.settings().
+        """
+
+        if digest is None:
+            if hasattr(source_epub, "read"):
+                digest = stream_digest(source_epub)
+            else:
+                with open(source_epub, "rb") as rfile:
+                    digest = stream_digest(rfile)
+        if settings is None:
+            settings = self.settings()
+        settings = {
+            key: val for key, val in settings.items() if key not in cache_neutral
+        }
+        settings["version"] = self.version
+        fingerprint = json.dumps(settings, sort_keys=True)
+        return hashlib.sha256(f"{digest}:{fingerprint}".encode()).hexdigest()
+
+    def cache_fetch(self, key):
+        """
+        Look up key in the cache. On a hit the cached paged epub is hard
+        linked to bk_outfile (or read into it for paginate_bytes), rdict is
+        updated from the cached one, and True is returned.
+        """
+
+        entry = self.cache().get(key)
+        if entry is None:
+            self.wrlog(False, f"Not found in cache: {key}")
+            return False
+        cached = json.loads((entry / "rdict.json").read_text(encoding="utf-8"))
+        for name in ("logfile", "bk_outfile", "unzip_path", "messages"):
+            cached.pop(name, None)
+        self.rdict.update(cached)
+        if isinstance(self.rdict["bk_outfile"], io.BytesIO):
+            self.rdict["bk_outfile"].write((entry / "paged.epub").read_bytes())
+        else:
+            link_or_copy(entry / "paged.epub", self.rdict["bk_outfile"])
+        self.wrlog(True, f"Found in cache: {entry}")
+        self.wrlog(True, f"The paged epub is at: {self.rdict['bk_outfile']}" + CR)
+        return True
+
+    def cache_store(self, key):
+        """
+        Add the paged epub and rdict of a book to the cache as entry key.
+        """
+
+        bk_outfile = self.rdict["bk_outfile"]
+        if isinstance(bk_outfile, io.BytesIO):
+            paged = bk_outfile.getvalue()
+        else:
+            paged = Path(bk_outfile)
+        record = {
+            key: val
+            for key, val in self.rdict.items()
+            if key not in ("bk_outfile", "messages")
+        }
+        entry = self.cache().put(
+            key,
+            {
+                "paged.epub": paged,
+                "rdict.json": json.dumps(record, default=str).encode("utf-8"),
+            },
+        )
+        self.wrlog(False, f"Stored in cache: {entry}")
+
+    def zip_level(self):
+        """
+        Return the zlib compression level of compress_level.
+        """
+
+        return zip_levels.get(self.compress_level, zlib.Z_DEFAULT_COMPRESSION)
+
+    def paged_members(self):
+        """
+        Return the set of names of the epub files rewritten by pagination:
+        the spine sections and the nav and opf files.
+        """
+
+        paged = {
+            self.member_name(self.section_path(chapter))
+            for chapter in self.rdict["spine_lst"]
+        }
+        for key in ("nav_file", "opf_file"):
+            if self.rdict[key] != "None":
+                paged.add(self.member_name(self.rdict[key]))
+        return paged
 
     def ePubUnZip(self, fileName, unzip_path):
         """
-        Unzip ePub file into a directory
+        Prepare to unzip ePub file into a directory. Only the files that
+        are read are extracted, when they are first needed (see
+        extract_members); the others are copied from fileName by ePubZip.
 
         **Keyword arguments:**
 
@@ -512,10 +2206,28 @@ class epub_paginator:
 
         """
 
-        z = zipfile.ZipFile(fileName)
-        self.bk_flist = z.namelist()
-        z.extractall(unzip_path)
-        z.close()
+        with zipfile.ZipFile(fileName) as z:
+            self.bk_flist = z.namelist()
+        unzip_path.mkdir(parents=True, exist_ok=True)
+
+    def extract_members(self, paths):
+        """
+        Extract the epub files at paths in unzip_path from epub_file if they
+        are not there yet. Does nothing with in_memory.
+        """
+
+        if self.zin is not None:
+            return
+        members = set(self.bk_flist)
+        names = [
+            self.member_name(path) for path in paths if not Path(path).exists()
+        ]
+        names = [name for name in names if name in members]
+        if not names:
+            return
+        with zipfile.ZipFile(self.epub_file) as z:
+            for name in names:
+                z.extract(name, self.rdict["unzip_path"])
 
     def get_version(self):
         """
@@ -527,17 +2239,33 @@ class epub_paginator:
     def convert_epub(self):
         """
         Called when epub is not version 3 and we have a convert program. Calls
-        convert. If successful points epub_file to the converted file. If
-        unsuccessful, throws a fatal error.
+        convert, or upgrade_epub if ebookconvert is "native". If successful
+        points epub_file to the converted file. If unsuccessful, throws a
+        fatal error.
         """
 
         ebconvert = Path(self.ebookconvert)
         cnvrt_t1 = time.perf_counter()
+        if self.in_memory:
+            # epub_file is the source, keep the converted copy in workdir
+            epub3_file = f"{self.work_dir()}/{self.rdict['title']}_epub3.epub"
+        else:
+            epub3_file = self.epub_file.replace(".epub", "_epub3.epub")
+        if self.ebookconvert == "native":
+            self.wrlog(True, "    Converting to epub3 natively")
+            self.upgrade_epub(epub3_file)
+            self.rdict["convert_time"] = time.perf_counter() - cnvrt_t1
+            self.wrlog(
+                True,
+                f"    native conversion took {self.rdict['convert_time']:.2f} seconds.",
+            )
+            if not self.rdict["pager_error"]:
+                self.converted_epub(epub3_file)
+            return
         self.wrlog(
             True,
             (f"    Converting to epub3 using {ebconvert}"),
         )
-        epub3_file = self.epub_file.replace(".epub", "_epub3.epub")
         ebkcnvrt_cmd = [
             ebconvert,
             self.epub_file,
@@ -560,23 +2288,7 @@ class epub_paginator:
         if result.returncode == 0:
             self.wrlog(False, "Conversion log:")
             self.wrlog(False, result.stdout)
-            self.epub_file = epub3_file
-            # now try again on version
-            v = self.get_epub_version(self.epub_file)
-            self.rdict["epub_version"] = v
-            if self.rdict["epub_version"] == "no_version":
-                estr = (
-                    "Fatal error: After conversion, version was "
-                    "not found in the ePub file."
-                )
-                self.wrlog(True, estr)
-                self.rdict["error_lst"].append(estr)
-                self.rdict["pager_error"] = True
-                return
-            lstr = f"Paginating epub3 file: {self.epub_file}"
-            self.wrlog(True, lstr)
-            self.plist = pg_xmlns
-            self.rdict["converted"] = True
+            self.converted_epub(epub3_file)
         else:
             lstr = "Conversion to epub3 failed. Conversion reported:"
             self.wrlog(False, lstr)
@@ -586,81 +2298,145 @@ class epub_paginator:
             self.rdict["pager_error"] = True
             return
 
-    def initialize(self):
+    def converted_epub(self, epub3_file):
         """
-        Gather useful information about the epub file and put it in the
-        rdict dictionary.
-
-        **Instance Variables**
-
+        Point epub_file and package to epub3_file, the converted epub.
         """
 
-        # find the opf file using the META-INF/container.xml file
-        # operate from the unzipped epub
-        opf_file = self.find_opf(self.rdict["unzip_path"])
-        # Watch Out!!
-        self.rdict["opf_file"] = opf_file
-        if self.rdict["pager_error"]:
-            return
-        self.rdict["disk_path"] = ""
-        opf_path = opf_file.split("/")
-        if opf_path:
-            for index in range(0, len(opf_path) - 1):
-                self.rdict["disk_path"] += f"{opf_path[index]}/"
-        else:
+        self.epub_file = epub3_file
+        # now try again on version
+        self.package = epub_package.from_zip(self.epub_file)
+        self.rdict["epub_version"] = self.package.version
+        if self.rdict["epub_version"] == "no_version":
+            estr = (
+                "Fatal error: After conversion, version was "
+                "not found in the ePub file."
+            )
+            self.wrlog(True, estr)
+            self.rdict["error_lst"].append(estr)
             self.rdict["pager_error"] = True
-            self.wrlog(False, "Fatal error: opf file not found")
             return
-        opf_filep = Path(opf_file)
-        opfdata = opf_filep.read_text(encoding="utf-8")
-        self.parse_opf(opfdata)
+        lstr = f"Paginating epub3 file: {self.epub_file}"
+        self.wrlog(True, lstr)
+        self.rdict["converted"] = True
 
-    def simple_epub_version(self) -> str:
+    def upgrade_epub(self, epub3_file):
+        """
+        Write epub3_file, epub_file upgraded to epub3 without ebook-convert.
+        The opf file becomes an epub3 package (see epub3_opf) whose manifest
+        has a nav file, made next to the opf file from the toc of the ncx
+        or, if there is none, from the spine. The other members are copied
+        still compressed, so the content is not changed.
+        """
 
-        # find the opf file using the META-INF/container.xml file
-        # operate from the unzipped epub
-        opf_file = self.find_opf(self.rdict["unzip_path"])
-        if self.rdict["pager_error"]:
-            return "no_version"
-        self.rdict["disk_path"] = ""
-        opf_path = opf_file.split("/")
-        if opf_path:
-            for index in range(0, len(opf_path) - 1):
-                self.rdict["disk_path"] += f"{opf_path[index]}/"
-        else:
-            self.rdict["pager_error"] = True
-            self.wrlog(False, "Fatal error: opf file not found")
-            return "no_version"
-        opf_filep = Path(opf_file)
-        opfdata = opf_filep.read_text(encoding="utf-8")
-
-        loc = opfdata.find("<package")
-        if loc != -1:
-            opfdata = opfdata[loc:]
-            vloc = opfdata.find("version")
-            if vloc != -1:
-                vlist = opfdata[vloc : vloc + 15].split('"')
-                eversion = vlist[1]
-                return eversion
-            else:
-                estr = "Fatal error: Did not find version string in opf file."
-                self.wrlog(False, estr)
+        package = self.package
+        ncx = toc = None
+        for item in package.manifest.values():
+            if item.media_type == "application/x-dtbncx+xml":
+                ncx = item
+                break
+        nav_href = "nav.xhtml"
+        with zipfile.ZipFile(self.epub_file) as srczip:
+            names = set(srczip.namelist())
+            count = 0
+            while f"{package.opf_dir}{nav_href}" in names:
+                count += 1
+                nav_href = f"nav_{count}.xhtml"
+            nav_name = f"{package.opf_dir}{nav_href}"
+            nav_dir = os.path.dirname(nav_name)
+            if ncx is not None:
+                ncx_name = package.opf_dir + urllib.parse.unquote(ncx.href)
+                try:
+                    ncx_data = srczip.read(ncx_name).decode("utf-8")
+                except KeyError:
+                    self.wrlog(True, f"    Did not find the ncx file {ncx_name}")
+                except UnicodeDecodeError:
+                    self.wrlog(True, f"    The ncx file {ncx_name} is not utf-8")
+                else:
+                    points = ncx_nav_points(ncx_data)
+                    if points:
+                        ncx_dir = os.path.dirname(package.opf_dir + ncx.href)
+                        toc = ncx_nav_ol(points, ncx_dir, nav_dir)
+            if toc is None:
+                self.wrlog(True, "    The nav toc is made from the spine.")
+                points = [
+                    (Path(item.href).stem, item.href, [])
+                    for item in map(package.manifest.get, package.spine)
+                    if item is not None
+                ]
+                toc = ncx_nav_ol(points, package.opf_dir, nav_dir)
+            title = package.metadata.get("dc:title", self.rdict["title"])
+            nav_data = epub3_nav_template.format(
+                epubns=epubns, title=html.escape(title, quote=False), toc=toc
+            )
+            ids = set(package.manifest)
+            nav_id = "nav"
+            count = 0
+            while nav_id in ids:
+                count += 1
+                nav_id = f"nav_{count}"
+            nav_item = manifest_item(
+                nav_id, urllib.parse.quote(nav_href), "application/xhtml+xml", "nav"
+            )
+            # dated as the opf file, so the upgrade depends only on the source
+            opf_info = srczip.getinfo(package.opf_file)
+            modified = "{:04}-{:02}-{:02}T{:02}:{:02}:{:02}Z".format(
+                *opf_info.date_time
+            )
+            opf_data, error = epub3_opf(package.opf_data, nav_item, modified)
+            if error:
+                estr = f"Fatal error: the opf file was not upgraded to epub3: {error}"
+                self.wrlog(True, estr)
                 self.rdict["error_lst"].append(estr)
                 self.rdict["pager_error"] = True
-                return "no version"
-        else:
-            estr = "Fatal error: Did not find package string in opf file."
+                return
+            level = self.zip_level()
+            with zipfile.ZipFile(epub3_file, "w") as myzip:
+                for orig in srczip.infolist():
+                    if orig.filename == package.opf_file:
+                        info = zipfile.ZipInfo(orig.filename, orig.date_time)
+                        info.external_attr = orig.external_attr
+                        opf_bytes = opf_data.encode("utf-8")
+                        info.file_size = len(opf_bytes)
+                        deflated = deflate(opf_bytes, level)
+                        zip_write_deflated(myzip, info, deflated, level)
+                    else:
+                        zip_copy_raw(srczip, orig, myzip)
+                info = zipfile.ZipInfo(nav_name, opf_info.date_time)
+                info.external_attr = opf_info.external_attr
+                nav_bytes = nav_data.encode("utf-8")
+                info.file_size = len(nav_bytes)
+                zip_write_deflated(myzip, info, deflate(nav_bytes, level), level)
+        self.wrlog(True, f"    Added nav file {nav_name} to the epub3 package.")
+
+    def initialize(self):
+        """
+        Gather useful information about the epub file from its
+        epub_package and put it in the rdict dictionary.
+
+        **Instance Variables**
+
+        """
+
+        package = self.package
+        if package.error:
+            estr = f"Fatal error: {package.error}"
+            self.wrlog(False, estr)
             self.rdict["error_lst"].append(estr)
             self.rdict["pager_error"] = True
-            self.wrlog(False, estr)
-            return "no version"
+            return
+        # operate from the unzipped epub
+        self.rdict["opf_file"] = f"{self.rdict['unzip_path']}/{package.opf_file}"
+        self.rdict["disk_path"] = f"{self.rdict['unzip_path']}/{package.opf_dir}"
+        self.rdict["manifest"] = package.manifest
+        self.rdict["spine_lst"] = list(package.spine)
 
     def get_epub_version(self, epub_file):
         """
         Return ePub version of ePub file
 
         If ePub does not store the version information in the standard
-        location, return 'no version'
+        location, return 'no_version'
 
         **Instance Variables**
 
@@ -670,67 +2446,16 @@ class epub_paginator:
 
         """
 
-        zfile = zipfile.ZipFile(epub_file)
-        # find the opf file, which contains the version information
-        contain_data = zfile.read("META-INF/container.xml")
-        contain_str = str(contain_data)
-        rloc = contain_str.find("<rootfiles>")
-        if rloc == -1:
-            self.wrlog(False, f"Did not find <rootfiles> in container.")
-            estr = "ABORTING: did not find <rootfiles> in container"
-            self.rdict["error_lst"].append(estr)
-            self.wrlog(False, estr)
-            self.wrlog(False, "Convert to ePub3 and try again.")
-            return "no_version"
-        contain_str = contain_str[rloc + 3 :]
-        rloc = contain_str.find("<rootfile")
-        if rloc == -1:
-            self.wrlog(False, f"Did not find <rootfile in container.")
-            estr = "ABORTING: did not find <rootfile in container"
-            self.rdict["error_lst"].append(estr)
-            self.wrlog(False, estr)
-            self.wrlog(False, "Convert to ePub3 and try again.")
-            return "no_version"
-        contain_str = contain_str[rloc + 3 :]
-        rloc = contain_str.find("full-path=")
-        if rloc == -1:
-            self.wrlog(False, f"Did not find full-path in container.")
-            estr = "ABORTING: did not find full-path in container"
-            self.rdict["error_lst"].append(estr)
-            self.wrlog(False, estr)
-            self.wrlog(False, "Convert to ePub3 and try again.")
-            return "no_version"
-        contain_str = contain_str[rloc + 3 :]
-        opflist = contain_str.split('"')
-        opf_file = opflist[1]
-        opf = zfile.read(opf_file)
-        opf_str = str(opf)
-
-        # first find the <package element
-        ploc = opf_str.find("<package")
-        if ploc == -1:
-            self.wrlog(
-                True, "get_epub_version: Did not find package string in opf file"
-            )
-            return "no version"
-        else:
-            # find the version= string
-            opf_str = opf_str[ploc:]
-            vloc = opf_str.find("version=")
-            if vloc == -1:
-                self.wrlog(
-                    True, "get_epub_version: Did not find version string in opf file"
-                )
-                return "no version"
-            else:
-                vlist = opf_str[vloc : vloc + 15].split('"')
-                eversion = vlist[1]
-                return eversion
+        package = epub_package.from_zip(epub_file)
+        if package.error:
+            self.wrlog(True, f"get_epub_version: {package.error}")
+        return package.version
 
     def get_nav_pagecount(self):
         """
-        Read the nav file and parse the page-list entries to find the
-        total pages in the book
+        Read the nav file and index its page-list entries in
+        self.nav_index. Return the total pages in the book, the highest
+        numbered page.
 
         **Instance Variables**
 
@@ -738,10 +2463,8 @@ class epub_paginator:
 
         """
 
-        with self.rdict["nav_file"].open("r") as nav_r:
-            nav_data = nav_r.read()
-        loc = nav_data.find('epub:type="page-list"')
-        if loc == -1:
+        nav_data = self.read_member(self.rdict["nav_file"])
+        if nav_data.find('epub:type="page-list"') == -1:
             # this should never happen since we get here only after the entry
             # was found
             sys.exit(
@@ -750,32 +2473,13 @@ class epub_paginator:
                     "after having been initially found."
                 )
             )
-        nav_data = nav_data[loc:]
-        not_done = True
-        max_page = 0
-        while not_done:
-            loc = nav_data.find("<a href")
-            if loc == -1:
-                not_done = False
-                continue
-            nav_data = nav_data[loc:]
-            loc = nav_data.find('">')
-            if loc == -1:
-                self.wrlog(False, "Unclosed '<a href' element in nav file.")
-                self.wrlog(False, "Does this file pass epubcheck?")
-                self.rdict["pager_error"] = True
-                return 0
-            loc += 2
-            nav_data = nav_data[loc:]
-            loc2 = nav_data.find("</a>")
-            if loc2 == -1:
-                self.wrlog(False, "'</a>' element not found in nav file.")
-                self.wrlog(False, "Does this file pass epubcheck?")
-                self.rdict["pager_error"] = True
-                return 0
-            if nav_data[:loc2].isdigit():
-                if int(nav_data[:loc2]) > max_page:
-                    max_page = int(nav_data[:loc2])
+        self.nav_index = nav_page_index(nav_data, str(self.rdict["nav_file"].parent))
+        if self.nav_index.unclosed:
+            self.wrlog(False, "Unclosed '<a href' element in nav file.")
+            self.wrlog(False, "Does this file pass epubcheck?")
+            self.rdict["pager_error"] = True
+            return 0
+        max_page = self.nav_index.max_page
         self.wrlog(False, f"Nav pagelist page count is: {max_page}")
         return max_page
 
@@ -794,9 +2498,16 @@ class epub_paginator:
         The message to print
 
         """
+        if self.log_lines is not None:
+            # a worker process, the calling process writes the log
+            self.log_lines.append((stdout, message))
+            return
         if stdout and not self.quiet:
             print(message)
             self.rdict["messages"] += "\n" + message
+        if self.log_stream is not None:
+            self.log_stream.write(message + "\n")
+            return
         with self.logpath.open("a") as logfile:
             logfile.write(message + "\n")
 
@@ -808,8 +2519,7 @@ class epub_paginator:
             # <meta name="tlbepubpager:pages" content="197"/>
             # <meta name="tlbepubpager:modified" content="True"/>
         """
-        with Path(self.rdict["opf_file"]).open("r") as opf_file_read:
-            opf_data = opf_file_read.read()
+        opf_data = self.read_member(Path(self.rdict["opf_file"]))
         mloc = opf_data.find("</metadata>")
         if mloc != -1:
             self.wrlog(True,f"Found end of metadata: {opf_data[mloc-20:mloc+20]}")
@@ -821,31 +2531,63 @@ class epub_paginator:
             new_opf += f'''<meta name="tlbepubpager:modified" content="True"/>'''
             new_opf += CR
             new_opf += opf_data[mloc:]
-            with Path(self.rdict["opf_file"]).open("w") as opf_file_write:
-                opf_file_write.write(new_opf)
+            self.write_member(Path(self.rdict["opf_file"]), new_opf)
         else:
             self.wrlog(True,f"Did not find end of metadata")
 
     def update_navfile(self):
         """
-        Add generated page-list element to the ePub navigation file
-        Verify that nav file has proper xmlns. If not fix it.
+        Add the generated page-list element to the ePub navigation file,
+        copying it in one streaming pass. Verify that the nav file has the
+        xmlns:epub namespace. If not, add it (see chk_xmlns).
         """
 
-        with self.rdict["nav_file"].open("r") as nav_file_read:
-            nav_data = nav_file_read.read()
-        pagelist_loc = nav_data.find("</body>")
-        new_nav_data = nav_data[:pagelist_loc]
-        new_nav_data += self.plist
-        with self.rdict["nav_file"].open("w") as nav_file_write:
-            nav_file_write.write(new_nav_data)
-            nav_file_write.write(nav_data[pagelist_loc:])
+        nav_file = self.rdict["nav_file"]
+        plist = self.plist.render(self.plan.page_entry)
+        body_end = "</body>"
+        pending = ""  # read but not yet written
+        fixed = placed = False
+        with self.open_member(nav_file) as rfile:
+            wfile = self.create_member(nav_file)
+            chunks = iter(lambda: rfile.read(self.chunk_size), "")
+            for data in itertools.chain(chunks, [None]):
+                last = data is None
+                if not last:
+                    pending += data
+                if not fixed:
+                    loc = pending.find("<html")
+                    if not last and (loc == -1 or pending.find(">", loc) == -1):
+                        continue  # the html start tag is not complete
+                    checked = self.chk_xmlns(pending)
+                    if checked is None:
+                        # the error is logged, the nav file is left as it was
+                        self.discard_member(nav_file, wfile)
+                        return
+                    pending = checked
+                    fixed = True
+                if not placed:
+                    loc = pending.find(body_end)
+                    if loc == -1 and not last:
+                        # keep what may be the start of a split </body>
+                        keep = max(len(pending) - len(body_end) + 1, 0)
+                        wfile.write(pending[:keep])
+                        pending = pending[keep:]
+                        continue
+                    if loc == -1:
+                        self.wrlog(False, "Did not find </body> in the nav file.")
+                        loc = len(pending)
+                    wfile.write(pending[:loc])
+                    wfile.write(plist)
+                    pending = pending[loc:]
+                    placed = True
+                wfile.write(pending)
+                pending = ""
+            self.close_member(nav_file, wfile)
 
     def add_plist_target(self, curpg, href):
         """
-        Generate page-list entry and page pageline and add them to a
-        string that accumulates them for placement in the navigation
-        file.
+        Add the page-list entry of a page to plist, the page_targets placed
+        in the navigation file.
 
         **Keyword arguments:**
 
@@ -859,13 +2601,23 @@ class epub_paginator:
 
         """
 
-        self.plist += f'  <li><a href="{href}#{pglnk}{curpg}">{curpg}</a></li>'
-        self.plist += CR
-        return
+        self.plist.add(curpg, href)
+
+    def get_plan(self):
+        """
+        Return the render_plan of the current configuration. The plan is
+        compiled again only if a setting it depends on has changed.
+        """
+
+        settings = {key: getattr(self, key) for key in render_keys}
+        if self.plan is None or self.plan.settings != settings:
+            self.plan = render_plan(settings)
+        return self.plan
 
     def bld_pageline(self, curpg, sct_pg, sct_pgcnt):
         """
-        Format and return page pageline.
+        Format and return page pageline. The pagination scans use the
+        equivalent render_plan.pageline.
 
         **Keyword arguments:**
         **_curpg_**
@@ -927,7 +2679,8 @@ class epub_paginator:
             else:
                 pageline = (
                     f'<p style="font-size:{self.pl_fntsz}; '
-                    f'text-align: self.pl_align; margin: 0 0 0 0">'
+                    f"text-align:{self.pl_align}; "
+                    f'margin: 0 0 0 0">'
                     f"{pagestr}</p>"
                 )
         else:
@@ -949,7 +2702,8 @@ class epub_paginator:
     def new_super(self, curpg, sct_pg, sct_pgcnt):
         """
         Format and return a <span> element for superscripted page
-        numbering.
+        numbering. The pagination scans use the equivalent
+        render_plan.superscript.
 
         **Keyword arguments:**
         **_curpg_**
@@ -1029,7 +2783,7 @@ class epub_paginator:
 
         opf_list = self.rdict["opf_file"].split("/")
         nav_list = str(self.rdict["nav_item"]).split("/")
-        manifest_list = manifest_item["href"].split("/")
+        manifest_list = manifest_item.href.split("/")
         manifest_fnm = manifest_list[len(manifest_list) - 1]
         if len(opf_list) == 1:
             opf_path = []
@@ -1044,7 +2798,7 @@ class epub_paginator:
             if self.DEBUG:
                 lstr = f"nav file at same level as opf/manifest, " f"use manifest href."
                 self.wrlog(False, lstr)
-            href = urllib.parse.quote(manifest_item["href"])
+            href = urllib.parse.quote(manifest_item.href)
             return href
         print(f"nav and opf at different levels")
         np = nav_list[: len(nav_list) - 1]
@@ -1075,188 +2829,9 @@ class epub_paginator:
             if self.DEBUG:
                 lstr = f"Oops, opf_path: {opf_path}; manifest_path: " f"{manifest_path}"
                 self.wrlog(False, lstr)
-            href = urllib.parse.quote(manifest_item["href"])
+            href = urllib.parse.quote(manifest_item.href)
         return href
 
-    def find_opf(self, path):
-        """
-        Given the path to the unzipped epub file, read the container file and
-        return the path to the opf file as a text string.
-
-        **Keyword arguments:**
-
-        **_path_**
-
-        Path to unzipped epub file.
-
-        """
-        # TODO
-        # Write the comment_epubpager comment to the container file.
-        # find the opf file, which contains the version information
-        cfile = Path(f"{path}/META-INF/container.xml")
-        contain_str = cfile.read_text(encoding="utf-8")
-        # contain_str = str(contain_data)
-        rloc = contain_str.find("<rootfiles>")
-        if rloc == -1:
-            estr = "ABORTING: did not find <rootfiles> in container"
-            self.rdict["error_lst"].append(estr)
-            self.rdict["pager_error"] = True
-            self.wrlog(False, estr)
-            self.wrlog(False, "Convert to ePub3 and try again.")
-            return ""
-        contain_str = contain_str[rloc + 3 :]
-        rloc = contain_str.find("<rootfile")
-        if rloc == -1:
-            estr = "ABORTING: did not find <rootfile in container"
-            self.rdict["error_lst"].append(estr)
-            self.rdict["pager_error"] = True
-            self.wrlog(False, estr)
-            self.wrlog(False, "Convert to ePub3 and try again.")
-            return ""
-        contain_str = contain_str[rloc + 3 :]
-        rloc = contain_str.find("full-path=")
-        if rloc == -1:
-            estr = "ABORTING: did not find full-path in container"
-            self.rdict["error_lst"].append(estr)
-            self.rdict["pager_error"] = True
-            self.wrlog(False, estr)
-            self.wrlog(False, "Convert to ePub3 and try again.")
-            return ""
-        contain_str = contain_str[rloc + 3 :]
-        opflist = contain_str.split('"')
-        ofile = f"{self.rdict['unzip_path']}/{opflist[1]}"
-        return ofile
-
-    def make_dict(self, item) -> typing.Dict:
-        """
-
-        Args:
-            item (): string that contains an <item /> from an epub manifest
-
-        items are strings of format:
-            <item id="idstring", href="the href of the id", properties="optional properties" />
-
-        This functions turns each left hand side of '=' into a key, and the
-        right had side into the value and puts these entries in a dictionary.
-
-        Returns:
-            mandict:
-
-        """
-        item = item[len("<item ") :]
-        mdone = False
-        mandict = {}
-        while not mdone:
-            val = "notfound"
-            key = "nokey"
-            keyloc = item.find("=")
-            if keyloc == -1:
-                mdone = True
-                continue
-            else:
-                key = item[:keyloc].strip()
-                item = item[keyloc + 2 :]
-                q2loc = item.find('"')
-                val = item[:q2loc]
-                item = item[q2loc + len('"') :]
-            mandict[key] = val
-            # mdone = True
-        return mandict
-
-    def get_manifest(self, man_data):
-        """
-
-        Args:
-            man_data (): data containing <manifest> through </manifest>
-
-        Returns:
-            manifest, a list of dictionaries that are built from each manifest
-            entry by make_dict()
-
-        """
-        manifest = []
-        done = False
-        # some documents use opf:manifest instead of manifest
-        if man_data.find("<manifest>") != -1:
-            man_elmnt = "<manifest>"
-        elif man_data.find("<opf:manifest>") != -1:
-            man_elmnt = "<opf:manifest>"
-        else:
-            self.wrlog(
-                True, ("Fatal error - did not find manifest element in navigation file")
-            )
-            self.rdict["pager_error"] = True
-            return
-        while not done:
-            loc = man_data.find(man_elmnt)
-            if loc != -1:
-                man_data = man_data[loc + len(man_elmnt) :]
-                continue
-            loc = man_data.find("<item ")  # note 'item ' to avoid matching 'itemref'.
-            if loc != -1:
-                # get the item to send to make_dict
-                man_data = man_data[loc:]
-                loc1 = man_data.find("/>")
-                if loc1 != -1:
-                    item = man_data[:loc1]
-                    manifest.append(self.make_dict(item))
-                    man_data = man_data[loc1 + len("/>") :]
-                    continue
-            loc = man_data.find("</manifest>")
-            if loc != -1:
-                done = True
-        return manifest
-
-    def get_spine(self, spine_data):
-        """
-
-        Args:
-            spine_data (): data from opf file that contains <spine> through </spine>
-
-        Returns:
-            splist: a list of the idref entries from the spine
-
-        """
-        splist = []
-        sdone = False
-        while not sdone:
-            loc = spine_data.find("<spine>")
-            if loc != -1:
-                spine_data = spine_data[loc + len("<spine>") :]
-                continue
-            loc = spine_data.find("<itemref ")
-            if loc != -1:
-                spine_data = spine_data[loc + len("<itemref") :]
-                loc = spine_data.find("idref")
-                if loc != -1:
-                    spine_data = spine_data[loc + len("idref") :]
-                loc = spine_data.find('"')
-                if loc != -1:
-                    spine_data = spine_data[loc + 1 :]
-                loc1 = spine_data.find('"')
-                if loc1 != -1:
-                    item = spine_data[:loc1]
-                    splist.append(item)
-                    spine_data = spine_data[loc1 + 1 :]
-                    continue
-            loc = spine_data.find("</spine>")
-            if loc != -1:
-                sdone = True
-        if len(splist) == 0:
-            self.wrlog(False, ("Fatal error - spine length is zero in navigation file"))
-            self.rdict["pager_error"] = True
-        return splist
-
-    def parse_opf(self, opf_data):
-        """
-
-        Args:
-            opf_data (): Data read from the opf file
-        """
-
-        self.rdict["manifest"] = self.get_manifest(opf_data)
-        self.rdict["spine_lst"] = self.get_spine(opf_data)
-
     def dump_spine(self):
         self.wrlog(False, "spine dict:")
         for item in self.rdict["spine_lst"]:
@@ -1265,9 +2840,8 @@ class epub_paginator:
 
     def dump_manifest(self):
         self.wrlog(False, f"Manifest dict:")
-        for item in self.rdict["manifest"]:
-            for key in item:
-                self.wrlog(False, f"  {key}: {item[key]}")
+        for item in self.rdict["manifest"].values():
+            self.wrlog(False, f"  {item}")
 
     def dump_dict(self, name, ld):
         self.wrlog(False, f"{name}:")
@@ -1305,11 +2879,10 @@ class epub_paginator:
 
         # self.dump_manifest()
         if self.genplist:
-            for item in self.rdict["manifest"]:
-                if item.get("properties") == "nav":
-                    navf = Path(f"{self.rdict['disk_path']}{item['href']}")
-                    self.rdict["nav_item"] = item["href"]
-                    self.rdict["nav_file"] = navf
+            if self.package.nav_href:
+                navf = Path(f"{self.rdict['disk_path']}{self.package.nav_href}")
+                self.rdict["nav_item"] = self.package.nav_href
+                self.rdict["nav_file"] = navf
             if self.rdict["nav_file"] == "None":
                 self.wrlog(False, ("Fatal error - did not find navigation file"))
                 self.rdict["pager_error"] = True
@@ -1320,7 +2893,7 @@ class epub_paginator:
                 # we have a nav file, verify there is no existing page_list
                 # element
                 if self.genplist:
-                    with self.rdict["nav_file"].open("r") as nav_r:
+                    with self.open_member(self.rdict["nav_file"]) as nav_r:
                         nav_data = nav_r.read()
                         lstr = 'epub:type="page-list"'
                         if nav_data.find(lstr) != -1:
@@ -1357,55 +2930,74 @@ class epub_paginator:
                             self.rdict["match"] = False
         # we're good to go
         spine_lst = []
-        # for spine_item in opf_dict[opf_dictkey]["spine"]["itemref"]:  # type: ignore
+        manifest = self.rdict["manifest"]
         for spine_item in self.rdict["spine_lst"]:
             if self.DEBUG:
-                lstr = f"spine_item idref: {spine_item['idref']}"
+                lstr = f"spine_item idref: {spine_item}"
                 self.wrlog(False, lstr)
-            # sometimes the manifest is opf:manifest, check this
-            # this only happens if we have an epub2 and didn't convert to epub3
-            # THIS MUST BE FIXED IN parse_opf
-            # if opf_dict[opf_dictkey].get("manifest", "fucked") != "fucked":  # type: ignore
-            #     manifest_key = "manifest"
-            # elif opf_dict[opf_dictkey].get("opf:manifest", "epub2") != "epub2":  # type: ignore
-            #     manifest_key = "opf:manifest"
-            # else:
-            #     self.wrlog(False, f"Fatal Error: Cannot find manifest in opf file")
-            #     self.rdict["pager_error"] = True
-            #     return
-            for m_item in self.rdict["manifest"]:
-                if spine_item == m_item["id"]:
-                    # we don't care about any properties keys except for 'nav'
-                    # if "properties" in m_item.keys():
-                    #     if m_item["properties"] == "svg":
-                    #         self.wrlog(
-                    #             True,
-                    #             f"dropping m_item: {m_item}; spine_item: {spine_item}",
-                    #         )
-                    #         continue
-                    # elif (
-                    if (
-                        "toc" in m_item["href"].casefold()
-                        or "contents" in m_item["href"].casefold()
-                    ):
-                        self.wrlog(
-                            True,
-                            (f"Skipping file " f"{m_item['href']} " f"because TOC."),
-                        )
+            m_item = manifest.get(spine_item)
+            if m_item is not None:
+                if (
+                    "toc" in m_item.href.casefold()
+                    or "contents" in m_item.href.casefold()
+                ):
+                    self.wrlog(
+                        True,
+                        (f"Skipping file " f"{m_item.href} " f"because TOC."),
+                    )
+                else:
+                    fdict = {}
+                    uqdfile = urllib.parse.unquote(m_item.href)
+                    fdict["disk_file"] = f"{self.rdict['disk_path']}{uqdfile}"
+                    # take care of books structured with opf file and
+                    # nav file at different directory levels
+                    if self.genplist:
+                        fdict["href"] = self.bld_href(m_item)
                     else:
-                        fdict = {}
-                        uqdfile = urllib.parse.unquote(m_item["href"])
-                        fdict["disk_file"] = f"{self.rdict['disk_path']}{uqdfile}"
-                        # take care of books structured with opf file and
-                        # nav file at different directory levels
-                        if self.genplist:
-                            fdict["href"] = self.bld_href(m_item)
-                        else:
-                            fdict["href"] = ""
-                        spine_lst.append(fdict)
+                        fdict["href"] = ""
+                    spine_lst.append(fdict)
         self.rdict["spine_lst"] = spine_lst
         return ()  # scan_spine
 
+    def next_element(self, ebdata, idx):
+        """
+        Cursor form of process_html(). ebdata[idx] == '<'. Identify the html
+        element that starts at idx without copying the rest of ebdata.
+
+        Returns:
+
+        (el, next_idx, done)
+
+            el:       string  -- the html_element found
+            next_idx: Int     -- location to begin the next scan
+            done:     Boolean -- we found </body>, we are done
+        """
+
+        mk = str_markup if isinstance(ebdata, str) else bytes_markup
+        done = False
+        loc = ebdata.find(mk["gt"], idx)
+        next_idx = loc + 1 if loc != -1 else len(ebdata)
+        el = ebdata[idx:next_idx]
+        eltype = mk["el_type"].match(ebdata, idx + 1, next_idx).group()
+        if eltype[:1] == mk["lt"]:
+            eltype = eltype[1:]
+        if eltype == mk["body_end"]:
+            done = True
+        elif eltype == mk["comment"]:  # skip comments
+            self.wrlog(False, "skipping comments")
+            loc = ebdata.find(mk["comment_end"], idx)
+            if loc == -1:
+                loc = idx - 1
+            el += ebdata[idx : loc + 3]
+            next_idx = loc + 3
+        elif eltype == mk["nav"]:
+            loc = ebdata.find(mk["nav_end"], idx)
+            if loc == -1:
+                loc = idx - 1
+            el += ebdata[idx : loc + 5]
+            next_idx = loc + 5
+        return (el, next_idx, done)
+
     def process_html(self, ebdata):
         """
         ebdata[0] == '<'. Grab, identify, and handle the html element.
@@ -1421,101 +3013,161 @@ class epub_paginator:
         """
 
         stat = {}
-        stat["done"] = False
-        stat["idx"] = 0
-        stat["el"] = ""
-        endel = [" ", ">"]
-        loc = ebdata.find(">")
-        stat["idx"] = loc + 1
-        stat["el"] = ebdata[: loc + 1]
-        # self.wrlog(False, f"html element: {stat['el']}")
-        eltype = ""
-        idx = 1
-        while stat["el"][idx] not in endel:
-            eltype += stat["el"][idx]
-            idx += 1
-        if eltype[0] == "<":
-            eltype = eltype[1:]
-        # self.wrlog(False, f"eltype: {eltype}")
-        if eltype == "/body":
-            # self.wrlog(False, f"done: html element: {stat['el']}")
-            stat["done"] = True
-        elif eltype == "!--":  # skip comments
-            self.wrlog(False, "skipping comments")
-            loc = ebdata.find("-->")
-            stat["el"] += ebdata[: loc + 3]
-            stat["idx"] = loc + 3
-        elif eltype == "nav":
-            # self.wrlog(False, "skipping nav")
-            loc = ebdata.find("/nav")
-            stat["el"] += ebdata[: loc + 5]
-            # self.wrlog(False, f"html element: {stat['el']}")
-            stat["idx"] = loc + 5
-        # self.wrlog(False, str(stat))
+        stat["el"], stat["idx"], stat["done"] = self.next_element(ebdata, 0)
         return stat
 
-    def count_words(self):
+    def tokenize(self, ebook_data, shard=False):
         """
-        Scan book contents and count words
+        Split the <body> of a section file into html elements and the text
+        strings between them.
+
+        Returns a list of tokens (see tk_tag, tk_text and tk_end) holding
+        offsets into ebook_data, or None if there is no <body> element.
+
+        **Keyword arguments:**
+
+        **_ebook_data_**
+
+        The data read from the section file, str, or bytes or mmap for
+        engine "bytes".
+
+        **_shard_**
+
+        True if the section is tokenized in shards over the worker pool,
+        see big_section.
 
-        This is an informational scan only, data is gathered, but no
-        changes are made
         """
 
-        wdcnt = 0
-        for chapter in self.rdict["spine_lst"]:
-            pstr = f"{chapter['disk_file']}"
-            pstr = pstr.replace(r"amp;", "")
-            efile = Path(pstr)
-            ebook_data = efile.read_text(encoding="utf-8")
-            body1 = ebook_data.find("<body")
-            if body1 == -1:
-                self.rdict["error_lst"].append(
-                    f"Fatal error: No <body> found. " f"File: {chapter['disk_file']}"
-                )
-                self.rdict["pager_error"] = True
-                return 0
+        mk = str_markup if isinstance(ebook_data, str) else bytes_markup
+        body1 = ebook_data.find(mk["body"])
+        if body1 == -1:
+            return None
+        dlen = len(ebook_data)
+        if shard and self.use_pool():
+            return self.tokenize_shards(ebook_data, body1)
+        return self.tokenize_range(ebook_data, body1, dlen)[0]
+
+    def tokenize_range(self, ebook_data, idx, end):
+        """
+        Tokenize ebook_data[idx:end] for tokenize(). idx and end must be
+        the start of an element or text string.
+
+        Returns (tokens, done), done is True if </body> was found.
+        """
+
+        is_str = isinstance(ebook_data, str)
+        lt = "<" if is_str else b"<"
+        tag = lt[0]
+        tokens = []
+        dlen = len(ebook_data)
+        while idx < end:
+            if ebook_data[idx] == tag:
+                el, next_idx, done = self.next_element(ebook_data, idx)
+                if done:
+                    tokens.append((tk_end, idx, dlen, None))
+                    return (tokens, True)
+                if len(el) == next_idx - idx:
+                    el = None
+                tokens.append((tk_tag, idx, next_idx, el))
+                idx = next_idx
             else:
-                ebook_data = ebook_data[body1:]
-                stat = self.process_html(ebook_data)
-                ebook_data = ebook_data[stat["idx"] :]
-            done = False
-            while not done:
-                lidx = 0
-                while ebook_data[lidx] in ["\n", " ", "\t"]:
-                    lidx += 1
-                ebook_data = ebook_data[lidx:]
-                if ebook_data[0] == "<":
-                    stat = self.process_html(ebook_data)
-                    if stat["done"]:
-                        done = True
-                    else:
-                        ebook_data = ebook_data[stat["idx"] :]
-                else:
-                    loc = ebook_data.find("<")
-                    wdcnt += len(ebook_data[:loc].split())
-                    ebook_data = ebook_data[loc:]
-        self.wrlog(False, f"count_words result: {wdcnt}")
-        self.rdict["words"] = wdcnt
-        if self.rdict["has_plist"] and self.rdict["match"]:
-            wc = int(self.rdict["words"] / self.rdict["pages"])
-            self.rdict["pgwords"] = wc
-        else:
-            self.rdict["pgwords"] = self.pgwords
-        return
+                loc = ebook_data.find(lt, idx, end)
+                if loc == -1:
+                    loc = end
+                run = ebook_data[idx:loc]
+                if not is_str and not run.isascii():
+                    # count words as str.split() does
+                    run = run.decode("utf-8")
+                tokens.append((tk_text, idx, loc, len(run.split())))
+                idx = loc
+        return (tokens, False)
+
+    def shard_cuts(self, ebook_data, start):
+        """
+        Find the offsets at which tokenize_shards() splits ebook_data. Each
+        cut follows a </p> or </div> element that is not inside a comment,
+        a <nav> element or another tag, so the shards tokenize exactly as
+        the whole section would.
 
-    def chk_xmlns(self, ebook_data):
+        The shards are shard_size long in the units of ebook_data, so a
+        decoded shard is at least shard_size bytes of the section file.
         """
-        Verify that ebook_data has proper xmlns:epub statement. If not,
-        insert it.
 
-        **Keyword arguments:**
-        ebook_data - complete data from an xhtml file.
+        mk = str_markup if isinstance(ebook_data, str) else bytes_markup
+        cuts = []
+        dlen = len(ebook_data)
+        # start and each cut are outside any tag, comment or <nav>, so a
+        # candidate is checked back to the previous cut only
+        prev = start
+        target = start + self.shard_size
+        while target < dlen:
+            for m in mk["shard"].finditer(ebook_data, target):
+                q = m.start()
+                loc = ebook_data.rfind(mk["lt"], prev, q)
+                if loc != -1 and ebook_data.find(mk["gt"], loc, q) == -1:
+                    continue
+                loc = ebook_data.rfind(mk["comment_start"], prev, q)
+                if loc != -1 and ebook_data.find(mk["comment_end"], loc, q) == -1:
+                    continue
+                loc = ebook_data.rfind(mk["nav_start"], prev, q)
+                if loc != -1 and ebook_data.find(mk["nav_end"], loc, q) == -1:
+                    continue
+                cuts.append(m.end())
+                break
+            else:
+                break
+            prev = cuts[-1]
+            target = prev + self.shard_size
+        return cuts
+
+    def tokenize_shard(self, shard, offset):
         """
-        # find the html element and grab it
-        l1 = ebook_data.find("<html")
-        if l1 == -1:
-            estr = f"Fatal Error: searching for xmlns, but did not find <html."
+        Tokenize one shard in a worker process for tokenize_shards().
+
+        Returns (tokens, done) with the offsets moved by offset.
+        """
+
+        tokens, done = self.tokenize_range(shard, 0, len(shard))
+        tokens = [(tk, s + offset, e + offset, v) for tk, s, e, v in tokens]
+        return (tokens, done)
+
+    def tokenize_shards(self, ebook_data, body1):
+        """
+        Tokenize a large section in shards over the worker pool and merge
+        the tokens. The result is the same as tokenize_range() over the
+        whole section.
+        """
+
+        bounds = [body1] + self.shard_cuts(ebook_data, body1) + [len(ebook_data)]
+        lstr = f"tokenizing {len(bounds) - 1} shards"
+        self.wrlog(False, lstr)
+        args_lst = [
+            (ebook_data[bounds[i] : bounds[i + 1]], bounds[i])
+            for i in range(len(bounds) - 1)
+        ]
+        tokens = []
+        for result in self.pool_map("tokenize_shard", args_lst):
+            self.pool_merge(result)
+            shard_tokens, done = result["result"]
+            tokens += shard_tokens
+            if done:
+                # tk_end runs to the end of the section
+                tokens[-1] = (tk_end, tokens[-1][1], len(ebook_data), None)
+                break
+        return tokens
+
+    def chk_xmlns(self, ebook_data):
+        """
+        Verify that ebook_data has proper xmlns:epub statement. If not,
+        insert it.
+
+        **Keyword arguments:**
+        ebook_data - complete data from an xhtml file.
+        """
+        # find the html element and grab it
+        l1 = ebook_data.find("<html")
+        if l1 == -1:
+            estr = f"Fatal Error: searching for xmlns, but did not find <html."
             self.wrlog(True,estr)
             self.rdict["error_lst"].append(estr)
             self.rdict["pager_error"] = True
@@ -1551,109 +3203,856 @@ class epub_paginator:
                     newbk += ebook_data[loc2:]
                     return newbk
 
-    def scan_sections(self):
+    def scan_book(self):
+        """
+        Read each section file once and gather everything pagination needs
+        in a single pass: the book word count, the word count of every text
+        string (run_words) for plan_pages, and when matching, the count of
+        existing pagebreaks in each section.
+
+        The section data and its tokens are kept in the spine_lst entry
+        ("ebook_data" and "tokens") so the pagination pass does not read or
+        tokenize the file again.
+
+        This is an informational scan only, data is gathered, but no
+        changes are made
+        """
+
+        self.run_words = []
+        self.first_runs = []
+        if self.rdict["match"] and self.nav_index is not None:
+            # sections not in the page-list are counted by scan_section
+            for chapter in self.rdict["spine_lst"]:
+                chapter["sct_pgcnt"] = self.nav_index.count(self.section_path(chapter))
+        results = iter([])
+        if self.use_pool():
+            # the workers count the words; the data is read again by the
+            # worker that paginates the section. Large sections are
+            # scanned here, tokenize() shards them over the pool.
+            small = [
+                (chapter,)
+                for chapter in self.rdict["spine_lst"]
+                if not self.big_section(chapter)
+            ]
+            results = iter(self.pool_map("scan_section", small))
+        elif self.pipelined():
+            # a thread reads the next sections while this one is tokenized
+            reads = pipe_stage(
+                "read",
+                self.read_section,
+                self.queue_depth,
+                items=self.rdict["spine_lst"],
+            )
+            results = iter(reads)
+        for chapter in self.rdict["spine_lst"]:
+            self.first_runs.append(len(self.run_words))
+            if self.use_pool() and not self.big_section(chapter):
+                result = next(results)
+                self.pool_merge(result)
+                chapter.update(result["args"][0])
+                run_words = result["result"]
+            elif self.pipelined():
+                run_words = self.scan_section(chapter, next(results))
+            else:
+                run_words = self.scan_section(chapter)
+            self.run_words.extend(run_words or [])
+            if self.rdict["pager_error"]:
+                break
+        if self.pipelined():
+            reads.close()
+            self.pipe_report("scan", reads, None)
+        if self.rdict["pager_error"]:
+            self.drop_section_data()
+            return 0
+        wdcnt = sum(self.run_words)
+        self.wrlog(False, f"scan_book word count: {wdcnt}")
+        self.rdict["words"] = wdcnt
+        if self.rdict["has_plist"] and self.rdict["match"]:
+            wc = int(self.rdict["words"] / self.rdict["pages"])
+            self.rdict["pgwords"] = wc
+        elif self.pgwords == 0 and self.pages:
+            self.rdict["pgwords"] = int(self.rdict["words"] / self.pages)
+        else:
+            self.rdict["pgwords"] = self.pgwords
+        return
+
+    def scan_section(self, chapter, ebook_data=None):
+        """
+        Read and tokenize one section file for scan_book. The data and
+        tokens are stored in chapter, and when matching, so are the
+        existing pagebreaks (see find_pagebreaks) and, if the page-list
+        index has no count for the section, their count.
+
+        Returns the list of word counts of the text strings in the
+        section, or None if the section has no <body>.
+
+        **Keyword arguments:**
+
+        **_chapter_**
+
+        The spine_lst entry of the section.
+
+        **_ebook_data_**
+
+        The data of the section if it has been read already, see
+        read_section.
+
+        """
+
+        if self.streaming():
+            return self.stream_count(chapter)
+        if ebook_data is None:
+            ebook_data = self.read_section(chapter)
+        if self.rdict["match"]:
+            chapter["pg_marks"] = self.find_pagebreaks(ebook_data, chapter)
+            if chapter.get("sct_pgcnt") is None:
+                chapter["sct_pgcnt"] = len(chapter["pg_marks"])
+        tokens = self.tokenize(ebook_data, self.big_section(chapter))
+        if tokens is None:
+            self.rdict["error_lst"].append(
+                f"Fatal error: No <body> found. " f"File: {chapter['disk_file']}"
+            )
+            self.rdict["pager_error"] = True
+            return None
+        chapter["ebook_data"] = ebook_data
+        chapter["tokens"] = tokens
+        return [tok[3] for tok in tokens if tok[0] == tk_text]
+
+    def paginate_section(self, chapter):
+        """
+        Paginate one section file with scan_file or scan_match_file, fix
+        its xmlns and write it back.
+
+        **Keyword arguments:**
+
+        **_chapter_**
+
+        The spine_lst entry of the section.
+
+        """
+
+        if self.DEBUG:
+            lstr = f"file: {chapter['disk_file']}"
+            self.wrlog(False, lstr)
+        ewfile = self.section_path(chapter)
+        if self.streaming():
+            lstr = f"Scanning {chapter['disk_file']}"
+            self.wrlog(False, lstr)
+            self.stream_file(chapter)
+            return
+        new_ebook = self.paginate_data(chapter, self.section_data(chapter))
+        if not self.rdict["pager_error"]:
+            self.write_section(ewfile, new_ebook)
+
+    def section_data(self, chapter):
+        """
+        Return the data of a section for paginate_data.
+        """
+
+        # scan_book has usually read the file already
+        ebook_data = chapter.pop("ebook_data", None)
+        if ebook_data is None:
+            ebook_data = self.read_section(chapter)
+        return ebook_data
+
+    def paginate_data(self, chapter, ebook_data):
+        """
+        Paginate the data of a section with scan_file or scan_match_file
+        and fix its xmlns.
+
+        Returns the new section for write_section, a str or, for the
+        "bytes" engine, a list of pieces. Returns None on a fatal error.
+
+        **Keyword arguments:**
+
+        **_chapter_**
+
+        The spine_lst entry of the section.
+
+        **_ebook_data_**
+
+        The data of the section, see section_data.
+
+        """
+
+        lstr = f"Scanning {chapter['disk_file']}"
+        self.wrlog(False, lstr)
+        if self.rdict["match"]:
+            new_ebook = self.scan_match_file(ebook_data, chapter)
+        else:
+            new_ebook = self.scan_file(ebook_data, chapter)
+        chapter.pop("tokens", None)
+        chapter.pop("pg_marks", None)
+        if isinstance(new_ebook, str):
+            xebook_data = self.chk_xmlns(new_ebook)
+            if self.rdict["pager_error"]:
+                return None
+            return xebook_data
+        if self.rdict["pager_error"]:
+            return None
+        # bytes engine: the <html> element is in the first piece
+        header = self.chk_xmlns(bytes(new_ebook[0]).decode("utf-8"))
+        if self.rdict["pager_error"]:
+            return None
+        new_ebook[0] = header.encode("utf-8")
+        return new_ebook
+
+    def write_section(self, ewfile, new_ebook):
+        """
+        Write a section paginated by paginate_data to ewfile.
+        """
+
+        if isinstance(new_ebook, str):
+            self.write_member(ewfile, new_ebook)
+            return
+        # ebook_data may be mapped from ewfile, create_member writes a new
+        # file and close_member replaces ewfile with it.
+        ebook_wfile = self.create_member(ewfile, True)
+        ebook_wfile.writelines(new_ebook)
+        self.close_member(ewfile, ebook_wfile)
+
+    def read_section(self, chapter):
+        """
+        Read a section file, as str for the "text" engine, or memory-mapped
+        for the "bytes" engine (as bytes with in_memory). Matching always
+        reads str.
+        """
+
+        efile = self.section_path(chapter)
+        if self.engine != "bytes" or self.rdict["match"]:
+            return self.read_member(efile)
+        if self.zin is not None:
+            return self.zin.read(self.member_name(efile))
+        self.extract_members([efile])
+        with efile.open("rb") as ebook_rfile:
+            if efile.stat().st_size == 0:
+                return b""
+            # the map stays valid after the file is closed
+            return mmap.mmap(ebook_rfile.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def section_path(self, chapter):
+        """
+        Return the Path of the section file of a spine_lst entry.
+        """
+
+        # this stupid fix is required by Hunter's Moon which puts '&amp;' in file names.
+        pstr = f"{chapter['disk_file']}"
+        pstr = pstr.replace(r"amp;", "")
+        return Path(pstr)
+
+    def big_section(self, chapter):
+        """
+        Return True if the section file is larger than shard_size bytes,
+        so it is sharded by tokenize().
+        """
+
+        if self.workers < 2 or not self.shard_size or self.streaming():
+            return False
+        return self.member_size(self.section_path(chapter)) > self.shard_size
+
+    def streaming(self):
+        """
+        Return True if sections are paginated by the "stream" engine.
+        """
+
+        return self.engine == "stream" and not self.rdict["match"]
+
+    def open_zip(self, epub_file):
+        """
+        Open epub_file as the source of the epub members for in_memory.
+        """
+
+        if self.zin is not None and self.zin.filename == epub_file:
+            return
+        self.close_zip()
+        self.zin = zipfile.ZipFile(epub_file)
+        self.bk_flist = self.zin.namelist()
+        self.zip_members = {}  # member name: bytes, waiting to be written
+        self.zip_done = set()  # members written to zout
+        self.zip_hold = set()  # members kept in zip_members until finish_zip
+
+    def start_zip(self, epub_path):
+        """
+        Create the paged epub_path for in_memory and write its mimetype
+        member, which must be first and stored.
+
+        The nav and opf members are held in memory until finish_zip, since
+        they are changed after the sections are paginated.
+        """
+
+        if "mimetype" not in self.bk_flist:
+            estr = "Fatal error, no mimetype file was found."
+            self.wrlog(False, estr)
+            self.rdict["error_lst"].append(estr)
+            self.rdict["pager_error"] = True
+            return
+        self.zout = zipfile.ZipFile(epub_path, "w", zipfile.ZIP_DEFLATED)
+        self.zip_pool = ThreadPoolExecutor()
+        self.zip_pending = []  # (ZipInfo, deflate future) in write order
+        info = self.member_info("mimetype")
+        info.compress_type = zipfile.ZIP_STORED
+        self.zout.writestr(info, self.zin.read("mimetype"))
+        self.zip_done.add("mimetype")
+        for key in ("nav_file", "opf_file"):
+            if self.rdict[key] != "None":
+                self.zip_hold.add(self.member_name(self.rdict[key]))
+
+    def finish_zip(self):
+        """
+        Write the held members and copy every member not yet written from
+        the source still compressed, then close the source and the paged
+        epub.
+        """
+
+        for name, data in self.zip_members.items():
+            self.queue_member(name, data)
+        self.zip_members = {}
+        self.write_pending(True)
+        for orig in self.zin.infolist():
+            if orig.filename not in self.zip_done:
+                zip_copy_raw(self.zin, orig, self.zout)
+        self.close_zip()
+
+    def close_zip(self, remove=False):
+        """
+        Close the in_memory source and paged epub ZipFiles. If remove is
+        True, the partly written paged epub is deleted.
+        """
+
+        if self.zout is not None:
+            self.zip_pool.shutdown(cancel_futures=True)
+            self.zip_pending = []
+            outfile = self.zout.filename
+            self.zout.close()
+            self.zout = None
+            if remove and outfile:
+                Path(outfile).unlink(missing_ok=True)
+        if self.zin is not None:
+            self.zin.close()
+            self.zin = None
+
+    def member_name(self, path):
+        """
+        Return the name in the epub of the file at path in unzip_path.
+        """
+
+        return Path(os.path.relpath(path, self.rdict["unzip_path"])).as_posix()
+
+    def member_info(self, name):
+        """
+        Return a ZipInfo for writing the member name of the paged epub, with
+        the date and attributes of the source member.
+        """
+
+        orig = self.zin.getinfo(name)
+        info = zipfile.ZipInfo(name, date_time=orig.date_time)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = orig.external_attr
+        return info
+
+    def read_member(self, path):
+        """
+        Return the text of the epub file at path, from unzip_path or, with
+        in_memory, from the source or the members changed so far.
+        """
+
+        if self.zin is None:
+            self.extract_members([path])
+            return path.read_text(encoding="utf-8")
+        name = self.member_name(path)
+        if name in self.zip_members:
+            return self.zip_members[name].decode("utf-8")
+        with self.open_member(path) as rfile:
+            return rfile.read()
+
+    def open_member(self, path):
+        """
+        Open the epub file at path for reading text, as changed so far.
+        """
+
+        if self.zin is None:
+            self.extract_members([path])
+            return path.open("r", encoding="utf-8")
+        name = self.member_name(path)
+        if name in self.zip_members:
+            return io.StringIO(self.zip_members[name].decode("utf-8"))
+        return io.TextIOWrapper(self.zin.open(name), encoding="utf-8")
+
+    def member_size(self, path):
+        """
+        Return the size in bytes of the epub file at path.
+        """
+
+        if self.zin is None:
+            self.extract_members([path])
+            return path.stat().st_size
+        return self.zin.getinfo(self.member_name(path)).file_size
+
+    def write_member(self, path, data):
+        """
+        Replace the text of the epub file at path with data.
+        """
+
+        if self.zin is None:
+            path.write_text(data, "utf-8")
+            return
+        self.store_member(self.member_name(path), data.encode("utf-8"))
+
+    def store_member(self, name, data):
+        """
+        Write the bytes data as the member name of the paged epub, or keep
+        it in zip_members if it is held or there is no paged epub (a worker
+        process).
+        """
+
+        if self.zout is None or name in self.zip_hold:
+            self.zip_members[name] = data
+            return
+        self.queue_member(name, data)
+
+    def queue_member(self, name, data):
+        """
+        Deflate the bytes data for the member name of the paged epub on the
+        thread pool, and write the members deflated so far.
+        """
+
+        info = self.member_info(name)
+        info.file_size = len(data)
+        self.zip_pending.append(
+            (info, self.zip_pool.submit(deflate, data, self.zip_level()))
+        )
+        self.zip_done.add(name)
+        self.write_pending(False)
+
+    def write_pending(self, wait):
+        """
+        Write the queued members to the paged epub in the order they were
+        queued, as far as they have been deflated, or all of them if wait is
+        True.
+        """
+
+        pending = self.zip_pending
+        done = 0
+        while done < len(pending) and (wait or pending[done][1].done()):
+            info, future = pending[done]
+            zip_write_deflated(self.zout, info, future.result(), self.zip_level())
+            done += 1
+        del pending[:done]
+
+    def create_member(self, path, binary=False):
+        """
+        Return a file object for writing a new version of the epub file at
+        path, as text unless binary is True. Pass it to close_member when
+        done.
+
+        On disk a temporary file is written next to path. With in_memory,
+        the member is deflated straight into the paged epub, on this thread,
+        if store_member would write it and ZipInfo has the public
+        compress_level (python 3.13). Otherwise it is written to memory and
+        passed to store_member by close_member.
+        """
+
+        if self.zin is None:
+            tmpfile = path.with_name(f"{path.name}.tmp")
+            if binary:
+                return tmpfile.open("wb")
+            return tmpfile.open("w", encoding="utf-8")
+        name = self.member_name(path)
+        if self.zout is None or name in self.zip_hold or not has_compress_level:
+            wfile = io.BytesIO()
+        else:
+            info = self.member_info(name)
+            info.compress_level = self.zip_level()
+            wfile = self.zout.open(info, "w")
+        if binary:
+            return wfile
+        return io.TextIOWrapper(wfile, encoding="utf-8", newline="")
+
+    def close_member(self, path, wfile):
+        """
+        Close a file object from create_member, which replaces the epub
+        file at path.
+        """
+
+        if self.zin is None:
+            wfile.close()
+            os.replace(path.with_name(f"{path.name}.tmp"), path)
+            return
+        name = self.member_name(path)
+        wfile.flush()
+        raw = wfile.buffer if isinstance(wfile, io.TextIOWrapper) else wfile
+        if isinstance(raw, io.BytesIO):
+            self.store_member(name, raw.getvalue())
+        else:
+            self.zip_done.add(name)
+        wfile.close()
+
+    def discard_member(self, path, wfile):
+        """
+        Close a file object from create_member without replacing the epub
+        file at path.
+        """
+
+        wfile.close()
+        if self.zin is None:
+            path.with_name(f"{path.name}.tmp").unlink(missing_ok=True)
+
+    def settings(self):
+        """
+        Return the configuration of this epub_paginator as a dictionary.
+        """
+
+        return {key: getattr(self, key) for key in cfg_keys}
+
+    def use_pool(self):
+        """
+        Return True if work is handed to a pool of worker processes.
+        """
+
+        # a source epub in memory cannot be opened by the workers
+        return self.workers > 1 and (self.zin is None or bool(self.zin.filename))
+
+    def pipelined(self):
+        """
+        Return True if reading, paginating and writing the sections are
+        overlapped by a pipeline of threads (see pipe_stage).
+        """
+
+        return self.queue_depth > 0 and not self.use_pool() and not self.streaming()
+
+    def paginate_pipeline(self):
+        """
+        Paginate the sections with a pipeline of three stages: a thread
+        reads the next sections, this thread paginates the current one and
+        a thread writes (with in_memory, compresses) the previous ones.
+        Each queue holds up to queue_depth sections.
+        """
+
+        spine_lst = self.rdict["spine_lst"]
+        reads = pipe_stage(
+            "read", self.section_data, self.queue_depth, items=spine_lst
+        )
+        writes = pipe_stage(
+            "write",
+            lambda item: self.write_section(*item),
+            self.queue_depth,
+            sink=True,
+        )
+        try:
+            for chapter, ebook_data in zip(spine_lst, reads):
+                new_ebook = self.paginate_data(chapter, ebook_data)
+                if self.rdict["pager_error"]:
+                    break
+                writes.put((self.section_path(chapter), new_ebook))
+        finally:
+            reads.close()
+            writes.close()
+        self.pipe_report("paginate", reads, writes)
+
+    def pipe_report(self, name, reads, writes):
+        """
+        Log the statistics of the pipe_stage threads on either side of the
+        stage name, which runs in this thread, and keep them in
+        rdict["pipeline"], so the stage that limits throughput can be seen.
+        A stage that waits for output is faster than the one after it.
+        """
+
+        stages = [stage for stage in (reads, writes) if stage is not None]
+        waited_in = reads.stats["wait_get"]
+        waited_out = writes.stats["wait_put"] if writes is not None else 0.0
+        self.rdict["pipeline"][name] = {
+            "items": reads.stats["items"],
+            "wait_in": waited_in,
+            "wait_out": waited_out,
+        }
+        for stage in stages:
+            self.rdict["pipeline"][f"{name} {stage.name}"] = dict(stage.stats)
+        for key, stats in self.rdict["pipeline"].items():
+            if key != name and not key.startswith(f"{name} "):
+                continue
+            lstr = (
+                f"Pipeline {key}: {stats['items']} items, "
+                f"waited {stats['wait_in']:.3f}s for input, "
+                f"{stats['wait_out']:.3f}s for output"
+            )
+            if "busy" in stats:
+                lstr += (
+                    f", busy {stats['busy']:.3f}s, "
+                    f"queue depth up to {stats['max_depth']}"
+                )
+            self.wrlog(False, lstr)
+
+    def pool_map(self, method, args_lst):
+        """
+        Run an epub_paginator method once for each argument tuple in a pool
+        of self.workers processes.
+
+        Returns the list of pool_run results in order. The caller merges
+        each result with pool_merge(). If the pool breaks, the tasks it did
+        not finish, and those of later calls for the book, are run in this
+        process.
+
+        **Keyword arguments:**
+
+        **_method_**
+
+        Name of the method.
+
+        **_args_lst_**
+
+        List of argument tuples, one per call.
+
         """
-        Scan book contents, book pages, and section pages.
 
-        This is an informational scan only, data is gathered, but no
-        changes are made
+        if not args_lst:
+            return []
+        rdict = {
+            "pages": self.rdict["pages"],
+            "match": self.rdict["match"],
+            "unzip_path": self.rdict["unzip_path"],
+            "zip_src": self.zin.filename if self.zin is not None else "",
+        }
+        tasks = [(method, args, rdict) for args in args_lst]
+        if self.rdict["pool_broken"]:
+            # the tasks are copied as they are when sent to a worker
+            return pool_run_part(copy.deepcopy(tasks))
+        chunk = max(1, len(tasks) // (self.workers * 4))
+        parts = [tasks[i : i + chunk] for i in range(0, len(tasks), chunk)]
+        futures = []
+        try:
+            with ProcessPoolExecutor(
+                max_workers=min(self.workers, len(tasks)),
+                initializer=pool_init,
+                initargs=(self.settings(), self.get_plan()),
+            ) as pool:
+                for part in parts:
+                    futures.append(pool.submit(pool_run_part, part))
+        except BrokenProcessPool:
+            pass
+        results = []
+        for i, part in enumerate(parts):
+            try:
+                results += futures[i].result()
+                continue
+            except (IndexError, BrokenProcessPool):
+                pass
+            if not self.rdict["pool_broken"]:
+                # e.g. a spawned worker could not import the main script
+                self.rdict["pool_broken"] = True
+                estr = (
+                    "Warning: the worker processes stopped, "
+                    "the rest of the book is paginated in this process."
+                )
+                self.wrlog(True, estr)
+                self.rdict["warn_lst"].append(estr)
+                self.rdict["pager_warn"] = True
+                pool_init(self.settings(), self.get_plan())
+            results += pool_run_part(copy.deepcopy(part))
+        return results
+
+    def pool_merge(self, result):
+        """
+        Merge the log messages, plist entries, errors and warnings of a
+        pool_run result.
+        """
+
+        for stdout, message in result["log"]:
+            self.wrlog(stdout, message)
+        self.plist.extend(result["plist"])
+        self.rdict["error_lst"] += result["error_lst"]
+        self.rdict["warn_lst"] += result["warn_lst"]
+        if result["pager_error"]:
+            self.rdict["pager_error"] = True
+        if result["pager_warn"]:
+            self.rdict["pager_warn"] = True
+        for name, data in result["members"].items():
+            self.store_member(name, data)
+
+    def plan_pages(self, pgwords):
+        """
+        Compute the page breaks for the whole book from the word counts of
+        its text strings gathered by scan_book. Page n ends after word
+        n * pgwords of the book, so the breaks are found with a cumulative
+        sum of run_words and a binary search, using numpy if it is present.
+        Trying another page size costs only another call.
+
+        Returns a list of (chapter, run, words) tuples, one per page break:
+        the index of the section in spine_lst, the index of the text string
+        in the section, and the number of words of that text string that
+        end the page.
+
+        **Keyword arguments:**
+
+        **_pgwords_**
+
+        Number of words per page.
+
+        """
+
+        if pgwords <= 0 or not self.run_words:
+            return []
+        if has_numpy:
+            counts = np.asarray(self.run_words, dtype=np.int64)
+            csum = np.cumsum(counts)
+            first_runs = np.asarray(self.first_runs, dtype=np.int64)
+            targets = np.arange(1, int(csum[-1]) // pgwords + 1, dtype=np.int64)
+            targets *= pgwords
+            runs = np.searchsorted(csum, targets, side="left")
+            words = targets - (csum[runs] - counts[runs])
+            chaps = np.searchsorted(first_runs, runs, side="right") - 1
+            runs -= first_runs[chaps]
+            return list(zip(chaps.tolist(), runs.tolist(), words.tolist()))
+        csum = list(itertools.accumulate(self.run_words))
+        plan = []
+        for target in range(pgwords, csum[-1] + 1, pgwords):
+            run = bisect.bisect_left(csum, target)
+            chap = bisect.bisect_right(self.first_runs, run) - 1
+            words = target - (csum[run] - self.run_words[run])
+            plan.append((chap, run - self.first_runs[chap], words))
+        return plan
+
+    def set_pages(self, plan):
+        """
+        Store a page plan from plan_pages in spine_lst and rdict: the page
+        breaks of each section ("pg_breaks", a list of (run, words)), the
+        number of its first page ("first_pg"), its page count ("sct_pgcnt")
+        and the page count of the book.
+
+        **Keyword arguments:**
+
+        **_plan_**
+
+        The list of page breaks returned by plan_pages.
+
+        """
+
+        for chapter in self.rdict["spine_lst"]:
+            chapter["pg_breaks"] = []
+            chapter["first_pg"] = 1
+        curpg = 1
+        for chap, run, words in plan:
+            chapter = self.rdict["spine_lst"][chap]
+            if not chapter["pg_breaks"]:
+                chapter["first_pg"] = curpg
+            chapter["pg_breaks"].append((run, words))
+            curpg += 1
+        for chapter in self.rdict["spine_lst"]:
+            chapter["sct_pgcnt"] = len(chapter["pg_breaks"])
+            if self.DEBUG:
+                lstr = f"Section page count is: {chapter['sct_pgcnt']}"
+                self.wrlog(False, lstr)
+        self.rdict["pages"] = curpg
+
+    def find_pagebreaks(self, ebook_data, chapter):
+        """
+        Find the existing pagebreak elements of a section with one pass of
+        pagebreak_re.
+
+        The page label is the title, aria-label or id attribute, in that
+        order. If the element has an id, the label is reduced to its
+        digits, if it has any.
+
+        Returns a list of (start, end, label) with the offsets of each
+        element, including its closing tag if it directly follows.
+
+        **Keyword arguments:**
+
+        **_ebook_data_**
+
+        The data read from the section file.
+
+        **_chapter_**
+
+        The spine_lst entry of the section.
+
+        """
+
+        marks = []
+        for pb in pagebreak_re.finditer(ebook_data):
+            end = pb.end()
+            if not pb.group().endswith("/>"):
+                close = pb_close_re.match(ebook_data, end)
+                if close and close.group(1) == pb.group(1):
+                    end = close.end()
+            attrs = dict(pb_attr_re.findall(pb.group()))
+            label = attrs.get("title", attrs.get("aria-label", attrs.get("id")))
+            if label is None:
+                estr = (
+                    f"Error: {chapter['disk_file']}: "
+                    f"Did not find title or aria-label or id "
+                    f"for pagebreak"
+                )
+                self.wrlog(False, estr)
+                self.rdict["warn_lst"].append(estr)
+                self.rdict["pager_warn"] = True
+                continue
+            if "id" in attrs:
+                digits = "".join(c for c in label if c.isdigit())
+                if digits:
+                    label = digits
+            marks.append((pb.start(), end, label))
+        return marks
+
+    def drop_section_data(self):
+        """
+        Release the section data and tokens kept in spine_lst by scan_book.
+        """
+
+        for chapter in self.rdict["spine_lst"]:
+            chapter.pop("ebook_data", None)
+            chapter.pop("tokens", None)
+            chapter.pop("pg_marks", None)
+
+    def page_link(self, chapter, curpg, sct_pg):
+        """
+        Return the page-link and/or superscript to be placed at a page break
+        in the text, and add the page-list entry for it.
+
+        **Keyword arguments:**
+
+        **_chapter_**
+
+        Dictionary containing the href for use in pagelinks and pages in
+        the section.
+
+        **_curpg_**
+
+        The page number in the book.
+
+        **_sct_pg_**
 
-        **Keyword arguments:**
+        The current section page number.
 
         """
 
-        page_words = 0
-        book_curpg = 1
-        # scan until we find '<body' and just copy all the header stuff.
-        for chapter in self.rdict["spine_lst"]:
-            sct_pgcnt = 0
-            pstr = f"{chapter['disk_file']}"
-            pstr = pstr.replace(r"amp;", "")
-            # print(f"pstr: {pstr}")
-            efile = Path(pstr)
-            # efile = Path((f"{chapter['disk_file']}"))
-            ebook_data = efile.read_text(encoding="utf-8")
-            # with efile.open("r") as ebook_rfile:
-            #     ebook_data = ebook_rfile.read()
-            if self.rdict["match"]:
-                lstr = 'epub:type="pagebreak"'
-                ep_typcnt = ebook_data.count(lstr)
-                # in case this is an aria file
-                lstr = 'role="doc-pagebreak"'
-                aria_typcnt = ebook_data.count(lstr)
-                if aria_typcnt:
-                    # book_curpg += aria_typcnt
-                    chapter["sct_pgcnt"] = aria_typcnt
-                else:
-                    # book_curpg += ep_typcnt
-                    chapter["sct_pgcnt"] = ep_typcnt
-            # we always do this loop to count words.  But if we are matching
-            # pages, do not change chapter nor book_curpg
-            body1 = ebook_data.find("<body")
-            if body1 == -1:
-                self.rdict["error_lst"].append(
-                    f"Fatal error: No <body> found. " f"File: {chapter['disk_file']}"
-                )
-                self.rdict["pager_error"] = True
-                return 0
-            else:
-                ebook_data = ebook_data[body1:]
-                stat = self.process_html(ebook_data)
-                ebook_data = ebook_data[stat["idx"] :]
-            done = False
-            while not done:
-                # self.wrlog(False, f"1 process {ebook_data[:80]}")
-                # copy returns and tabs and spaces
-                lidx = 0
-                while ebook_data[lidx] in ["\n", " ", "\t"]:
-                    lidx += 1
-                ebook_data = ebook_data[lidx:]
-                # self.wrlog(False, f"1+ process {ebook_data[:80]}")
-                stat = self.process_html(ebook_data)
-                if stat["done"]:
-                    # estr = f"writing last: {ebook_data[stat['idx']:]}"
-                    # self.wrlog(False, estr)
-                    done = True
-                else:
-                    ebook_data = ebook_data[stat["idx"] :]
-                # if len(ebook_data) == 0:
-                # self.wrlog(False, (f"File: {chapter['disk_file']} is"
-                #                       f"finished, but no /body found?"))
-                if ebook_data[0] == "<":
-                    continue
-                else:
-                    loc = ebook_data.find("<")
-                    page_words += len(ebook_data[:loc].split())
-                    # self.wrlog(False, f"loc: {loc}; {ebook_data[:80]}")
-                    ebook_data = ebook_data[loc:]
-                    # self.wrlog(False, f"loc: {loc}; {ebook_data[:80]}")
-                    if self.rdict["pgwords"] and not self.rdict["match"]:
-                        if page_words > self.rdict["pgwords"]:
-                            if not self.rdict["match"]:
-                                sct_pgcnt += 1
-                                book_curpg += 1
-                            page_words = page_words - self.pgwords
-            if not self.rdict["match"] and self.DEBUG:
-                lstr = f"Section page count is: {sct_pgcnt}"
-                self.wrlog(False, lstr)
-            # store the section pagecount in the dictionary.
-            if not self.rdict["match"]:
-                chapter["sct_pgcnt"] = sct_pgcnt
-        if self.rdict["pgwords"] and not self.rdict["match"]:
-            self.rdict["pages"] = book_curpg
-        return
+        if self.genplist:
+            self.add_plist_target(curpg, chapter["href"])
+        # the pagebreak span and/or the superscripted page number
+        return self.plan.link(
+            curpg=curpg,
+            pages=self.rdict["pages"],
+            sct_pg=sct_pg,
+            sct_pgcnt=chapter["sct_pgcnt"],
+        )
 
     def scan_file(self, ebook_data, chapter):
         """
         Scan a section file and place page-links, page pagelines,
         superscripts as appropriate.
 
-        This function is very similar to scan_section, but this one adds
-        the pagelinks and page pagelines.
+        The page breaks come from the plan stored in the chapter by
+        set_pages.
+
+        The file is walked with an index cursor and the pieces of the new
+        file are collected in a list that is joined once at the end, so run
+        time is linear in the size of the section.
 
         If this is a converted ebook, then remove existing pagebreak
         links.
 
+        Returns the new section as a str, or for bytes data (engine
+        "bytes") as a list of bytes-like pieces to be written in order.
+
         **Keyword arguments:**
 
         **_ebook_data_**
@@ -1667,145 +4066,366 @@ class epub_paginator:
 
         """
 
-        idx = 0
-        pgbook = ""
+        is_str = isinstance(ebook_data, str)
+        if is_str:
+            mk = str_markup
+            src = ebook_data
+            conv = str
+        else:
+            mk = bytes_markup
+            # slices of a memoryview are not copied
+            src = memoryview(ebook_data)
+            conv = str.encode
+        plan = self.get_plan()
+        pages = self.rdict["pages"]
+        pgbook = []
         sct_pg = 1
+        curpg = chapter["first_pg"]
+        breaks = chapter["pg_breaks"]
+        brk_idx = 0
+        run = -1
         pl_lst = []
-        # scan until we find '<body' and just copy all the header stuff.
-        # we only scan for <body since calibre conversion makes the body
-        # element '<body class=calibre>
-        body1 = ebook_data.find("<body")
-        if body1 == -1:
-            pgbook += ebook_data
+        # the tokens start at '<body', just copy all the header stuff.
+        tokens = chapter.get("tokens")
+        if tokens is None:
+            tokens = self.tokenize(ebook_data, self.big_section(chapter))
+        if tokens is None:
             estr = f"Fatal error: No <body> found in {chapter['disk_file']}"
             self.rdict["error_lst"].append(estr)
             self.rdict["pager_error"] = True
-            return pgbook
-        else:
-            pgbook += ebook_data[:body1]
-            ebook_data = ebook_data[body1:]
-        done = False
-        while not done:
+            return ebook_data
+        pgbook.append(src[: tokens[0][1]])
+        for kind, idx, loc, val in tokens:
             # If we find an html element, just copy it and don't count
             # words
-            if ebook_data[0] == "<":
-                stat = self.process_html(ebook_data[idx:])
-                if stat["done"]:
-                    pgbook += ebook_data
-                    done = True
+            if kind == tk_end:
+                pgbook.append(src[idx:])
+            elif kind == tk_tag:
+                el = src[idx:loc] if val is None else val
+                insfoot = el == mk["p_end"] or el == mk["div_end"]
+                if self.pl_align != "endp":
+                    pgbook.append(el)
+                    if insfoot and pl_lst:
+                        for pl in pl_lst:
+                            pgbook.append(conv(pl))
+                            self.wrlog(
+                                False, f"Inserting pageline: {pl} in {chapter['href']}"
+                            )
+                        pl_lst = []
+                else:
+                    if insfoot and pl_lst:
+                        for pl in pl_lst:
+                            pgbook.append(conv(pl))
+                            self.wrlog(
+                                False, f"Inserting pageline: {pl} in {chapter['href']}"
+                            )
+                        pgbook.append(el)
+                    else:
+                        pgbook.append(el)
+                        pl_lst = []
+            else:
+                # we are at the beginning of a text string, just past
+                # the <p>. It may hold several page breaks when pgwords is
+                # small; split it at each one.
+                run += 1
+                cut = idx
+                words = self.word_ends(ebook_data, idx, loc)
+                wdone = 0
+                while brk_idx < len(breaks) and breaks[brk_idx][0] == run:
+                    need = breaks[brk_idx][1]
+                    # build and stage a pageline because we are at a page
+                    # boundary
+                    if self.pageline:
+                        pl_lst.append(
+                            plan.pageline(
+                                curpg=curpg,
+                                pages=pages,
+                                sct_pg=sct_pg,
+                                sct_pgcnt=chapter["sct_pgcnt"],
+                            )
+                        )
+                    # if the page ends within the first 10 words--or about
+                    # one line--of this text string, put the pagelist entry
+                    # at its start. Otherwise put it after word need.
+                    if cut == idx and need < 10:
+                        brk = idx
+                    else:
+                        brk = next(itertools.islice(words, need - wdone - 1, None))
+                        wdone = need
+                    pgbook.append(src[cut:brk])
+                    pgbook.append(conv(self.page_link(chapter, curpg, sct_pg)))
+                    cut = brk
+                    brk_idx += 1
+                    sct_pg += 1
+                    curpg += 1
+                pgbook.append(src[cut:loc])
+        if is_str:
+            return "".join(pgbook)
+        return pgbook
+
+    def stream_tokens(self, efile):
+        """
+        Streaming form of tokenize() for the "stream" engine. efile is read
+        in pieces of chunk_size characters and tokens are produced as
+        the data arrives, so only one piece, plus any element or word that
+        crosses its end, is held at a time.
+
+        Yields (tk_head, text before <body, None) first, None in place of
+        the text if there is no <body>. Then (tk_tag, element, None),
+        (tk_text, text, word count) and (tk_end, text, None). Text strings
+        longer than a piece are yielded in several tk_text tokens, cut
+        after whitespace so no word is split; </body> and the rest may
+        also come in several tk_end tokens.
+
+        **Keyword arguments:**
+
+        **_efile_**
+
+        Path of the section file.
+
+        """
+
+        chunk = self.chunk_size
+        with self.open_member(efile) as ebook_rfile:
+            buf = ""
+            idx = 0
+            eof = False
+
+            def fill():
+                # drop what has been used and read the next piece
+                nonlocal buf, idx, eof
+                data = ebook_rfile.read(chunk)
+                if not data:
+                    eof = True
+                    return False
+                buf = buf[idx:] + data
+                idx = 0
+                return True
+
+            def find_more(mark, extra):
+                # read until buf[idx:] holds mark and extra characters
+                # after it, or the file is used up
+                while True:
+                    loc = buf.find(mark, idx)
+                    if loc != -1 and loc + len(mark) + extra <= len(buf):
+                        return
+                    if not fill():
+                        return
+
+            # the text before <body is kept whole
+            find_more("<body", 0)
+            body1 = buf.find("<body")
+            if body1 == -1:
+                yield (tk_head, None, None)
+                return
+            yield (tk_head, buf[:body1], None)
+            idx = body1
+            while True:
+                if idx >= len(buf) and not fill():
+                    return
+                if buf[idx] == "<":
+                    # next_element needs the whole element, and all of a
+                    # comment or <nav>
+                    find_more(">", 0)
+                    loc = buf.find(">", idx)
+                    next_idx = loc + 1 if loc != -1 else len(buf)
+                    eltype = el_type.match(buf, idx + 1, next_idx).group()
+                    if eltype[:1] == "<":
+                        eltype = eltype[1:]
+                    if eltype == "!--":
+                        find_more("-->", 0)
+                    elif eltype == "nav":
+                        find_more("/nav", 1)
+                    el, next_idx, done = self.next_element(buf, idx)
+                    if done:
+                        yield (tk_end, buf[idx:], None)
+                        while True:
+                            data = ebook_rfile.read(chunk)
+                            if not data:
+                                return
+                            yield (tk_end, data, None)
+                    yield (tk_tag, el, None)
+                    idx = next_idx
+                    continue
+                loc = buf.find("<", idx)
+                if loc == -1 and eof:
+                    loc = len(buf)
+                if loc != -1:
+                    text = buf[idx:loc]
+                    yield (tk_text, text, len(text.split()))
+                    idx = loc
+                    continue
+                # the text string runs past the piece, pass on what ends
+                # in whitespace
+                loc = len(buf)
+                while loc > idx and not buf[loc - 1].isspace():
+                    loc -= 1
+                if loc > idx:
+                    text = buf[idx:loc]
+                    yield (tk_text, text, len(text.split()))
+                    idx = loc
+                fill()
+
+    def stream_count(self, chapter):
+        """
+        scan_section for the "stream" engine. Nothing is kept in chapter.
+
+        Returns the list of word counts of the text strings in the
+        section, or None if the section has no <body>.
+        """
+
+        run_words = []
+        in_text = False
+        tokens = self.stream_tokens(self.section_path(chapter))
+        if next(tokens)[1] is None:
+            self.rdict["error_lst"].append(
+                f"Fatal error: No <body> found. " f"File: {chapter['disk_file']}"
+            )
+            self.rdict["pager_error"] = True
+            return None
+        for kind, data, words in tokens:
+            if kind == tk_text:
+                if in_text:
+                    run_words[-1] += words
                 else:
-                    if self.pl_align != 'endp':
-                        # pgbook += ebook_data[: stat["idx"]]
-                        pgbook += stat["el"]
-                        ebook_data = ebook_data[stat["idx"] :]
-                        insfoot = stat["el"] == "</p>" or stat["el"] == "</div>"
+                    run_words.append(words)
+            in_text = kind == tk_text
+        return run_words
+
+    def stream_file(self, chapter):
+        """
+        scan_file for the "stream" engine. The section is paginated as it
+        is read by stream_tokens() and written to a new file which then
+        replaces it, so the section is never held in memory. The output is
+        the same as scan_file followed by chk_xmlns.
+
+        **Keyword arguments:**
+
+        **_chapter_**
+
+        Dictionary containing the href for use in pagelinks and pages in
+        the section.
+
+        """
+
+        efile = self.section_path(chapter)
+        tokens = self.stream_tokens(efile)
+        header = next(tokens)[1]
+        if header is None:
+            estr = f"Fatal error: No <body> found in {chapter['disk_file']}"
+            self.rdict["error_lst"].append(estr)
+            self.rdict["pager_error"] = True
+            return
+        # the <html> element is in the text before <body
+        header = self.chk_xmlns(header)
+        if self.rdict["pager_error"]:
+            tokens.close()
+            return
+        plan = self.get_plan()
+        pages = self.rdict["pages"]
+        sct_pg = 1
+        curpg = chapter["first_pg"]
+        breaks = chapter["pg_breaks"]
+        brk_idx = 0
+        run = -1
+        pl_lst = []
+        in_text = False
+        ebook_wfile = self.create_member(efile)
+        with ebook_wfile:
+            wr = ebook_wfile.write
+            wr(header)
+            for kind, data, words in tokens:
+                if kind == tk_end:
+                    wr(data)
+                elif kind == tk_tag:
+                    insfoot = data == "</p>" or data == "</div>"
+                    if self.pl_align != "endp":
+                        wr(data)
                         if insfoot and pl_lst:
                             for pl in pl_lst:
-                                pgbook += pl
+                                wr(pl)
                                 self.wrlog(
-                                    False, f"Inserting pageline: {pl} in {chapter['href']}"
+                                    False,
+                                    f"Inserting pageline: {pl} in {chapter['href']}",
                                 )
                             pl_lst = []
                     else:
-                        ebook_data = ebook_data[stat["idx"] :]
-                        insfoot = stat["el"] == "</p>" or stat["el"] == "</div>"
                         if insfoot and pl_lst:
                             for pl in pl_lst:
-                                pgbook += pl
+                                wr(pl)
                                 self.wrlog(
-                                    False, f"Inserting pageline: {pl} in {chapter['href']}"
+                                    False,
+                                    f"Inserting pageline: {pl} in {chapter['href']}",
                                 )
-                            pgbook += stat["el"]
+                            wr(data)
                         else:
-                            # pgbook += ebook_data[: stat["idx"]]
-                            pgbook += stat["el"]
-                            # ebook_data = ebook_data[len(stat["el"]):]
+                            wr(data)
                             pl_lst = []
-            else:
-                # we are at the beginning of a text string, just past
-                # the <p>
-                loc = ebook_data.find("<")
-                wdcnt = len(ebook_data[:loc].split())
-                # new need calculation
-                need = self.pgwords - self.pg_wcnt
-                self.pg_wcnt += wdcnt
-                
-                if self.pg_wcnt >= self.pgwords:
-                    # self.wrlog(False, f"need {need} words and we crossed page {self.curpg} with {wdcnt} words added.")
-                    # self.wrlog(
-                    #     False,
-                    #     (f"Pageline {self.curpg} covers {self.pg_wcnt} words."),
-                    # )
-                    # build and stage a pageline because we are at a page
-                    # boundary
-                    if self.pageline:
-                        pl_lst.append(
-                            self.bld_pageline(self.curpg, sct_pg, chapter["sct_pgcnt"])
-                        )
-                    # need == -1 means page ends just before this
-                    # paragraph, put the pagelist entry here. Also,
-                    # place it here if need is less than 10--or about
-                    # one line.
-                    if need < 10:
-                        # self.wrlog(False, f"Placing plist beginning")
-                        if self.genplist:
-                            pstr = (
-                                f'<span epub:type="pagebreak" '
-                                f'id="{pglnk}{self.curpg}" '
-                                f' role="doc-pagebreak" '
-                                f'title="{self.curpg}"/>'
+                else:
+                    # a text string may come in several pieces, count the
+                    # words of the string across them.
+                    if not in_text:
+                        run += 1
+                        wdone = 0
+                        at_start = True
+                    cut = 0
+                    found = wdone
+                    found_words = word_re.finditer(data)
+                    while brk_idx < len(breaks) and breaks[brk_idx][0] == run:
+                        need = breaks[brk_idx][1]
+                        if at_start and need < 10:
+                            brk = 0
+                        elif need <= wdone + words:
+                            word = next(
+                                itertools.islice(found_words, need - found - 1, None)
                             )
-                            pgbook += pstr
-                            self.add_plist_target(self.curpg, chapter["href"])
-                        # and insert the superscripted page number
-                        if self.superscript:
-                            pgbook += self.new_super(
-                                self.curpg, sct_pg, chapter["sct_pgcnt"]
+                            found = need
+                            brk = word.end()
+                            at_start = False
+                        else:
+                            break
+                        if self.pageline:
+                            pl_lst.append(
+                                plan.pageline(
+                                    curpg=curpg,
+                                    pages=pages,
+                                    sct_pg=sct_pg,
+                                    sct_pgcnt=chapter["sct_pgcnt"],
+                                )
                             )
-                        pgbook += ebook_data[:loc]
-                        ebook_data = ebook_data[loc:]
-                    else:
-                        # now count words and put in pgbook until we get to
-                        # our next page locaton--this is need words.
-                        lidx = 0
-                        words = 0
-                        while lidx < loc:
-                            # self.wrlog(False, f"lidx: {lidx}.")
-                            if ebook_data[lidx] == " ":
-                                words += 1
-                            if words == need:
-                                # estr = f"Insert page link at {self.pg_wcnt - wdcnt + words}"
-                                # self.wrlog(False, estr)
-                                if self.genplist:
-                                    pstr = (
-                                        f'<span epub:type="pagebreak" '
-                                        f'id="{pglnk}{self.curpg}" '
-                                        f' role="doc-pagebreak" '
-                                        f'title="{self.curpg}"/>'
-                                    )
-                                    pgbook += pstr
-                                    self.add_plist_target(self.curpg, chapter["href"])
-                                # and insert the superscripted page number
-                                if self.superscript:
-                                    pgbook += self.new_super(
-                                        self.curpg,
-                                        sct_pg,
-                                        chapter["sct_pgcnt"],
-                                    )
-                                pgbook += ebook_data[lidx:loc]
-                                lidx = loc
-                            else:
-                                pgbook += ebook_data[lidx]
-                                lidx += 1
-                        ebook_data = ebook_data[loc:]
-                    sct_pg += 1
-                    self.curpg += 1
-                    self.pg_wcnt = self.pg_wcnt - self.pgwords
-                    # self.wrlog(False, f"Page {self.curpg} starts with {self.pg_wcnt} words.")
-                else:
-                    pgbook += ebook_data[:loc]
-                    ebook_data = ebook_data[loc:]
-        return pgbook  
+                        wr(data[cut:brk])
+                        wr(self.page_link(chapter, curpg, sct_pg))
+                        cut = brk
+                        brk_idx += 1
+                        sct_pg += 1
+                        curpg += 1
+                    wr(data[cut:])
+                    wdone += words
+                in_text = kind == tk_text
+            self.close_member(efile, ebook_wfile)
+
+    def word_ends(self, ebook_data, idx, loc):
+        """
+        Yield the offset just past each word of the text string
+        ebook_data[idx:loc], words being split as str.split() does.
+        """
+
+        if isinstance(ebook_data, str):
+            for word in word_re.finditer(ebook_data, idx, loc):
+                yield word.end()
+            return
+        text = ebook_data[idx:loc]
+        if text.isascii():
+            for word in bytes_markup["word"].finditer(ebook_data, idx, loc):
+                yield word.end()
+            return
+        # decode the string and count the encoded length of each piece
+        text = text.decode("utf-8")
+        cut = 0
+        for word in word_re.finditer(text):
+            idx += len(text[cut : word.end()].encode("utf-8"))
+            cut = word.end()
+            yield idx
 
     def scan_match_file(self, ebook_data, chapter):
         """
@@ -1813,7 +4433,7 @@ class epub_paginator:
         insert pagelines/superscripts matching existing paging.
 
         Scan a section file and place page pagelines, superscripts based
-        on existing pagebreaks.
+        on existing pagebreaks, as found by find_pagebreaks.
 
         **Keyword arguments:**
 
@@ -1827,112 +4447,60 @@ class epub_paginator:
 
         """
 
-        pgbook = ""
+        plan = self.get_plan()
+        # the existing pagebreak elements, usually found by scan_section
+        marks = chapter.pop("pg_marks", None)
+        if marks is None:
+            marks = self.find_pagebreaks(ebook_data, chapter)
+        pgbook = []
         sct_pg = 1
-        # just find existing pagebreak entries
-        not_done = True
-        while not_done:
-            plink_loc = ebook_data.find('epub:type="pagebreak"')
-            # some aria type files don't have epub:type="pagebreak"
-            plink_loc1 = ebook_data.find('role="doc-pagebreak"')
-            if plink_loc == -1 and plink_loc1 == -1:
-                pgbook += ebook_data
-                not_done = False
+        idx = 0
+        for start, end, thispage in marks:
+            if start < idx:
+                # copied with the paragraph of the previous pagebreak
+                continue
+            pgbook.append(ebook_data[idx:end])
+            idx = end
+            # insert superscript here
+            if self.superscript:
+                sstr = plan.superscript(
+                    curpg=thispage,
+                    pages=self.rdict["pages"],
+                    sct_pg=sct_pg,
+                    sct_pgcnt=chapter["sct_pgcnt"],
+                )
+                pgbook.append(sstr)
+            # scan for next paragraph start or end and insert pageline.
+            # Could miss a page if a paragraph contains two page links
+            loc = ebook_data.find("</p>", idx)
+            if loc == -1:
+                lstr = (
+                    f"Warning: {chapter['disk_file']}: Did not find </p> for"
+                    f" matched pageline."
+                )
+                self.wrlog(False, lstr)
+                self.rdict["warn_lst"].append(lstr)
+                lstr = f"--> thispage: {thispage}; " f"sct_pg: {sct_pg}"
+                self.wrlog(False, lstr)
+                self.rdict["warn_lst"].append(lstr)
+                self.rdict["pager_warn"] = True
             else:
-                if plink_loc == -1:
-                    plink_loc = plink_loc1
-                # find the start of the <span because sometimes
-                # aria-label is before the epub:type
-                spanst = ebook_data[:plink_loc].rfind("<span")
-                pgbook += ebook_data[:spanst]
-                ebook_data = ebook_data[spanst:]
-                # Find the page number. Could be title or aria-label or id
-                loctitle = ebook_data.find("title=")
-                loclabel = ebook_data.find("aria-label=")
-                locid = ebook_data.find("id=")
-                if loctitle == -1 and loclabel == -1 and locid == -1:
-                    estr = (
-                        f"Error: {chapter['disk_file']}: "
-                        f"Did not find title or aria-label or id "
-                        f"for pagebreak"
-                    )
-                    self.wrlog(False, estr)
-                    self.rdict["warn_lst"].append(estr)
-                    self.rdict["pager_warn"] = True
-                    pgbook += ebook_data
-                    not_done = False
-                else:
-                    loc = 0  # only here to reassure linter
-                    if loctitle != -1:
-                        loc = loctitle
-                        loc += len("title=")
-                    elif loclabel != -1:
-                        loc = loclabel
-                        loc += len("aria-title")
-                    elif locid != -1:
-                        loc = locid
-                        loc += len("id")
-                    pgbook += ebook_data[:loc]
-                    ebook_data = ebook_data[loc:]
-                    qlist = ebook_data.split('"')
-                    thispage = qlist[1]
-                    if locid != -1:
-                        newpage = ""
-                        for c in thispage:
-                            if c.isdigit():
-                                newpage += c
-                        if newpage:
-                            thispage = newpage
-                    # now find the end of this element '/'
-                    loc = ebook_data.find("/")
-                    loc += 1
-                    if ebook_data[loc] == ">":
-                        # if next char is a >, found it
-                        loc += 1
-                    else:
-                        # otherwise must find 'span>'
-                        if ebook_data.find("span>") == -1:
-                            estr = (
-                                f"Error: {chapter['disk_file']}: "
-                                f"In match mode did not find "
-                                f"closing span for pagebreak"
-                            )
-                            self.wrlog(False, estr)
-                            self.rdict["warn_lst"].append(estr)
-                            self.rdict["pager_warn"] = True
-                        else:
-                            loc += len("span>")
-                    pgbook += ebook_data[:loc]
-                    ebook_data = ebook_data[loc:]
-                    # insert superscript here
-                    if self.superscript:
-                        sstr = self.new_super(thispage, sct_pg, chapter["sct_pgcnt"])
-                        pgbook += sstr
-                    # scan for next paragraph start or end and insert pageline.
-                    # Could miss a page if a paragraph contains two page links
-                    loc = ebook_data.find("</p>")
-                    if loc == -1:
-                        lstr = (
-                            f"Warning: {chapter['disk_file']}: Did not find </p> for"
-                            f" matched pageline."
+                if self.pl_align != "endp":
+                    loc += 4
+                pgbook.append(ebook_data[idx:loc])
+                idx = loc
+                if self.pageline:
+                    pgbook.append(
+                        plan.pageline(
+                            curpg=thispage,
+                            pages=self.rdict["pages"],
+                            sct_pg=sct_pg,
+                            sct_pgcnt=chapter["sct_pgcnt"],
                         )
-                        self.wrlog(False, lstr)
-                        self.rdict["warn_lst"].append(lstr)
-                        lstr = f"--> thispage: {thispage}; " f"sct_pg: {sct_pg}"
-                        self.wrlog(False, lstr)
-                        self.rdict["warn_lst"].append(lstr)
-                        self.rdict["pager_warn"] = True
-                    else:
-                        if self.pl_align != 'endp':
-                            loc += 4
-                        pgbook += ebook_data[:loc]
-                        ebook_data = ebook_data[loc:]
-                        if self.pageline:
-                            pgbook += self.bld_pageline(
-                                thispage, sct_pg, chapter["sct_pgcnt"]
-                            )
-                    sct_pg += 1
-        return pgbook
+                    )
+            sct_pg += 1
+        pgbook.append(ebook_data[idx:])
+        return "".join(pgbook)
 
     def run_chk_external(self, original):
         t1 = time.perf_counter()
@@ -1944,9 +4512,45 @@ class epub_paginator:
             self.wrlog(True, "Running external epubcheck on paged epub file:")
             epubcheck_cmd = [self.epubcheck, self.rdict["bk_outfile"]]
         result = run(epubcheck_cmd, stdout=PIPE, stderr=PIPE, universal_newlines=True)
+        self.log_chk(original, result.stdout, result.stderr, time.perf_counter() - t1)
+
+    def run_chk_service(self, original):
+        """
+        Run epubcheck through a chk_service of the epubcheck jar chk_service.
+        Return False if the service could not be used.
+        """
+
+        t1 = time.perf_counter()
+        if original:
+            epub = str(self.epub_file)
+        else:
+            epub = str(self.rdict["bk_outfile"])
+        if "\n" in epub:
+            return False
+        try:
+            service = chk_service.acquire(self.chk_service)
+            status, report = service.check(epub)
+        except OSError as exc:
+            self.wrlog(False, str(exc))
+            return False
+        service.release()
+        self.wrlog(False, "---------------------------")
+        if original:
+            self.wrlog(True, "Running epubcheck service on original epub file:")
+        else:
+            self.wrlog(True, "Running epubcheck service on paged epub file:")
+        self.log_chk(original, report, "", time.perf_counter() - t1)
+        return True
+
+    def log_chk(self, original, output, errors, et):
+        """
+        Log the output and errors of an epubcheck run that took et seconds
+        and save its fatal and error counts in rdict.
+        """
+
         # check and log the errors from epubcheck
         err = False
-        for line in result.stdout.splitlines():
+        for line in output.splitlines():
             # with -e ignoring warnings
             # Messages: 0 fatals / 0 errors
             # 0         1 2      3 4
@@ -1995,11 +4599,9 @@ class epub_paginator:
                                 f"errors reported in epubcheck."
                             ),
                         )
-        self.wrlog(False, result.stdout)
-        if len(result.stderr) > 0:
-            self.wrlog(False, result.stderr)
-        t2 = time.perf_counter()
-        et = t2 - t1
+        self.wrlog(False, output)
+        if len(errors) > 0:
+            self.wrlog(False, errors)
         self.wrlog(True, f"    epubcheck took {et:.2f} seconds.")
         if err:
             self.wrlog(True, f"    Errors were reported")
@@ -2077,7 +4679,201 @@ class epub_paginator:
             self.rdict["epubchkpage_time"] = et
         return
 
+    def start_chk_orig(self):
+        """
+        Start run_chk on the original epub file on a thread, so that it is
+        checked while it is paginated. The check is run by a new
+        epub_paginator with only the configuration and epub_file of this
+        one, so it shares no state with the pagination. Its log messages
+        and results are kept apart until join_chk_orig.
+        """
+
+        checker = epub_paginator()
+        for key, val in self.settings().items():
+            setattr(checker, key, val)
+        checker.epub_file = self.epub_file
+        checker.log_lines = []
+        checker.rdict = {}
+        thread = threading.Thread(target=checker.run_chk, args=(True,), daemon=True)
+        thread.start()
+        self.chk_orig_job = (thread, checker)
+
+    def join_chk_orig(self):
+        """
+        Wait for the check started by start_chk_orig, if any, then log its
+        messages and copy its results to rdict.
+        """
+
+        if self.chk_orig_job is None:
+            return
+        thread, checker = self.chk_orig_job
+        self.chk_orig_job = None
+        thread.join()
+        for stdout, message in checker.log_lines:
+            self.wrlog(stdout, message)
+        self.rdict.update(checker.rdict)
+
     def run_chk(self, original):
+        """
+        Run epubcheck (see run_epubcheck) on the original or the paged
+        epub file. With chk_cache, the results and log messages of each
+        check are kept in the epubcheck subdirectory of cache_dir, keyed by
+        the sha256 of the file checked and by chk_version, and a file that
+        was checked before is not checked again.
+
+        **Instance Variables**
+
+        **_original_** -- Original file or paged output file to be
+        checked
+        """
+
+        key = ""
+        if self.chk_cache and self.cache_dir:
+            version = self.chk_version()
+            if version:
+                if original:
+                    epub = self.epub_file
+                else:
+                    epub = self.rdict["bk_outfile"]
+                with open(epub, "rb") as rfile:
+                    digest = stream_digest(rfile)
+                key = hashlib.sha256(f"{digest}:{version}".encode()).hexdigest()
+        if not key:
+            self.run_epubcheck(original)
+            return
+        entry = self.cache("epubcheck").get(key)
+        if entry is not None:
+            record = json.loads((entry / "check.json").read_text(encoding="utf-8"))
+            self.wrlog(True, "epubcheck results found in cache:")
+            for stdout, message in record["log"]:
+                self.wrlog(stdout, message)
+            self.rdict.update(record["results"])
+            return
+        if original:
+            fields = ("orig_fatal", "orig_error", "orig_warn")
+        else:
+            fields = ("echk_fatal", "echk_error")
+        # keep the messages of the check to store them
+        log_lines = self.log_lines
+        self.log_lines = []
+        try:
+            self.run_epubcheck(original)
+        finally:
+            messages = self.log_lines
+            self.log_lines = log_lines
+        for stdout, message in messages:
+            self.wrlog(stdout, message)
+        record = {
+            "log": messages,
+            "results": {field: self.rdict.get(field, 0) for field in fields},
+        }
+        self.cache("epubcheck").put(
+            key, {"check.json": json.dumps(record).encode("utf-8")}
+        )
+
+    def run_chk_native(self):
+        """
+        Check the paged epub without epubcheck: the members rewritten by
+        pagination (see paged_members) are parsed as XML, by worker
+        processes if use_pool(), and a generated page-list must number the
+        pages from 1 to the number of pages without gaps, each href
+        resolving to an inserted pagebreak id. The number of problems found
+        is saved as native_error in rdict.
+        """
+
+        t1 = time.perf_counter()
+        self.wrlog(False, "---------------------------")
+        self.wrlog(True, "Running native check on paged epub file:")
+        epub = self.rdict["bk_outfile"]
+        with zipfile.ZipFile(epub) as zfile:
+            present = set(zfile.namelist())
+        names = sorted(name for name in self.paged_members() if name in present)
+        workers = min(self.workers, len(names))
+        results = None
+        if (
+            self.use_pool()
+            and workers > 1
+            and not isinstance(epub, io.BytesIO)
+            and not self.rdict["pool_broken"]
+        ):
+            try:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    shards = [names[i::workers] for i in range(workers)]
+                    parts = pool.map(xml_check, [str(epub)] * workers, shards)
+                    results = [result for part in parts for result in part]
+            except BrokenProcessPool:
+                self.wrlog(False, "The worker processes stopped, checking here.")
+        if results is None:
+            results = xml_check(epub, names)
+        problems = []
+        ids = {}
+        for name, error, member_ids in results:
+            ids[name] = member_ids
+            if error:
+                problems.append(f"{name} is not well-formed: {error}")
+        if self.genplist and self.rdict["nav_file"] != "None":
+            nav_name = self.member_name(self.rdict["nav_file"])
+            with zipfile.ZipFile(epub) as zfile:
+                nav_data = zfile.read(nav_name).decode("utf-8")
+            index = nav_page_index(nav_data, os.path.dirname(nav_name))
+            pages = set()
+            for label, (pfile, fragment) in index.targets.items():
+                if not label.isdigit():
+                    problems.append(f"page-list label {label!r} is not a page number")
+                    continue
+                pages.add(int(label))
+                if fragment not in ids.get(pfile, ()):
+                    problems.append(
+                        f"page-list page {label} does not resolve: {pfile}#{fragment}"
+                    )
+            # the last page has no pagebreak when it ends short of a full page
+            last = max(pages, default=0)
+            missing = set(range(1, last + 1)) - pages
+            if missing:
+                problems.append(
+                    f"page-list is missing {len(missing)} pages, first {min(missing)}"
+                )
+            if last < self.rdict["pages"] - 1:
+                problems.append(
+                    f"page-list ends at page {last} of {self.rdict['pages']}"
+                )
+            if index.unclosed:
+                problems.append("page-list has an <a> without href or </a>")
+        for problem in problems[:20]:
+            self.wrlog(True, f"--> {problem}")
+        if len(problems) > 20:
+            self.wrlog(True, f"--> and {len(problems) - 20} more problems")
+        self.rdict["native_error"] = len(problems)
+        et = time.perf_counter() - t1
+        self.rdict["chknative_time"] = et
+        self.wrlog(True, f"    native check of {len(names)} files took {et:.2f} seconds.")
+        if problems:
+            self.wrlog(True, f"    {len(problems)} problems were reported")
+        else:
+            self.wrlog(True, f"    No problems were reported")
+
+    def chk_version(self):
+        """
+        Return a string identifying the epubcheck run_epubcheck uses, "" if
+        there is none: the path, size and modification time of the
+        chk_service jar or the external epubcheck, or the version of the
+        epubcheck module. An external epubcheck script that runs another
+        epubcheck is identified by the script only.
+        """
+
+        if self.chk_service and Path(self.chk_service).is_file():
+            path = Path(self.chk_service)
+        elif Path(self.epubcheck).is_file():
+            path = Path(self.epubcheck)
+        elif has_echk:
+            module = sys.modules.get("epubcheck")
+            return f"epubcheck module {getattr(module, '__version__', '')}"
+        else:
+            return ""
+        stat = path.stat()
+        return f"{path.resolve()} {stat.st_size} {stat.st_mtime_ns}"
+
+    def run_epubcheck(self, original):
         """
         Run epubcheck on the epub source file. Copy results to log file.
         Save error counts to global rdict.
@@ -2086,13 +4882,17 @@ class epub_paginator:
         runs in 2-5 seconds, and the epubcheck python module, which takes about
         5x longer to run. If the external epubcheck is available
         (self.epubcheck != "none", then run it, otherwise see if the module is
-        available and run it.
+        available and run it. If chk_service is set, the epubcheck jar is
+        run by a chk_service instead, falling back to the above if the
+        service cannot be used.
 
         **Instance Variables**
 
         **_original_** -- Original file or paged output file to be
         checked
         """
+        if self.chk_service and self.run_chk_service(original):
+            return
         if Path(self.epubcheck).is_file():
             self.wrlog(False, f"Running external epubcheck.")
             self.run_chk_external(original)
@@ -2104,60 +4904,54 @@ class epub_paginator:
                 self.wrlog(False, f" --> No epubcheck is available.")
                 return
 
-    def read_opf(self, epub_file):# {{{
-        "Read the opf file data from the epub zipfile and return the opf_path and opf_data."
-
-        opf_data = "No opf data"
-        opf_path = "No opf path"
-        # find the opf file
-
-        with zipfile.ZipFile(epub_file) as zfile:
-            with zfile.open(f"META-INF/container.xml") as c:
-                c_data = c.read()
-
-                cs = str(c_data)
-                rloc = cs.find("<rootfiles>")
-                if rloc == -1:
-                    print("Error: did not find <rootfiles> in container")
-                    return (opf_path, opf_data)
-                cs = cs[rloc + 3 :]
-                rloc = cs.find("<rootfile")
-                if rloc == -1:
-                    print("Error: did not find <rootfile in container")
-                    return (opf_path, opf_data)
-                cs = cs[rloc + 3 :]
-                rloc = cs.find("full-path=")
-                if rloc == -1:
-                    print("Error: did not find full-path in container")
-                    return (opf_path, opf_data)
-                cs = cs[rloc + 3 :]
-                opflist = cs.split('"')
-                opf_path = f"{opflist[1]}"  # d/d/d/fname
-                # print(f"opf_path: {opf_path}")
-                if opf_path == "":
-                    print(
-                        "Error: apparently opf file was not found. Return value was blank."
-                    )
-                    return (opf_path, opf_data)
-                # print(opf_path)
-                opf = opf_path.split("/")
-                # print(f"opf.split: {opf}; opf len: {len(opf)}")
-                opf_file = opf[len(opf) - 1]
-                opf = opf[: len(opf) - 1]
-                opf_path = ""
-                for d in opf:
-                    opf_path += f"{d}/"
-                # print(f"{opf_path} - {opf_file}; cat: {opf_path}/{opf_file}")
-                # with zfile.open(f"{opf_path}{opf_file}") as o:
-                with io.TextIOWrapper(
-                    zfile.open(f"{opf_path}{opf_file}"), encoding="utf-8"
-                ) as o:
-                    opf_data = o.read()
-                    # opf_data = str(opf_b)
-                return (opf_path, opf_data)# }}}
-
-
-    def paginate_epub(self, source_epub) -> typing.Dict:
+    def paginate_bytes(self, epub, name="book.epub"):
+        """
+        **paginate_bytes**
+
+        Paginate an epub held in memory. No file is read or written: the
+        epub is paginated in_memory and the log is kept in memory.
+
+        epubcheck and conversion to epub3 need files and are not run, so an
+        epub2 is paginated without a page-list. Worker processes are not
+        used.
+
+        Returns a tuple of the paged epub as bytes, None if it was not
+        paginated, and the rdict of paginate_epub, with the log text in
+        rdict["log"]. The configuration is restored on return, so one
+        epub_paginator can paginate a series of epubs.
+
+        **Keyword arguments:**
+
+        **_epub_** -- The ePub, as bytes or a binary file object.
+
+        **_name_** -- File name of the ePub, which gives the title.
+
+        """
+
+        if isinstance(epub, (bytes, bytearray, memoryview)):
+            epub = io.BytesIO(epub)
+        saved = self.settings()
+        self.in_memory = True
+        self.chk_orig = False
+        self.chk_paged = False
+        self.ebookconvert = "none"
+        self.log_stream = io.StringIO()
+        try:
+            rdict = self.paginate_epub(epub, name)
+        finally:
+            for key, val in saved.items():
+                setattr(self, key, val)
+            log_text = self.log_stream.getvalue()
+            self.log_stream = None
+        rdict["log"] = log_text
+        paged = None
+        if isinstance(rdict["bk_outfile"], io.BytesIO):
+            if not rdict["pager_error"]:
+                paged = rdict["bk_outfile"].getvalue() or None
+            rdict["bk_outfile"] = ""
+        return (paged, rdict)
+
+    def paginate_epub(self, source_epub, name="") -> typing.Dict:
 
         """
         **paginate_epub**
@@ -2178,17 +4972,39 @@ class epub_paginator:
 
         **Keyword arguments:**
 
-        **_source_epub_** -- The original ePub file to modify.
+        **_source_epub_** -- The original ePub file to modify, or a binary
+        file object holding it (see paginate_bytes).
+
+        **_name_** -- File name of a file object source_epub.
+
+        match and genplist, which are turned off for a book that cannot
+        use them, are restored on return, so the next book is paginated
+        with the same configuration.
+
+        """
+
+        settings = self.settings()
+        try:
+            return self.paginate_book(source_epub, name, settings)
+        finally:
+            self.match = settings["match"]
+            self.genplist = settings["genplist"]
 
+    def paginate_book(self, source_epub, name, settings):
+        """
+        Paginate source_epub for paginate_epub. settings is the
+        configuration when paginate_epub was called, before the book
+        changes match or genplist; the cache key is made from it.
         """
 
         t1pagination = time.perf_counter()
         # re-initialize on each call
-        self.curpg = 1
         self.tot_wcnt = 0
-        self.pg_wcnt = 0
-        self.plist = ""
+        self.run_words = []
+        self.first_runs = []
+        self.plist = page_targets()
         self.bk_flist = []
+        self.close_zip()
 
         # rdict definition 
         self.rdict["logfile"] = ""  # logfile Path
@@ -2219,23 +5035,32 @@ class epub_paginator:
         self.rdict["convert_time"] = 0  # time to convert from epub2 to epub3
         self.rdict["paginate_time"] = 0  # time to paginate the epub
         self.rdict["epubchkpage_time"] = 0  # time to run epubcheck on paged epub
+        self.rdict["native_error"] = 0  # problems found by run_chk_native
+        self.rdict["chknative_time"] = 0  # time to run run_chk_native
         self.rdict["epubchkorig_time"] = 0  # time to run epubcheck on original epub
         self.rdict["messages"] = ""  # list of messages generated.
+        self.rdict["pipeline"] = {}  # pipe_stage statistics, see pipe_report
+        self.rdict["pool_broken"] = False  # the worker pool stopped, see pool_map
         
 
         # initialize logfile
         # The epub name is the book file name with spaces removed and '.epub'
         # removed.
-        if not Path(source_epub).is_file():
+        from_memory = hasattr(source_epub, "read")
+        digest = None  # sha256 of source_epub, see cache_key
+        if from_memory:
+            # paginate_bytes, there is no file name
+            source_name = name
+        elif not Path(source_epub).is_file():
             self.wrlog(True, "Fatal error: Source epub not found.")
             self.rdict["error_lst"].append("Fatal error: Source epub not found.")
             self.rdict["pager_error"] = True
             return self.rdict
+        else:
+            source_name = source_epub
         # file is valid, verify that it is not already paged by epubpager
-        ot = self.read_opf(source_epub)
-        opf_data = ot[1]
-        lem = opf_data.find('<meta name="tlbepubpager:modified"')
-        if lem != -1:
+        self.package = epub_package.from_zip(source_epub)
+        if "tlbepubpager:modified" in self.package.metadata:
             # self.wrlog(True,f"Fatal error: File already paginated")
             self.rdict["error_lst"].append("This file is already paged by epubpager.")
             self.rdict["pager_error"] = True
@@ -2246,23 +5071,39 @@ class epub_paginator:
             self.rdict["error_lst"].append("Fatal error: output directory not found.")
             self.rdict["pager_error"] = True
             return self.rdict
+        if self.workdir:
+            Path(self.workdir).mkdir(parents=True, exist_ok=True)
 
-        dirsplit = source_epub.split("/")
+        dirsplit = source_name.split("/")
         stem_name = dirsplit[len(dirsplit) - 1].replace(" ", "")
         self.rdict["title"] = stem_name.replace(".epub", "")
-        self.logpath = Path(f"{self.outdir}/{self.rdict['title']}.log")
-        self.rdict["logfile"] = self.logpath
-        print(f"Create log file: {self.logpath}")
-        with self.logpath.open("w") as logfile:
-            logfile.write("Creating log file." + "\n")
+        if self.log_stream is not None:
+            self.log_stream.write("Creating log file." + "\n")
+        else:
+            self.logpath = Path(f"{self.outdir}/{self.rdict['title']}.log")
+            self.rdict["logfile"] = self.logpath
+            print(f"Create log file: {self.logpath}")
+            with self.logpath.open("w") as logfile:
+                logfile.write("Creating log file." + "\n")
 
         self.wrlog(False, echk_message)
+        self.wrlog(False, zip_raw_message)
 
         # copy the source epub file to stem_name
-        self.epub_file = f"{self.outdir}/{self.rdict['title']}_orig.epub"
-        shutil.copyfile(source_epub,self.epub_file)
+        if self.in_memory:
+            # the source is only read
+            self.epub_file = source_epub
+        else:
+            self.epub_file = f"{self.work_dir()}/{self.rdict['title']}_orig.epub"
+            if self.cache_dir:
+                # hash the source for cache_key while it is copied
+                digest = copy_digest(source_epub, self.epub_file)
+            else:
+                shutil.copyfile(source_epub,self.epub_file)
         self.wrlog(True,f"Operating on epub file: {self.epub_file}")
-        if self.epubcheck.casefold() != "none" and (self.chk_orig or self.chk_paged):
+        if self.chk_service and (self.chk_orig or self.chk_paged):
+            self.wrlog(False, f"epubcheck service will be run.")
+        elif self.epubcheck.casefold() != "none" and (self.chk_orig or self.chk_paged):
             self.wrlog(False, f"External epubcheck will be run.")
         elif has_echk and (self.chk_orig or self.chk_paged):
             self.wrlog(False, f"Python epubcheck module will be run.")
@@ -2274,6 +5115,7 @@ class epub_paginator:
         # dump configuration
         self.wrlog(False, f"Configuration:")
         self.wrlog(False, f"  outdir: {self.outdir}")
+        self.wrlog(False, f"  workdir: {self.workdir}")
         self.wrlog(False, f"  match: {self.match}")
         self.wrlog(False, f"  genplist: {self.genplist}")
         self.wrlog(False, f"  pgwords: {self.pgwords}")
@@ -2294,23 +5136,41 @@ class epub_paginator:
         self.wrlog(False, f"  epubcheck: {self.epubcheck}")
         self.wrlog(False, f"  chk_orig: {self.chk_orig}")
         self.wrlog(False, f"  chk_paged: {self.chk_paged}")
+        self.wrlog(False, f"  in_memory: {self.in_memory}")
+        self.wrlog(False, f"  compress_level: {self.compress_level}")
+        self.wrlog(False, f"  queue_depth: {self.queue_depth}")
+        self.wrlog(False, f"  cache_dir: {self.cache_dir}")
+        self.wrlog(False, f"  chk_service: {self.chk_service}")
+        self.wrlog(False, f"  chk_cache: {self.chk_cache}")
+        self.wrlog(False, f"  chk_native: {self.chk_native}")
         self.wrlog(False, f"  DEBUG: {self.DEBUG}")
         self.wrlog(False, "\n")
 
-        self.rdict["bk_outfile"] = Path(
-            f"{self.outdir}/{self.rdict['title']}_paged.epub"
-        )
-        self.rdict["unzip_path"] = Path(f"{self.outdir}/{self.rdict['title']}")
+        if from_memory:
+            self.rdict["bk_outfile"] = io.BytesIO()
+        else:
+            self.rdict["bk_outfile"] = Path(
+                f"{self.outdir}/{self.rdict['title']}_paged.epub"
+            )
+        self.rdict["unzip_path"] = Path(f"{self.work_dir()}/{self.rdict['title']}")
+        if self.cache_dir:
+            cache_key = self.cache_key(source_epub, digest, settings)
+            if self.cache_fetch(cache_key):
+                if not self.in_memory:
+                    Path(self.epub_file).unlink(missing_ok=True)
+                return self.rdict
+            if not from_memory:
+                # may be a hard link to a cache entry, never write through it
+                self.rdict["bk_outfile"].unlink(missing_ok=True)
         # this gets epub version without unzipping
-        epub_ver = self.get_epub_version(self.epub_file)
+        epub_ver = self.package.version
         self.wrlog(True, f"Original file is epub version {epub_ver}")
         if epub_ver[0] != "3":
-            if Path(self.ebookconvert).is_file():
+            if self.ebookconvert == "native" or Path(self.ebookconvert).is_file():
                 self.convert_epub()
                 if self.rdict["pager_error"]:
                     return self.rdict
                 # we have an epub 3
-                self.plist = pg_xmlns
             else:
                 lstr = (
                     "    --> WARNING <-- Epub version is not 3 or newer,"
@@ -2325,24 +5185,26 @@ class epub_paginator:
                 self.genplist = False
                 self.match = False
                 self.rdict["has_plist"] = False
-        else:
-            self.plist = pg_xmlns
         # at this point, we should have a converted file, or an epub2 because no conversion.
-        self.ePubUnZip(self.epub_file, self.rdict["unzip_path"])
-        self.rdict[
-            "epub_version"
-        ] = self.simple_epub_version()  # this epub_version uses disk files
-        if self.rdict["pager_error"]:
-            return self.rdict
+        if self.in_memory:
+            self.open_zip(self.epub_file)
+        else:
+            self.ePubUnZip(self.epub_file, self.rdict["unzip_path"])
+        self.rdict["epub_version"] = self.package.version
         self.initialize()
         if self.rdict["pager_error"]:
             self.wrlog(False, "Fatal error from initialize().")
+            self.close_zip()
             return self.rdict
-        # run epubcheck on the file to be paged if requested
+        # run epubcheck on the file to be paged, while it is paginated
         if self.chk_orig:
-            self.run_chk(True)
+            self.start_chk_orig()
         # figure out where everything is and the order they are in.
         self.scan_spine(self.rdict["unzip_path"])
+        # the worker processes read the sections from disk
+        self.extract_members(
+            self.section_path(chapter) for chapter in self.rdict["spine_lst"]
+        )
         # if we have a plist and aren't generating pagelines or superscripts, there is nothing to do.
         if self.rdict['has_plist'] and not self.pageline and not self.superscript:
             estr = "This book has an existing pagelist and neither pagelines nor superscripts were requested."
@@ -2350,15 +5212,24 @@ class epub_paginator:
             self.wrlog(True, f"There is nothing to do.")
             self.rdict["warn_lst"].append(estr)
             self.rdict["pager_warn"] = True
+            self.close_zip()
+            self.join_chk_orig()
             return(self.rdict)
         if self.rdict["pager_error"]:
             self.wrlog(False, "Fatal error.")
+            self.close_zip()
+            self.join_chk_orig()
             return self.rdict
         # scan the book to count words, section pages and total pages based on
         # words/page
-        self.count_words()
         self.wrlog(False, f"Begin section scan.")
-        self.scan_sections()
+        self.scan_book()
+        if self.rdict["pager_error"]:
+            self.close_zip()
+            self.join_chk_orig()
+            return self.rdict
+        if not self.rdict["match"]:
+            self.set_pages(self.plan_pages(self.rdict["pgwords"]))
         # report what we are doing
         if self.rdict["has_plist"] and self.rdict["match"]:
             self.wrlog(False, f"Matching existing pagination.")
@@ -2374,6 +5245,8 @@ class epub_paginator:
                 self.wrlog(False, f"pages: {self.pages}")
                 self.wrlog(False, f"cannot determine how to paginate.")
                 self.rdict["pager_error"] = True
+                self.close_zip()
+                self.join_chk_orig()
                 return self.rdict
             elif self.pgwords:
                 self.wrlog(
@@ -2384,7 +5257,6 @@ class epub_paginator:
                     ),
                 )
             else:
-                self.pgwords = int(self.rdict["words"] / self.pages)
                 self.wrlog(
                     True,
                     (
@@ -2417,38 +5289,33 @@ class epub_paginator:
         # this is the working loop. Scan each file, locate pages and insert
         # page-links and/or pagelines or superscripts
         if self.genplist or self.pageline or self.superscript:
-            self.curpg = 1
             self.wrlog(False, "Begin pagination, scanning spine.")
-            for chapter in self.rdict["spine_lst"]:
-                if self.DEBUG:
-                    lstr = f"file: {chapter['disk_file']}"
-                    self.wrlog(False, lstr)
-                # this stupid fix is required by Hunter's Moon which puts '&amp;' in file names.
-                pstr = f"{chapter['disk_file']}"
-                pstr = pstr.replace(r"amp;", "")
-                erfile = Path(pstr)
-                ebook_data = erfile.read_text(encoding="utf-8")
-                # with erfile.open("r") as ebook_rfile:
-                #     ebook_data = ebook_rfile.read()
-                # ewfile = Path(f"{chapter['disk_file']}")
-                ewfile = Path(pstr)
-                # with ewfile.open("w") as ebook_wfile:
-                start_total = self.tot_wcnt
-                lstr = f"Scanning {chapter['disk_file']}"
-                self.wrlog(False, lstr)
-                if self.rdict["match"]:
-                    if self.DEBUG:
-                        lstr = f"file: " f"{chapter['disk_file']}"
-                        self.wrlog(False, lstr)
-                    new_ebook = self.scan_match_file(ebook_data, chapter)
-                else:
-                    new_ebook = self.scan_file(ebook_data, chapter)
-                xebook_data = self.chk_xmlns(new_ebook)
+            if self.in_memory:
+                self.start_zip(self.rdict["bk_outfile"])
                 if self.rdict["pager_error"]:
+                    self.close_zip()
+                    self.join_chk_orig()
                     return self.rdict
-                # ebook_wfile.write(xebook_data)
-                ewfile.write_text(xebook_data, "utf-8")
+            if self.pipelined():
+                self.paginate_pipeline()
+            elif self.use_pool() and len(self.rdict["spine_lst"]) > 1:
+                # the workers read the sections again, only the tokens are sent
+                for chapter in self.rdict["spine_lst"]:
+                    chapter.pop("ebook_data", None)
+                args_lst = [(chapter,) for chapter in self.rdict["spine_lst"]]
+                for result in self.pool_map("paginate_section", args_lst):
+                    self.pool_merge(result)
+                    if self.rdict["pager_error"]:
+                        break
+            else:
+                for chapter in self.rdict["spine_lst"]:
+                    self.paginate_section(chapter)
+                    if self.rdict["pager_error"]:
+                        break
             if self.rdict["pager_error"]:
+                self.drop_section_data()
+                self.close_zip(True)
+                self.join_chk_orig()
                 return self.rdict
             if self.rdict["match"]:
                 w_per_page = self.rdict["words"] / self.rdict["pages"]
@@ -2468,8 +5335,12 @@ class epub_paginator:
                 )
             # modify the nav_file to add the pagelist
             if self.genplist:
-                self.plist += "  </ol></nav>" + CR
                 self.update_navfile()
+                if self.rdict["pager_error"]:
+                    self.drop_section_data()
+                    self.close_zip(True)
+                    self.join_chk_orig()
+                    return self.rdict
             self.update_opffile()
 
             # build the epub file
@@ -2477,26 +5348,26 @@ class epub_paginator:
             #     True,
             #     f"ready to zip: {self.rdict['bk_outfile']}, with {self.rdict['unzip_path']}",
             # )
-            self.ePubZip(
-                self.rdict["bk_outfile"],
-                self.rdict["unzip_path"],
-                self.bk_flist,
-            )
+            if self.in_memory:
+                self.finish_zip()
+            else:
+                self.ePubZip(
+                    self.rdict["bk_outfile"],
+                    self.rdict["unzip_path"],
+                    self.bk_flist,
+                )
             t2pagination = time.perf_counter()
+            self.join_chk_orig()
             if self.chk_paged:
                 self.run_chk(False)
+            if self.chk_native:
+                self.run_chk_native()
             self.wrlog(True, f"The paged epub is at: {self.rdict['bk_outfile']}" + CR)
+            # epubcheck of the original ran during the pagination
             self.rdict["paginate_time"] = (
-                (t2pagination - t1pagination)
-                - self.rdict["epubchkorig_time"]
-                - self.rdict["convert_time"]
-            )
-            ttime = (
-                self.rdict["paginate_time"]
-                + self.rdict["epubchkorig_time"]
-                + self.rdict["convert_time"]
-                + self.rdict["epubchkpage_time"]
+                t2pagination - t1pagination - self.rdict["convert_time"]
             )
+            ttime = time.perf_counter() - t1pagination
             self.wrlog(True, f"Total processing time was {ttime:.2f} seconds")
             if self.rdict["converted"]:
                 self.wrlog(
@@ -2517,10 +5388,19 @@ class epub_paginator:
                 True,
                 f"    Pagination took {self.rdict['paginate_time']:.2f} seconds.",
             )  # end of pagination, only done if requested.
+            if self.cache_dir and not self.rdict["pager_error"]:
+                self.cache_store(cache_key)
         else:
+            self.drop_section_data()
+            self.close_zip()
+            self.join_chk_orig()
             self.wrlog(True, f"No pagination was selected.")
         # and if DEBUG is not set, we remove the unzipped epub directory
-        if not self.DEBUG:
+        if self.in_memory:
+            # nothing was extracted, only a converted copy is removed
+            if self.rdict["converted"] and not self.DEBUG:
+                Path(self.epub_file).unlink(missing_ok=True)
+        elif not self.DEBUG:
             shutil.rmtree(self.rdict["unzip_path"], ignore_errors=True)
             try:
                 Path(self.epub_file).unlink(False)
@@ -2535,3 +5415,73 @@ class epub_paginator:
         #         self.wrlog(False, f"{key}: {self.rdict[key]}")
 
         return self.rdict
+
+
+pool_paginator = None  # the epub_paginator of a worker process
+
+
+def pool_init(settings, plan):
+    """
+    Initialize a worker process of epub_paginator.pool_map with the
+    configuration and render_plan of the calling epub_paginator.
+    """
+
+    global pool_paginator
+    pool_paginator = epub_paginator()
+    for key, val in settings.items():
+        setattr(pool_paginator, key, val)
+    pool_paginator.plan = plan
+    # workers do not start pools of their own
+    pool_paginator.workers = 0
+
+
+def pool_run_part(tasks):
+    """
+    Run a list of epub_paginator.pool_map tasks with pool_run, returning
+    the list of their results.
+    """
+
+    return [pool_run(task) for task in tasks]
+
+
+def pool_run(task):
+    """
+    Run one epub_paginator.pool_map task in a worker process.
+
+    Returns a dictionary with the method result, its arguments (so changes
+    to a spine_lst entry are returned), and the log messages, plist
+    entries, errors and warnings produced.
+    """
+
+    method, args, rdict = task
+    pager = pool_paginator
+    pager.rdict = dict(rdict)
+    pager.rdict["error_lst"] = []
+    pager.rdict["warn_lst"] = []
+    pager.rdict["pager_error"] = False
+    pager.rdict["pager_warn"] = False
+    pager.rdict["messages"] = ""
+    pager.log_lines = []
+    pager.plist = page_targets()
+    if rdict["zip_src"]:
+        # with in_memory the members changed are sent back
+        pager.open_zip(rdict["zip_src"])
+        pager.zip_members = {}
+    result = getattr(pager, method)(*args)
+    # the section data is not sent back
+    for arg in args:
+        if isinstance(arg, dict):
+            arg.pop("ebook_data", None)
+            arg.pop("tokens", None)
+    return {
+        "result": result,
+        "args": [arg if isinstance(arg, dict) else None for arg in args],
+        "log": pager.log_lines,
+        "plist": pager.plist,
+        "error_lst": pager.rdict["error_lst"],
+        "warn_lst": pager.rdict["warn_lst"],
+        "pager_error": pager.rdict["pager_error"],
+        "pager_warn": pager.rdict["pager_warn"],
+        "members": pager.zip_members if rdict["zip_src"] else {},
+    }
+
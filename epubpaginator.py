@@ -1,5 +1,6 @@
 #!/opt/homebrew/bin/python3
 
+import sys
 import json
 import argparse
 from pathlib import Path
@@ -40,7 +41,11 @@ from epubpager import epub_paginator
 def main():
     Version = "1.0"
     parser = argparse.ArgumentParser(description="Paginate ePub file.")
-    parser.add_argument("ePub_file", help="The ePub file to be paginated.")
+    parser.add_argument(
+        "ePub_file",
+        nargs="?",
+        help="The ePub file to be paginated, '-' for stdin to stdout.",
+    )
     parser.add_argument("-c", "--cfg", default="", help="configuration file")
     parser.add_argument("--outdir", help="location for output ePub files", default="./")
     parser.add_argument(
@@ -157,9 +162,97 @@ def main():
     )
     parser.add_argument(
         "--ebookconvert",
-        help="location of ebook conversion executable",
+        help='location of ebook conversion executable, or "native"',
         default="none",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="number of processes used to paginate the section files",
+        default=0,
+    )
+    parser.add_argument(
+        "--shard_size",
+        type=int,
+        help="with workers, split section files larger than this many bytes into shards",
+        default=1000000,
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["text", "bytes", "stream"],
+        help="'text' decodes the section files, 'bytes' paginates them "
+        "undecoded, 'stream' paginates them in chunks",
+        default="text",
+    )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        help="characters read at a time by the stream engine",
+        default=65536,
+    )
+    parser.add_argument(
+        "--in_memory",
+        help="read the epub and write the paged epub without extracting it",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--compress_level",
+        choices=["fast", "default", "max"],
+        help="compression of the members changed by pagination",
+        default="default",
+    )
+    parser.add_argument(
+        "--workdir",
+        help="location for temporary files, default is outdir",
+        default="",
+    )
+    parser.add_argument(
+        "--queue_depth",
+        type=int,
+        help="sections read ahead and written behind by threads, 0 for none",
+        default=2,
+    )
+    parser.add_argument(
+        "--cache_dir",
+        help="directory of a cache of paged epubs, default is no cache",
+        default="",
+    )
+    parser.add_argument(
+        "--cache_size",
+        type=int,
+        help="size of the cache in megabytes, paged epubs and epubcheck results together",
+        default=1000,
+    )
+    parser.add_argument(
+        "--cache_age",
+        type=int,
+        help="days a cached epub is kept unused",
+        default=30,
+    )
+    parser.add_argument(
+        "--chk_service",
+        help="location of epubcheck.jar, run by a persistent java process",
+        default="",
+    )
+    parser.add_argument(
+        "--chk_cache",
+        help="keep epubcheck results in the cache_dir cache",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--chk_native",
+        help="check the paged epub's changed files and page-list without epubcheck",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--cache_stats",
+        help="print the statistics of the cache and exit",
+        action="store_true",
+        default=False,
+    )
     parser.add_argument(
         "--quiet",
         help="Do not echo output to stdout",
@@ -173,6 +266,8 @@ def main():
         default=False,
     )
     args = parser.parse_args()
+    if args.ePub_file is None and not args.cache_stats:
+        parser.error("the ePub_file is required")
 
     def get_config(args):
         default_cfg = {
@@ -197,6 +292,20 @@ def main():
             "epubcheck": "/Users/tbrown/bin/epubcheck.sh",
             "chk_orig": False,
             "chk_paged": True,
+            "workers": 0,
+            "shard_size": 1000000,
+            "engine": "text",
+            "chunk_size": 65536,
+            "in_memory": False,
+            "compress_level": "default",
+            "workdir": "",
+            "queue_depth": 2,
+            "cache_dir": "",
+            "cache_size": 1000,
+            "cache_age": 30,
+            "chk_service": "",
+            "chk_cache": False,
+            "chk_native": False,
             "quiet": False,
             "DEBUG": False
         }
@@ -236,6 +345,21 @@ def main():
             config["epubcheck"] = args.epubcheck
             config["chk_orig"] = args.chk_orig
             config["chk_paged"] = args.chk_paged
+            config["workers"] = args.workers
+            config["shard_size"] = args.shard_size
+            config["engine"] = args.engine
+            config["chunk_size"] = args.chunk_size
+            config["in_memory"] = args.in_memory
+            config["compress_level"] = args.compress_level
+            config["workdir"] = args.workdir
+            config["queue_depth"] = args.queue_depth
+            config["cache_dir"] = args.cache_dir
+            config["cache_size"] = args.cache_size
+            config["cache_age"] = args.cache_age
+            config["chk_service"] = args.chk_service
+            config["chk_cache"] = args.chk_cache
+            config["chk_native"] = args.chk_native
+            config["quiet"] = args.quiet
             config["DEBUG"] = args.DEBUG
             return dict(config)
 
@@ -263,9 +387,39 @@ def main():
     paginator.epubcheck = config["epubcheck"]
     paginator.chk_orig = config["chk_orig"]
     paginator.chk_paged = config["chk_paged"]
+    paginator.workers = config.get("workers", 0)
+    paginator.shard_size = config.get("shard_size", 1000000)
+    paginator.engine = config.get("engine", "text")
+    paginator.chunk_size = config.get("chunk_size", 65536)
+    paginator.in_memory = config.get("in_memory", False)
+    paginator.compress_level = config.get("compress_level", "default")
+    paginator.workdir = config.get("workdir", "")
+    paginator.queue_depth = config.get("queue_depth", 2)
+    paginator.cache_dir = config.get("cache_dir", "")
+    paginator.cache_size = config.get("cache_size", 1000)
+    paginator.cache_age = config.get("cache_age", 30)
+    paginator.chk_service = config.get("chk_service", "")
+    paginator.chk_cache = config.get("chk_cache", False)
+    paginator.chk_native = config.get("chk_native", False)
     paginator.quiet = config["quiet"]
     paginator.DEBUG = config["DEBUG"]
 
+    if args.cache_stats:
+        if not paginator.cache_dir:
+            print("No cache_dir is configured.")
+            return
+        for name, subdir in (("Cache", ""), ("epubcheck cache", "epubcheck")):
+            print(f"{name} {Path(paginator.cache_dir, subdir)}")
+            for key, val in paginator.cache(subdir).stats().items():
+                if isinstance(val, float):
+                    val = f"{val:.1f}"
+                print(f"  {key}: {val}")
+        return
+
+    if args.ePub_file == "-":
+        # the paged epub is written to stdout, so messages go to stderr
+        paged_out = sys.stdout.buffer
+        sys.stdout = sys.stderr
     lpad = 10
     rpad = 50
     print()
@@ -275,7 +429,14 @@ def main():
     print(f"Paginating {args.ePub_file}")
 
     return_dict = {}
-    return_dict = paginator.paginate_epub(args.ePub_file)
+    if args.ePub_file == "-":
+        paged, return_dict = paginator.paginate_bytes(sys.stdin.buffer.read())
+        if paged is not None:
+            paged_out.write(paged)
+            paged_out.flush()
+            return_dict["bk_outfile"] = "stdout"
+    else:
+        return_dict = paginator.paginate_epub(args.ePub_file)
 
     # for key in return_dict.keys():
     #     if key == 'spine_lst':
@@ -1,8 +1,11 @@
 import json
+import sys
+import tempfile
 
 # import datetime
 # from subprocess import PIPE, run
 import time
+import zipfile
 from pathlib import Path
 import argparse
 from typing import Dict
@@ -75,202 +78,303 @@ def set_params(paginator):
     paginator.epubcheck= config["epubcheck"]
     paginator.chk_orig = config["chk_orig"]
     paginator.chk_paged= config["chk_paged"]
+    paginator.workers = config.get("workers", 0)
+    paginator.shard_size = config.get("shard_size", 1000000)
+    paginator.engine = config.get("engine", "text")
+    paginator.chunk_size = config.get("chunk_size", 65536)
+    paginator.in_memory = config.get("in_memory", False)
+    paginator.compress_level = config.get("compress_level", "default")
+    paginator.workdir = config.get("workdir", "")
+    paginator.queue_depth = config.get("queue_depth", 2)
+    paginator.cache_dir = config.get("cache_dir", "")
+    paginator.cache_size = config.get("cache_size", 1000)
+    paginator.cache_age = config.get("cache_age", 30)
+    paginator.chk_service = config.get("chk_service", "")
+    paginator.chk_cache = config.get("chk_cache", False)
+    paginator.chk_native = config.get("chk_native", False)
     paginator.DEBUG = config["DEBUG"]
 
 
+def check_shards(rf, shard_size=4096, settings=None):
+    """
+    Paginate rf sequentially (workers=0), then with workers=2 and its
+    section files sharded at shard_size bytes, configured from the
+    configuration file or, if given, from the epub_paginator attributes in
+    settings. Returns the names of the members that differ, [] if the pages
+    are placed the same.
+    """
+    paged = []
+    for workers in (0, 2):
+        paginator = epub_paginator()
+        if settings is None:
+            set_params(paginator)
+        else:
+            for key, val in settings.items():
+                setattr(paginator, key, val)
+        paginator.workers = workers
+        paginator.shard_size = shard_size
+        paginator.cache_dir = ""
+        paginator.chk_orig = False
+        paginator.chk_paged = False
+        rdict = paginator.paginate_epub(rf)
+        if rdict["pager_error"]:
+            return ["pager_error"]
+        with zipfile.ZipFile(rdict["bk_outfile"]) as zfile:
+            paged.append({name: zfile.read(name) for name in zfile.namelist()})
+    names = set(paged[0]) | set(paged[1])
+    return sorted(name for name in names if paged[0].get(name) != paged[1].get(name))
+
+
+def check_sample_shards():
+    """
+    Check sharded pagination of the included FarmBoy.epub at a shard_size
+    of 2048 bytes, with the text and bytes engines. Needs neither the book
+    list nor the configuration file. Returns the number of engines where
+    the pages are placed differently.
+    """
+    sample = str(Path(__file__).with_name("FarmBoy.epub"))
+    errcnt = 0
+    with tempfile.TemporaryDirectory() as outdir:
+        for engine in ("text", "bytes"):
+            settings = {
+                "outdir": outdir,
+                "engine": engine,
+                "genplist": True,
+                "pageline": True,
+                "superscript": True,
+            }
+            differ = check_shards(sample, 2048, settings)
+            if differ:
+                errcnt += 1
+                print(f"--> Sharded pagination with engine {engine} differs in {differ[:3]}")
+            else:
+                print(f"Sharded pagination with engine {engine} matches.")
+    return errcnt
+
+
 def p_result(llen, lpad, s):
     rpad = llen - lpad
     print(f"{'-' * lpad}{s}{'-' * (rpad - len(s))}")
 
 
-# setup and parse command line arguments
-parser = argparse.ArgumentParser(
-    description=(f"Paginate Calibre ePub " f"files.")
-)
-parser.add_argument("--cfg", default="epubpager.cfg", help="path to configuration file")
-parser.add_argument(
-    "-c", "--count", type=int, default=5, help="count of books to paginate"
-)
-parser.add_argument(
-    "-s", "--start", type=int, default=0, help="first book to paginate"
-)
-parser.add_argument(
-    "-q",
-    "--quiet",
-    help="Only print when errors occurred.",
-    action=argparse.BooleanOptionalAction,
-    default=False,
-)
-args = parser.parse_args()
+if __name__ == "__main__":
+    # setup and parse command line arguments
+    parser = argparse.ArgumentParser(
+        description=(f"Paginate Calibre ePub " f"files.")
+    )
+    parser.add_argument("--cfg", default="epubpager.cfg", help="path to configuration file")
+    parser.add_argument(
+        "-c", "--count", type=int, default=5, help="count of books to paginate"
+    )
+    parser.add_argument(
+        "-s", "--start", type=int, default=0, help="first book to paginate"
+    )
+    parser.add_argument(
+        "-q",
+        "--quiet",
+        help="Only print when errors occurred.",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+    )
+    parser.add_argument(
+        "--shards",
+        help="Check that sharded pagination matches sequential pagination.",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+    )
+    parser.add_argument(
+        "--sample_shards",
+        help=(
+            "Only check that sharded pagination of the included FarmBoy.epub "
+            "matches sequential pagination."
+        ),
+        action=argparse.BooleanOptionalAction,
+        default=False,
+    )
+    args = parser.parse_args()
+    if args.sample_shards:
+        sys.exit(check_sample_shards())
 
-BookArray = load_book_data()
-booklist = build_booklist(BookArray)
+    BookArray = load_book_data()
+    booklist = build_booklist(BookArray)
 
-config: Dict = {}
-config = get_config(Path(args.cfg))
+    config: Dict = {}
+    config = get_config(Path(args.cfg))
 
-# an error database for books converted
-edb = {
-    "title": "",
-    "pager_fatal": 0,
-    "pager_error": 0,
-    "pager_warn": 0,
-    "orig_fatal": 0,
-    "orig_error": 0,
-    "echk_fatal": 0,
-    "echk_error": 0,
-}
-# and a list of results
-edb_list = []
-epub_count = 0
-cvrt = 0
-pager_fatal_errcnt = 0
-pager_error_errcnt = 0
-pager_warn_errcnt = 0
-orig_fatal_errcnt = 0
-orig_error_errcnt = 0
-echk_fatal_errcnt = 0
-echk_error_errcnt = 0
-start = args.start
-max_count = args.start + args.count
-if not args.quiet:
-    print((f"ready to paginate books from " f"{args.start} to {max_count}"))
+    # an error database for books converted
+    edb = {
+        "title": "",
+        "pager_fatal": 0,
+        "pager_error": 0,
+        "pager_warn": 0,
+        "orig_fatal": 0,
+        "orig_error": 0,
+        "echk_fatal": 0,
+        "echk_error": 0,
+    }
+    # and a list of results
+    edb_list = []
+    epub_count = 0
+    cvrt = 0
+    pager_fatal_errcnt = 0
+    pager_error_errcnt = 0
+    pager_warn_errcnt = 0
+    shard_errcnt = 0
+    orig_fatal_errcnt = 0
+    orig_error_errcnt = 0
+    echk_fatal_errcnt = 0
+    echk_error_errcnt = 0
+    start = args.start
+    max_count = args.start + args.count
+    if not args.quiet:
+        print((f"ready to paginate books from " f"{args.start} to {max_count}"))
 
-for book in BookArray:
-    if epub_count < start:
-        epub_count += 1
-        continue
-    if epub_count == max_count:
-        break
-    b_edb = {}
-    b_edb["title"] = book["Title"]
-    b_edb["pager_fatal"] = 0
-    b_edb["pager_error"] = 0
-    b_edb["pager_warn"] = 0
-    b_edb["orig_fatal"] = 0
-    b_edb["orig_error"] = 0
-    b_edb["echk_fatal"] = 0
-    b_edb["echk_error"] = 0
-    if len(book["formats"]):
-        for f in book["formats"]:
-            if Path(f).suffix == ".epub" and "Calibre" in f:
-                rf = f"{calibre_path}/{f}"
-                print(f"Paginating {book['Title']:.72} at {rf}")
-                paginator = epub_paginator()
-                set_params(paginator)
-                rdict = paginator.paginate_epub(rf)
-                # report the results
-                b_edb["pager_error"] = rdict["pager_error"]
-                b_edb["pager_warn"] = rdict["pager_warn"]
-                b_edb["echk_fatal"] = rdict["echk_fatal"]
-                b_edb["echk_error"] = rdict["echk_error"]
-                b_edb["orig_fatal"] = rdict["orig_fatal"]
-                b_edb["orig_error"] = rdict["orig_error"]
-                b_edb["converted"] = rdict["converted"]
-                b_edb["version"] = rdict["epub_version"]
-                one_fatal = False
-                one_error = False
-                one_warn = False
-                print(f"epub version {b_edb['version']}")
-                if b_edb["converted"]:
-                    cvrt += 1
-                    print(f"This book was converted to epub3")
-                if b_edb["pager_fatal"]:
-                    one_fatal = True
-                    pager_fatal_errcnt += 1
-                    print(
-                        f"--> Pager Fatal errors occurred in book {rf:.50}; book"
-                        f" number:{epub_count}:"
-                    )
-                if b_edb["pager_error"]:
-                    one_error = True
-                    pager_error_errcnt += 1
-                    print(
-                        f"--> Pager Errors occurred in book {rf:.50}; book"
-                        f" number:{epub_count}:"
-                    )
-                if b_edb["pager_warn"]:
-                    one_warn = True
-                    pager_warn_errcnt += 1
-                    print(
-                        f"--> Pager Warnings occurred in book {rf:.50}; book"
-                        f" number:{epub_count}:"
-                    )
-                if b_edb["echk_fatal"]:
-                    one_fatal = True
-                    echk_fatal_errcnt += 1
-                    print(
-                        f"--> echk Fatal errors occurred in book {rf:.50}; book"
-                        f" number:{epub_count}:"
-                    )
-                if b_edb["echk_error"]:
-                    one_error = True
-                    echk_error_errcnt += 1
-                    print(
-                        f"--> echk Errors occurred in book {rf:.50}; book"
-                        f" number:{epub_count}:"
-                    )
-                if b_edb["orig_fatal"]:
-                    one_fatal = True
-                    orig_fatal_errcnt += 1
-                    print(
-                        f"--> orig Fatal errors occurred in book {rf:.50}; book"
-                        f" number:{epub_count}:"
-                    )
-                if b_edb["orig_error"]:
-                    one_error = True
-                    orig_error_errcnt += 1
-                    print(
-                        f"--> orig Errors occurred in book {rf:.50}; book"
-                        f" number:{epub_count}:"
-                    )
-                if one_fatal or one_error or one_warn:
-                    print("Errors or warnings detected.")
-                else:
-                    print("No errors or warnings detected.")
-                epub_count += 1
-                edb_list.append(b_edb)
-print()
-print(f"Completed {args.count} paginations: ")
-print("--------------------")
-print(f"{cvrt} of {args.count} books were converted from epub2.")
-print("--------------------")
-print(f"---> {pager_fatal_errcnt} books had fatal errors in epub_pager.")
-print(f"---> {pager_error_errcnt} books had errors in epub_pager.")
-print(f"---> {pager_warn_errcnt} books had warnings in epub_pager.")
-print("--------------------")
-print(
-    f"---> {orig_fatal_errcnt} original books had fatal errors in epubcheck."
-)
-print(f"---> {orig_error_errcnt} original books had errors in epubcheck.")
-print("--------------------")
-print(f"---> {echk_fatal_errcnt} paged books had fatal errors in epubcheck.")
-print(f"---> {echk_error_errcnt} paged books had errors in epubcheck.")
-print("--------------------")
-print()
+    for book in BookArray:
+        if epub_count < start:
+            epub_count += 1
+            continue
+        if epub_count == max_count:
+            break
+        b_edb = {}
+        b_edb["title"] = book["Title"]
+        b_edb["pager_fatal"] = 0
+        b_edb["pager_error"] = 0
+        b_edb["pager_warn"] = 0
+        b_edb["orig_fatal"] = 0
+        b_edb["orig_error"] = 0
+        b_edb["echk_fatal"] = 0
+        b_edb["echk_error"] = 0
+        if len(book["formats"]):
+            for f in book["formats"]:
+                if Path(f).suffix == ".epub" and "Calibre" in f:
+                    rf = f"{calibre_path}/{f}"
+                    print(f"Paginating {book['Title']:.72} at {rf}")
+                    paginator = epub_paginator()
+                    set_params(paginator)
+                    rdict = paginator.paginate_epub(rf)
+                    # report the results
+                    b_edb["pager_error"] = rdict["pager_error"]
+                    b_edb["pager_warn"] = rdict["pager_warn"]
+                    b_edb["echk_fatal"] = rdict["echk_fatal"]
+                    b_edb["echk_error"] = rdict["echk_error"]
+                    b_edb["orig_fatal"] = rdict["orig_fatal"]
+                    b_edb["orig_error"] = rdict["orig_error"]
+                    b_edb["converted"] = rdict["converted"]
+                    b_edb["version"] = rdict["epub_version"]
+                    one_fatal = False
+                    one_error = False
+                    one_warn = False
+                    print(f"epub version {b_edb['version']}")
+                    if b_edb["converted"]:
+                        cvrt += 1
+                        print(f"This book was converted to epub3")
+                    if b_edb["pager_fatal"]:
+                        one_fatal = True
+                        pager_fatal_errcnt += 1
+                        print(
+                            f"--> Pager Fatal errors occurred in book {rf:.50}; book"
+                            f" number:{epub_count}:"
+                        )
+                    if b_edb["pager_error"]:
+                        one_error = True
+                        pager_error_errcnt += 1
+                        print(
+                            f"--> Pager Errors occurred in book {rf:.50}; book"
+                            f" number:{epub_count}:"
+                        )
+                    if b_edb["pager_warn"]:
+                        one_warn = True
+                        pager_warn_errcnt += 1
+                        print(
+                            f"--> Pager Warnings occurred in book {rf:.50}; book"
+                            f" number:{epub_count}:"
+                        )
+                    if b_edb["echk_fatal"]:
+                        one_fatal = True
+                        echk_fatal_errcnt += 1
+                        print(
+                            f"--> echk Fatal errors occurred in book {rf:.50}; book"
+                            f" number:{epub_count}:"
+                        )
+                    if b_edb["echk_error"]:
+                        one_error = True
+                        echk_error_errcnt += 1
+                        print(
+                            f"--> echk Errors occurred in book {rf:.50}; book"
+                            f" number:{epub_count}:"
+                        )
+                    if b_edb["orig_fatal"]:
+                        one_fatal = True
+                        orig_fatal_errcnt += 1
+                        print(
+                            f"--> orig Fatal errors occurred in book {rf:.50}; book"
+                            f" number:{epub_count}:"
+                        )
+                    if b_edb["orig_error"]:
+                        one_error = True
+                        orig_error_errcnt += 1
+                        print(
+                            f"--> orig Errors occurred in book {rf:.50}; book"
+                            f" number:{epub_count}:"
+                        )
+                    if args.shards:
+                        differ = check_shards(rf)
+                        if differ:
+                            one_error = True
+                            shard_errcnt += 1
+                            print(
+                                f"--> Sharded pagination differs in {differ[:3]}"
+                                f" of book {rf:.50}; book number:{epub_count}:"
+                            )
+                    if one_fatal or one_error or one_warn:
+                        print("Errors or warnings detected.")
+                    else:
+                        print("No errors or warnings detected.")
+                    epub_count += 1
+                    edb_list.append(b_edb)
+    print()
+    print(f"Completed {args.count} paginations: ")
+    print("--------------------")
+    print(f"{cvrt} of {args.count} books were converted from epub2.")
+    print("--------------------")
+    print(f"---> {pager_fatal_errcnt} books had fatal errors in epub_pager.")
+    print(f"---> {pager_error_errcnt} books had errors in epub_pager.")
+    print(f"---> {pager_warn_errcnt} books had warnings in epub_pager.")
+    if args.shards:
+        print(f"---> {shard_errcnt} books paged differently when sharded.")
+    print("--------------------")
+    print(
+        f"---> {orig_fatal_errcnt} original books had fatal errors in epubcheck."
+    )
+    print(f"---> {orig_error_errcnt} original books had errors in epubcheck.")
+    print("--------------------")
+    print(f"---> {echk_fatal_errcnt} paged books had fatal errors in epubcheck.")
+    print(f"---> {echk_error_errcnt} paged books had errors in epubcheck.")
+    print("--------------------")
+    print()
 
-# compare epubcheck errors for before and after paging.
-if config['chk_orig'] and config['chk_paged']:
-    linelen = 60
-    p_result(linelen, 3, "epubcheck Difference Comparison")
-    for book in edb_list:
-        if book["echk_fatal"] != book["orig_fatal"]:
-            p_result(linelen, 3, book["title"])
-            p_result(linelen, 10, "Fatal Errors")
-            print(
-                f"  --> {book['echk_fatal']:3} fatal error(s) in paged book epubcheck."
-            )
-            print(
-                f"  --> {book['orig_fatal']:3} fatal error(s) in original book epubcheck."
-            )
-            p_result(linelen, 0, "")
-        if book["echk_error"] != book["orig_error"]:
-            p_result(linelen, 3, book["title"])
-            p_result(linelen, 10, "Errors")
-            print(
-                f"  --> {book['echk_error']:3} error(s) in paged book epubcheck."
-            )
-            print(
-                f"  --> {book['orig_error']:3} error(s) in original book epubcheck."
-            )
-            p_result(linelen, 0, "")
+    # compare epubcheck errors for before and after paging.
+    if config['chk_orig'] and config['chk_paged']:
+        linelen = 60
+        p_result(linelen, 3, "epubcheck Difference Comparison")
+        for book in edb_list:
+            if book["echk_fatal"] != book["orig_fatal"]:
+                p_result(linelen, 3, book["title"])
+                p_result(linelen, 10, "Fatal Errors")
+                print(
+                    f"  --> {book['echk_fatal']:3} fatal error(s) in paged book epubcheck."
+                )
+                print(
+                    f"  --> {book['orig_fatal']:3} fatal error(s) in original book epubcheck."
+                )
+                p_result(linelen, 0, "")
+            if book["echk_error"] != book["orig_error"]:
+                p_result(linelen, 3, book["title"])
+                p_result(linelen, 10, "Errors")
+                print(
+                    f"  --> {book['echk_error']:3} error(s) in paged book epubcheck."
+                )
+                print(
+                    f"  --> {book['orig_error']:3} error(s) in original book epubcheck."
+                )
+                p_result(linelen, 0, "")